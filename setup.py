@@ -27,6 +27,10 @@ setup(
     provides=['wbpy'],
     package_data={"wbpy": ["non_ISO_region_codes.json"]},
     install_requires=["pycountry"],
+    extras_require={
+        "pandas": ["pandas"],
+        "arrow": ["pyarrow"],
+        },
     tests_require=["tox"],
     classifiers=[
         'Development Status :: 4 - Beta',
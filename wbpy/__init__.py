@@ -1,5 +1,4 @@
-from indicators import IndicatorAPI, IndicatorDataset
-from climate import ClimateAPI, InstrumentalDataset, ModelledDataset
+import sys
 
 __name__ = "wbpy"
 __version__ = "2.0.1"
@@ -8,9 +7,57 @@ __maintainer__ = "Matthew Duck"
 __license__ = "MIT"
 
 __all__ = [
-    IndicatorAPI,
-    IndicatorDataset,
-    ClimateAPI,
-    InstrumentalDataset,
-    ModelledDataset,
+    "IndicatorAPI",
+    "IndicatorDataset",
+    "ClimateAPI",
+    "InstrumentalDataset",
+    "ModelledDataset",
     ]
+
+# The module that defines each public class. The modules are only imported
+# when a class is first used, which makes ``import wbpy`` faster.
+_CLASS_MODULES = {
+    "IndicatorAPI": "indicators",
+    "IndicatorDataset": "indicators",
+    "ClimateAPI": "climate",
+    "InstrumentalDataset": "climate",
+    "ModelledDataset": "climate",
+    }
+
+
+def _import_class(name):
+    if name not in _CLASS_MODULES:
+        raise AttributeError("module 'wbpy' has no attribute %r" % name)
+    module = __import__("wbpy." + _CLASS_MODULES[name], fromlist=[name])
+    return getattr(module, name)
+
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        value = _import_class(name)
+        globals()[name] = value
+        return value
+
+    def __dir__():
+        return sorted(list(globals()) + __all__)
+else:
+    # Older versions don't call a module's __getattr__, so the package is
+    # replaced with an instance of a module class that has one.
+    import types
+
+    class _LazyModule(types.ModuleType):
+
+        def __getattr__(self, name):
+            value = _import_class(name)
+            setattr(self, name, value)
+            return value
+
+        def __dir__(self):
+            return sorted(list(self.__dict__) + __all__)
+
+    _module = _LazyModule(__name__, __doc__)
+    _module.__dict__.update(globals())
+    # Python 2 clears a module's globals when it's garbage collected, and
+    # the functions above still use them, so the original is kept alive.
+    _module._original_module = sys.modules[__name__]
+    sys.modules[__name__] = _module
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""Read the World Bank's bulk-download CSV files.
+
+The bulk downloads hold whole indicators, or whole databases such as the
+World Development Indicators, with one row per country and indicator and one
+column per year. They're available as CSV files or ZIP archives of CSV files,
+eg. ``http://api.worldbank.org/v2/en/indicator/SP.POP.TOTL?downloadformat=csv``.
+
+Reading a bulk file is much faster than requesting the same data from the API
+one indicator at a time. Rows are read one at a time, so large files can be
+streamed into an ``IndicatorMirror`` without holding them in memory.
+"""
+import io
+import re
+import sys
+import csv
+import array
+import shutil
+import urllib2
+import zipfile
+import datetime
+import itertools
+import tempfile
+
+from . import utils
+from .indicators import IndicatorDataset, _parse_value
+
+
+# The first columns of a bulk data file. Any other CSV files in an archive
+# (eg. the country and indicator metadata) are skipped.
+HEADER = ["Country Name", "Country Code", "Indicator Name", "Indicator Code"]
+
+# The number of lines that can come before the header, eg. the "Data Source"
+# and "Last Updated Date" lines of single-indicator files.
+MAX_PREAMBLE_LINES = 10
+
+
+def iter_rows(source, indicators=None, country_codes=None,
+        skip_missing=False):
+    """Yield a row for each value in a bulk download.
+
+    :param source:
+        Path or http(s) URL of a bulk CSV file, or ZIP archive of CSV files.
+        URLs are downloaded to a temporary file first.
+
+    :param indicators:
+        Optional list of indicator codes. If given, other indicators are
+        skipped.
+
+    :param country_codes:
+        Optional list of alpha-2 or alpha-3 codes. If given, other countries
+        are skipped.
+
+    :param skip_missing:
+        If True, skip missing values rather than yielding None.
+
+    :returns:
+        A generator of ``(indicator_code, indicator_name, country_code,
+        country_name, date, value)`` tuples. Country codes are converted to
+        the codes used by the API, as in ``IndicatorDataset``.
+
+    """
+    if indicators:
+        indicators = set(indicators)
+    if country_codes:
+        country_codes = set(utils.convert_country_codes(country_codes,
+            "alpha3"))
+
+    # The bulk files use alpha-3 codes, and the API uses alpha-2 codes.
+    api_codes = {}
+    for fileobj in _data_files(source):
+        for cells, values in _iter_file_rows(fileobj):
+            country_name, country_code, indicator_name, indicator_code = cells
+            if indicators and indicator_code not in indicators:
+                continue
+            if country_codes and country_code not in country_codes:
+                continue
+            if country_code not in api_codes:
+                api_codes[country_code] = utils.convert_country_code(
+                    country_code, "alpha2")
+            api_code = api_codes[country_code]
+            for date, value in values:
+                value = _parse_value(value)
+                if value is None and skip_missing:
+                    continue
+                yield (indicator_code, indicator_name, api_code,
+                    country_name, date, value)
+
+
+def get_datasets(source, indicators=None, country_codes=None,
+        keep_raw=False):
+    """Read a bulk download into one IndicatorDataset per indicator.
+
+    Takes the same arguments as ``iter_rows()``. The datasets can be updated
+    from the API with ``refresh()``, but can't be rehydrated.
+
+    The values are held in a compact form as the file is read, so memory
+    grows with the size of the datasets that are returned, not with the
+    size of the file. To store a whole database, use ``load_mirror()``,
+    which doesn't hold the values in memory at all.
+
+    :param keep_raw:
+        As for ``IndicatorAPI.get_dataset()``. By default, only the compact
+        form of each dataset is kept.
+
+    :returns:
+        Dictionary of datasets, using indicator codes as keys.
+
+    """
+    # Rows are gathered in the compact form of IndicatorDataset as they're
+    # read, rather than as tuples: a country code and date shared with
+    # other rows, and a float. NaN stands for a missing value.
+    columns, names, country_names = {}, {}, {}
+    nan = float("nan")
+    for (indicator_code, indicator_name, country_code, country_name, date,
+            value) in iter_rows(source, indicators, country_codes):
+        if indicator_code not in columns:
+            names[indicator_code] = indicator_name
+            columns[indicator_code] = ([], [], array.array("d"))
+        country_names[country_code] = country_name
+        codes, dates, values = columns[indicator_code]
+        codes.append(country_code)
+        dates.append(date)
+        values.append(nan if value is None else value)
+
+    # Each dataset is built from dictionary rows, like an API response, one
+    # indicator at a time.
+    datasets = {}
+    call_date = datetime.datetime.now().date()
+    for indicator_code in sorted(columns):
+        indicator = {"id": indicator_code, "value": names[indicator_code]}
+        response_rows = [{
+            "indicator": indicator,
+            "country": {"id": country_code,
+                "value": country_names[country_code]},
+            "date": date,
+            "value": None if value != value else value,
+            } for country_code, date, value in
+            itertools.izip(*columns.pop(indicator_code))]
+        header = dict(page=1, pages=1, per_page=len(response_rows),
+            total=len(response_rows))
+        dataset = IndicatorDataset([header, response_rows], source, call_date,
+            keep_raw=keep_raw)
+        dataset.api_params = dict(indicator=indicator_code,
+            country_codes=country_codes)
+        datasets[indicator_code] = dataset
+    return datasets
+
+
+def load_mirror(source, mirror, indicators=None, country_codes=None):
+    """Stream a bulk download into an ``IndicatorMirror``. Takes the same
+    arguments as ``iter_rows()``.
+
+    :returns:
+        The number of rows stored.
+
+    """
+    return mirror.load(iter_rows(source, indicators, country_codes),
+        country_codes)
+
+
+def _data_files(source):
+    """Yield an open binary file for each CSV file in the source."""
+    if re.match(r"^https?://", source):
+        fileobj = tempfile.TemporaryFile()
+        shutil.copyfileobj(urllib2.urlopen(source), fileobj)
+        fileobj.seek(0)
+    else:
+        fileobj = open(source, "rb")
+    try:
+        is_zip = fileobj.read(4) == b"PK\x03\x04"
+        fileobj.seek(0)
+        if not is_zip:
+            yield fileobj
+            return
+        archive = zipfile.ZipFile(fileobj)
+        for name in archive.namelist():
+            if name.lower().endswith(".csv"):
+                member = archive.open(name)
+                try:
+                    yield member
+                finally:
+                    member.close()
+    finally:
+        fileobj.close()
+
+
+def _iter_file_rows(fileobj):
+    """Yield ``(first_cells, [(date, value), ...])`` for each row of a bulk
+    data file, where ``first_cells`` are the values of the ``HEADER`` columns.
+    Nothing is yielded for other CSV files.
+    """
+    reader = _csv_reader(fileobj)
+    for line_number, header in enumerate(reader):
+        if header[:len(HEADER)] == HEADER:
+            break
+        if line_number >= MAX_PREAMBLE_LINES:
+            return
+    else:
+        return
+
+    # The date columns are followed by an empty column.
+    dates = [(column, date.strip()) for column, date in enumerate(header) if
+        column >= len(HEADER) and date.strip()]
+    for row in reader:
+        if len(row) < len(HEADER):
+            continue
+        yield (row[:len(HEADER)],
+            [(date, row[column]) for column, date in dates if
+            column < len(row)])
+
+
+def _csv_reader(fileobj):
+    """Return a CSV reader over a binary UTF-8 file, with a byte order mark
+    removed, which yields lists of unicode strings.
+    """
+    if sys.version_info >= (3,):
+        return csv.reader(io.TextIOWrapper(fileobj, encoding="utf-8-sig",
+            newline=""))
+    return _decode_rows(csv.reader(fileobj))
+
+
+def _decode_rows(reader):
+    # Python 2's csv module only reads byte strings.
+    for line_number, row in enumerate(reader):
+        row = [cell.decode("utf-8") for cell in row]
+        if line_number == 0 and row:
+            row[0] = row[0].lstrip(u"\ufeff")
+        yield row
@@ -1,22 +1,61 @@
 # -*- coding: utf-8 -*-
 import re
 import datetime
-import pprint
-import json
 import itertools
-
-import pycountry
+import threading
 
 from . import utils
 
 
+# The paths of Climate API URLs, for datasets whose calls have no "params".
+# The API accepts "ensemble" either before or after the data type.
+_INSTRUMENTAL_URL_RE = re.compile(r"v1/(country|basin)/cru/(\w+)/(\w+)/(\w+)$")
+_MODELLED_URL_RE = re.compile(r"v1/(country|basin)/(\w+)/(ensemble/)?(\w+)/"
+    r"(ensemble/)?(\d+)/(\d+)/(\w+)$")
+
+
+def _url_params(url):
+    """Return the request parameters of a Climate API URL, as recorded in
+    the "params" of each call by ``ClimateAPI``.
+    """
+    match = _MODELLED_URL_RE.search(url)
+    if match:
+        (location_type, interval, ensemble, data_type, ensemble_after, start,
+            end, location) = match.groups()
+        return _modelled_params(location_type, location, data_type, interval,
+            start, end, bool(ensemble or ensemble_after))
+    match = _INSTRUMENTAL_URL_RE.search(url)
+    if match:
+        location_type, data_type, interval, location = match.groups()
+        return _instrumental_params(location_type, location, data_type,
+            interval)
+    raise ValueError("Not a Climate API data URL: %s" % url)
+
+
+def _instrumental_params(location_type, location, data_type, interval):
+    return dict(location_type=location_type, location=location.upper(),
+        data_type=data_type, interval=interval)
+
+
+def _modelled_params(location_type, location, data_type, interval, start,
+        end, ensemble):
+    params = _instrumental_params(location_type, location, data_type,
+        interval)
+    params.update(start=str(start), end=str(end), ensemble=ensemble,
+        annual="annual" in interval)
+    return params
+
+
 class ClimateDataset(object):
 
-    def __init__(self, api_calls, data_type, data_interval, call_date):
+    def __init__(self, api_calls, data_type, data_interval, call_date,
+            keep_raw=True, fetch=None):
         """
         :param api_calls:
             List of dicts with the keys "url" and "resp". Necessary as multiple
-            responses can form one dataset.
+            responses can form one dataset. Calls from ``ClimateAPI`` also
+            have the request's "params" (see ``get_calls()``), which are
+            otherwise read from the URL.
 
         :param data_type:
             eg. ``pr``, ``tas``, ``tmin_means`` 
@@ -26,24 +65,50 @@ class ClimateDataset(object):
 
         :param call_date:
             Date of the url call
+
+        :param keep_raw:
+            If False, each call's "resp" is parsed into a compact list of
+            "rows" and then dropped, which uses much less memory. The raw
+            responses can be requested again with ``rehydrate()``.
+
+        :param fetch:
+            Function used to request URLs, eg. by ``rehydrate()``. Defaults to
+            the cached ``utils.fetch``.
         """
         self.api_call_date = call_date
         self.api_calls = api_calls
+        self._fetch = fetch if fetch else utils.fetch
+
+        # A utils.CallProfile, if the API call was profiled.
+        self.profile = None
 
         self._data_type_arg = data_type
         self._interval_arg = data_interval
 
+        self._calls_index = None
         for resp in self.api_calls:
-            region = str(resp["url"].split("/")[-1])
+            if "params" not in resp:
+                resp["params"] = _url_params(resp["url"])
+            region = resp["params"]["location"]
             try:
-                code = utils.convert_country_code(region.upper(), "alpha2")
-                val = pycountry.countries.get(alpha2=code).name
+                code = utils.convert_country_code(region, "alpha2")
+                val = utils.country_name(code)
             except KeyError:  # If not country code, assume it's a basin
                 code = region
                 val = "http://data.worldbank.org/sites/default/files"
                 "/climate_data_api_basins.pdf"
             resp["region"] = (code, val)
 
+        if not keep_raw:
+            # The calls are copied, so that the caller's responses are kept.
+            strings = {}
+            lean_calls = []
+            for call in self.api_calls:
+                call = dict(call, rows=list(self._parse_call(call, strings)))
+                del call["resp"]
+                lean_calls.append(call)
+            self.api_calls = lean_calls
+
     def __repr__(self):
         s = "<%s.%s(%r, %r) with id: %r>"
         return s % (
@@ -55,8 +120,102 @@ class ClimateDataset(object):
             )
 
     def __str__(self):
+        import pprint  # Only needed here, and slow to import.
         return pprint.pformat(self.as_dict())
 
+    def rehydrate(self):
+        """Request the raw API responses again (normally from the cache), for
+        a dataset that was created with ``keep_raw=False``.
+
+        :returns:
+            The ``api_calls`` list, with each call's "resp" restored.
+
+        """
+        for call in self.api_calls:
+            if "resp" not in call:
+                loads = utils.get_json_decoder()
+                call["resp"] = loads(self._fetch(call["url"]))
+        return self.api_calls
+
+    def get_calls(self, **params):
+        """Return the API calls whose request parameters have all the given
+        values, in order, eg. ``get_calls(ensemble=True, end="2039")``.
+
+        Each call's "params" has the keys ``location_type`` (``country`` or
+        ``basin``), ``location`` (an alpha-3 code or basin ID),
+        ``data_type`` and ``interval``, and for modelled data ``start``,
+        ``end``, ``ensemble`` and ``annual``. The calls are indexed by each
+        parameter value the first time that this is called.
+        """
+        if self._calls_index is None:
+            self._calls_index = {}
+            for position, call in enumerate(self.api_calls):
+                for item in call["params"].items():
+                    self._calls_index.setdefault(item, []).append(position)
+        positions = None
+        for item in params.items():
+            matches = self._calls_index.get(item, [])
+            positions = (set(matches) if positions is None else
+                positions.intersection(matches))
+        if positions is None:
+            return list(self.api_calls)
+        return [self.api_calls[position] for position in sorted(positions)]
+
+    def _call_rows(self, call):
+        """Return the parsed rows of one API call, from the compact form if
+        the raw response was dropped.
+        """
+        if "rows" in call:
+            return call["rows"]
+        return self._parse_call(call, {})
+
+    def write_csv(self, fileobj, header=True):
+        """Stream the dataset to an open file as CSV, with one row per value.
+
+        The columns are the same as the tuples from ``iter_rows()``, plus a
+        ``value`` column.
+
+        :param fileobj:
+            A file-like object opened for writing.
+
+        :param header:
+            If True, write a header row first.
+
+        """
+        utils.write_csv(fileobj, self.iter_rows(),
+            self._csv_header() if header else None)
+
+    def to_parquet(self, path):
+        """Write the dataset to a parquet file. Requires pyarrow.
+
+        There is one row per value, with the string columns
+        dictionary-encoded. The call date is stored in the file metadata.
+
+        :param path:
+            Destination file path.
+
+        """
+        self._write_file(path, "parquet", self._export_columns())
+
+    def to_feather(self, path):
+        """Write the dataset to a feather file. Requires pyarrow.
+
+        The columns are the same as for ``to_parquet()``.
+
+        :param path:
+            Destination file path.
+
+        """
+        self._write_file(path, "feather", self._export_columns())
+
+    def _region_names(self, region_codes):
+        names = dict(call["region"] for call in self.api_calls)
+        return [names[code] for code in region_codes]
+
+    def _write_file(self, path, file_format, columns):
+        metadata = {"api_call_date": str(self.api_call_date)}
+        utils.write_columns(path, columns, file_format, metadata)
+
 
 class InstrumentalDataset(ClimateDataset):
 
@@ -88,9 +247,8 @@ class InstrumentalDataset(ClimateDataset):
 
         if self.interval == "month":
             for call in self.api_calls:
-                sorted_months = sorted(call["resp"],
-                    key=lambda row: float(row["month"]))
-                vals = [float(row["data"]) for row in sorted_months]
+                sorted_months = sorted(self._call_rows(call))
+                vals = [val for month, val in sorted_months]
 
                 region_code = call["region"][0]
                 results[region_code] = vals
@@ -99,15 +257,91 @@ class InstrumentalDataset(ClimateDataset):
                 region_code = call["region"][0]
                 this_region = {}
                 results[region_code] = this_region
-                for row in call["resp"]:
+                for year, val in self._call_rows(call):
                     if use_datetime:
-                        key = utils.worldbank_date_to_datetime(
-                            str(row["year"]))
-                    else:
-                        key = str(row["year"])
-                    this_region[key] = float(row["data"])
+                        year = utils.worldbank_date_to_datetime(year)
+                    this_region[year] = val
         return results
 
+    def iter_rows(self):
+        """Yield a (region, date, value) tuple for each value in the API
+        responses, in response order. For monthly data, the date is the month
+        number (0-11).
+        """
+        for call in self.api_calls:
+            region_code = call["region"][0]
+            for key, val in self._call_rows(call):
+                yield region_code, key, val
+
+    def _parse_call(self, call, strings):
+        """Yield a (date, value) tuple for each row of a call's response, or
+        (month, value) for monthly data.
+        """
+        monthly = self._interval_arg == "month"
+        for row in call["resp"]:
+            if monthly:
+                key = int(row["month"])
+            else:
+                key = str(row["year"])
+                key = strings.setdefault(key, key)
+            yield key, float(row["data"])
+
+    def _csv_header(self):
+        if self.interval == "month":
+            return ("region", "month", "value")
+        return ("region", "date", "value")
+
+    def to_frame(self, use_datetime=False):
+        """Return the dataset as a pandas DataFrame.
+
+        The index is a (region, date) MultiIndex, or (region, month) for
+        monthly data, where months are numbered 0-11. The single column is
+        named after the data type. Requires pandas.
+
+        :param use_datetime:
+            Use datetime64 values for the date level, rather than strings.
+
+        """
+        pd = utils.import_optional("pandas")
+        regions, keys, values = self._columns()
+        key_name = "month" if self.interval == "month" else "date"
+        index = pd.MultiIndex.from_arrays([regions, keys],
+            names=["region", key_name])
+        frame = pd.DataFrame({self._data_type_arg: values}, index=index,
+            dtype=float).sort_index()
+        if use_datetime and key_name == "date":
+            frame.index = utils.datetime_index_level(frame.index, "date")
+        return frame
+
+    def _export_columns(self):
+        regions, keys, values = self._columns()
+        if self.interval == "month":
+            key_column = ("month", "int64", keys)
+        else:
+            key_column = ("date", "string", keys)
+        return [
+            ("region", "string", regions),
+            ("region_name", "string", self._region_names(regions)),
+            key_column,
+            ("value", "float64", values),
+            ("data_type", "string", [self._data_type_arg] * len(values)),
+            ("interval", "string", [self.interval] * len(values)),
+            ]
+
+    def _columns(self):
+        """Return (regions, dates or months, values) lists, one item per
+        row of data.
+        """
+        regions, keys, values = [], [], []
+        for call in self.api_calls:
+            rows = self._call_rows(call)
+            if not isinstance(rows, list):
+                rows = list(rows)
+            regions.extend([call["region"][0]] * len(rows))
+            keys.extend([key for key, val in rows])
+            values.extend([val for key, val in rows])
+        return regions, keys, values
+
 
 class ModelledDataset(ClimateDataset):
 
@@ -120,19 +354,30 @@ class ModelledDataset(ClimateDataset):
         intv = self._interval_arg
         self.interval = {intv: ClimateAPI._modelled_intervals[intv]}
 
+        # One pass over the rows indexes the values by (scenario, gcm,
+        # region), and then by period. as_dict(), gcms, sres and dates() are
+        # all served from the index. As in the responses, past periods have
+        # no scenario. The first value for each period is kept.
+        self._index = {}
+        date_pairs = set()
+        for call in self.api_calls:
+            region_code = call["region"][0]
+            date_pairs.add((call["params"]["start"], call["params"]["end"]))
+            for gcm_key, row_sres, year, val in self._call_rows(call):
+                key = (row_sres, gcm_key, region_code)
+                periods = self._index.get(key)
+                if periods is None:
+                    periods = self._index[key] = {}
+                if year not in periods:
+                    periods[year] = val
+        self._date_pairs = sorted(date_pairs)
+
+        self.sres = list(set(key[0] for key in self._index if key[0]))
         self.gcms = {}
-        for gcm_key in self.as_dict():
-            if gcm_key in ClimateAPI._gcm:
+        for row_sres, gcm_key, region_code in self._index:
+            if row_sres in [None, "a2"] and gcm_key in ClimateAPI._gcm:
                 self.gcms[gcm_key] = ClimateAPI._gcm[gcm_key]
 
-        all_sres = set()
-        for call in self.api_calls:
-            for row in call["resp"]:
-                row_sres = row.get("scenario")
-                if row_sres:
-                    all_sres.add(row_sres)
-        self.sres = list(all_sres)
-
         if self.data_type in ["pr", "tas"]:
             self.control_period = ("1961", "1999")
         else:
@@ -145,15 +390,11 @@ class ModelledDataset(ClimateDataset):
             If True, return dates as datetime.date() object instead of strings.
 
         """
-        dates = set()
-        all_urls = [call["url"] for call in self.api_calls]
-        for url in all_urls:
-            start, end = re.findall("\d+/\d+", url)[0].split("/")
-            if use_datetime:
-                start = utils.worldbank_date_to_datetime(start)
-                end = utils.worldbank_date_to_datetime(end)
-            dates.add((start, end))
-        return sorted(list(dates))
+        if use_datetime:
+            to_datetime = utils.worldbank_date_to_datetime
+            return [(to_datetime(start), to_datetime(end)) for start, end in
+                self._date_pairs]
+        return list(self._date_pairs)
 
     def as_dict(self, sres="a2", use_datetime=False):
         """Return dataset data as dictionary.
@@ -168,46 +409,325 @@ class ModelledDataset(ClimateDataset):
             Use datetime.date() objects for date keys, instead of strings.
 
         """
+        sres = sres.lower()
+        to_datetime = utils.worldbank_date_to_datetime
         results = {}
-        for call in self.api_calls:
-            if "ensemble" in call["url"]:
-                get_gcm_key = lambda row: "ensemble_%d" % row["percentile"]
-                annual_data_key = "annualVal"
+        for (row_sres, gcm_key, region_code), periods in self._index.items():
+            # Only future periods have scenarios. Limit results to one
+            # scenario at a time, so we can have one value per time period.
+            if row_sres and row_sres != sres:
+                continue
+            if use_datetime:
+                periods = dict((to_datetime(year), val) for year, val in
+                    periods.items())
+            regions = results.setdefault(gcm_key, {})
+            if region_code in regions:
+                # Past and future periods of the same GCM and region.
+                for year, val in periods.items():
+                    regions[region_code].setdefault(year, val)
             else:
-                get_gcm_key = lambda row: row["gcm"]
-                annual_data_key = "annualData"
+                regions[region_code] = dict(periods)
+        return results
 
-            region_code = call["region"][0]
+    def as_cube(self, use_datetime=False):
+        """Return the dataset as a dense numpy array, with labels for each
+        axis. Requires numpy.
+
+        The axes are gcm, region, period, scenario and then month, which is
+        left out for annual intervals. The period is the end year of the
+        modelled date range, and months are numbered 0-11. Past periods have
+        no scenario, so their values are repeated for every scenario, as in
+        ``as_dict()``. Missing values are NaN.
+
+        :param use_datetime:
+            Use datetime.date() objects for the period labels, instead of
+            strings.
+
+        :returns:
+            A ``(values, axes)`` tuple, where ``axes`` is a list of
+            ``(axis_name, labels)`` tuples in axis order, eg.
+            ``values[axes[0][1].index("ensemble_50")]`` is the median.
+
+        """
+        np = utils.import_optional("numpy")
+
+        # Gather every value and its position in one pass, numbering the
+        # labels of each axis as they're found. Past periods have no
+        # scenario, and are kept apart.
+        gcm_pos, region_pos, period_pos, sres_pos = {}, {}, {}, {}
+        future = ([], [], [], [], [])
+        past = ([], [], [], [])
+        for (row_sres, gcm_key, region_code), row_periods in \
+                self._index.items():
+            rows = future if row_sres else past
+            count = len(row_periods)
+            rows[0].extend([gcm_pos.setdefault(gcm_key, len(gcm_pos))] * count)
+            rows[1].extend([region_pos.setdefault(region_code,
+                len(region_pos))] * count)
+            rows[2].extend([period_pos.setdefault(period, len(period_pos))
+                for period in row_periods])
+            if row_sres:
+                rows[3].extend([sres_pos.setdefault(row_sres,
+                    len(sres_pos))] * count)
+            rows[-1].extend(row_periods.values())
+        if not sres_pos:
+            sres_pos[None] = 0
+
+        values = future[-1] or past[-1]
+        if values:
+            month_shape = ([len(values[0])] if isinstance(values[0], list)
+                else [])
+        else:
+            # With no values, the interval decides if there's a month axis.
+            annual = "annual" in ClimateAPI._clean_api_code(self._interval_arg)
+            month_shape = [] if annual else [12]
+        shape = [len(gcm_pos), len(region_pos), len(period_pos),
+            len(sres_pos)] + month_shape
+        cube = np.full(shape, np.nan)
+        if future[-1]:
+            cube[tuple(future[:4])] = self._float_array(np, future[-1],
+                month_shape)
+        if past[-1]:
+            # Repeat past values along the scenario axis.
+            cube[tuple(past[:3])] = self._float_array(np, past[-1],
+                month_shape)[:, np.newaxis]
+
+        # Sort the labels of each axis.
+        labels = []
+        for axis, positions in enumerate([gcm_pos, region_pos, period_pos,
+                sres_pos]):
+            axis_labels = sorted(positions)
+            order = [positions[label] for label in axis_labels]
+            if order != sorted(order):
+                cube = cube.take(order, axis=axis)
+            labels.append(axis_labels)
+
+        names = ["gcm", "region", "period", "scenario", "month"]
+        if use_datetime:
+            labels[2] = [utils.worldbank_date_to_datetime(period) for period
+                in labels[2]]
+        if len(shape) == 5:
+            labels.append(list(range(shape[4])))
+        return cube, list(zip(names, labels))
+
+    @staticmethod
+    def _float_array(np, values, month_shape):
+        """Return a list of values, or of lists of monthly values, as a
+        float array.
+        """
+        if month_shape:
+            # Much faster than np.array() for a list of lists.
+            values = itertools.chain.from_iterable(values)
+        array = np.fromiter(values, float)
+        return array.reshape([-1] + month_shape)
+
+    def iter_rows(self, sres="a2"):
+        """Yield a (gcm, region, period, month, value) tuple for each value
+        in the API responses, in response order. The period is the end year
+        of the modelled date range, and months are numbered 0-11. Annual
+        intervals have no month item.
+
+        :param sres:
+            Which SRES to use for future values, as for ``as_dict()``.
+
+        """
+        for gcm_key, region_code, year, val in self._iter_values(sres):
+            if isinstance(val, list):
+                for month, month_val in enumerate(val):
+                    yield gcm_key, region_code, year, month, month_val
+            else:
+                yield gcm_key, region_code, year, val
+
+    def write_csv(self, fileobj, sres="a2", header=True):
+        """Stream the dataset to an open file as CSV, with one row per value.
+
+        The columns are the same as the tuples from ``iter_rows()``, plus a
+        ``value`` column.
+
+        :param fileobj:
+            A file-like object opened for writing.
+
+        :param sres:
+            Which SRES to use for future values, as for ``as_dict()``.
+
+        :param header:
+            If True, write a header row first.
+
+        """
+        utils.write_csv(fileobj, self.iter_rows(sres),
+            self._csv_header() if header else None)
+
+    def _csv_header(self):
+        if "annual" in self._interval_arg:
+            return ("gcm", "region", "period", "value")
+        return ("gcm", "region", "period", "month", "value")
+
+    def to_frame(self, sres="a2", use_datetime=False):
+        """Return the dataset as a pandas DataFrame.
+
+        The index is a (gcm, region, period, month) MultiIndex, where the
+        period is the end year of the modelled date range and months are
+        numbered 0-11. Annual intervals have no month level. The single
+        column is named after the data type. Requires pandas.
+
+        :param sres:
+            Which SRES to use for future values, as for ``as_dict()``.
+
+        :param use_datetime:
+            Use datetime64 values for the period level, rather than strings.
+
+        """
+        pd = utils.import_optional("pandas")
+        columns = self._columns(sres)
+        values = columns.pop()
+        names = ["gcm", "region", "period", "month"][:len(columns)]
+        index = pd.MultiIndex.from_arrays(columns, names=names)
+        frame = pd.DataFrame({self._data_type_arg: values}, index=index,
+            dtype=float)
+
+        # As with as_dict(), keep the first value if a period is repeated.
+        frame = frame[~frame.index.duplicated(keep="first")].sort_index()
+        if use_datetime:
+            frame.index = utils.datetime_index_level(frame.index, "period")
+        return frame
 
-            for row in call["resp"]:
+    def to_parquet(self, path, sres="a2"):
+        """Write the dataset to a parquet file. Requires pyarrow.
+
+        There is one row per value, with the string columns
+        dictionary-encoded. The call date is stored in the file metadata.
+
+        :param path:
+            Destination file path.
+
+        :param sres:
+            Which SRES to use for future values, as for ``as_dict()``.
+
+        """
+        self._write_file(path, "parquet", self._export_columns(sres))
+
+    def to_feather(self, path, sres="a2"):
+        """Write the dataset to a feather file. Requires pyarrow.
+
+        The columns are the same as for ``to_parquet()``.
+
+        :param path:
+            Destination file path.
+
+        :param sres:
+            Which SRES to use for future values, as for ``as_dict()``.
+
+        """
+        self._write_file(path, "feather", self._export_columns(sres))
+
+    def _export_columns(self, sres="a2"):
+        columns = self._columns(sres)
+        values = columns.pop()
+        row_count = len(values)
+        export = [
+            ("gcm", "string", columns[0]),
+            ("region", "string", columns[1]),
+            ("region_name", "string", self._region_names(columns[1])),
+            ("period", "string", columns[2]),
+            ]
+        if len(columns) == 4:
+            export.append(("month", "int64", columns[3]))
+        export.extend([
+            ("value", "float64", values),
+            ("sres", "string", [sres.lower()] * row_count),
+            ("data_type", "string", [self._data_type_arg] * row_count),
+            ("interval", "string", [self._interval_arg] * row_count),
+            ])
+        return export
+
+    def _columns(self, sres="a2"):
+        """Return a list of [gcms, regions, periods, months, values] lists,
+        one item per value. The months list is omitted for annual data.
+        """
+        gcms, regions, periods, months, values = [], [], [], [], []
+        monthly = None
+        for gcm_key, region_code, year, val in self._iter_values(sres):
+            monthly = isinstance(val, list)
+            if monthly:
+                count = len(val)
+                months.extend(range(count))
+                values.extend(val)
+            else:
+                count = 1
+                values.append(val)
+            gcms.extend([gcm_key] * count)
+            regions.extend([region_code] * count)
+            periods.extend([year] * count)
+
+        if monthly:
+            return [gcms, regions, periods, months, values]
+        return [gcms, regions, periods, values]
+
+    def _iter_values(self, sres="a2"):
+        """Yield (gcm, region, year, value) for each row in the API
+        responses that matches ``sres``. Values are lists of 12 months, or a
+        float for annual data.
+        """
+        sres = sres.lower()
+        for call in self.api_calls:
+            region_code = call["region"][0]
+            for gcm_key, row_scenario, year, val in self._call_rows(call):
                 # Only future calls have scenarios. Limit results to one
                 # scenario at a time, so we can have one value per time
                 # period.
-                row_scenario = row.get("scenario")
-                if row_scenario and row_scenario != sres.lower():
+                if row_scenario and row_scenario != sres:
                     continue
+                yield gcm_key, region_code, year, val
 
-                gcm_key = get_gcm_key(row)
-                if gcm_key not in results:
-                    results[gcm_key] = {}
+    def _parse_call(self, call, strings):
+        """Yield a (gcm, scenario, year, value) tuple for each row of a
+        call's response. Values are lists of 12 months, or a float for annual
+        data, and the scenario is None for past periods.
+        """
+        params = call["params"]
+        if params["ensemble"]:
+            get_gcm_key = lambda row: "ensemble_%d" % row["percentile"]
+            annual_data_key = "annualVal"
+        else:
+            get_gcm_key = lambda row: row["gcm"]
+            annual_data_key = "annualData"
+        annual = params["annual"]
+
+        for row in call["resp"]:
+            if annual:
+                val = float(row[annual_data_key][0])
+            else:
+                # Assume they are monthly values
+                val = row["monthVals"]
+            gcm_key = get_gcm_key(row)
+            scenario = row.get("scenario")
+            year = str(row["toYear"])
+            yield (strings.setdefault(gcm_key, gcm_key),
+                strings.setdefault(scenario, scenario),
+                strings.setdefault(year, year), val)
 
-                if region_code not in results[gcm_key]:
-                    results[gcm_key][region_code] = {}
-                region_dict = results[gcm_key][region_code]
 
-                year = str(row["toYear"])
-                if use_datetime:
-                    year = utils.worldbank_date_to_datetime(year)
+class ModelledDatasets(dict):
 
-                if year not in region_dict:
-                    if "annual" in call["url"]:
-                        val = float(row[annual_data_key][0])
-                    else:
-                        # Assume they are monthly values
-                        val = row["monthVals"]
-                    region_dict[year] = val
+    """The result of ``ClimateAPI.get_modelled_many()``: a dictionary of
+    ``ModelledDataset`` objects, by ``(data_type, interval)``.
 
-        return results
+    ``errors`` has the exception from each failed request, by
+    ``(data_type, interval, location)``, where the location is an alpha-3
+    code or basin ID. Those locations are left out of the dataset.
+    """
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self.errors = {}
+
+    def __repr__(self):
+        return "<%s: %d datasets, %d errors>" % (self.__class__.__name__,
+            len(self), len(self.errors))
+
+    def failed_locations(self):
+        """Return the sorted locations that have at least one error."""
+        return sorted(set(key[2] for key in self.errors))
 
 
 class ClimateAPI(object):
@@ -216,6 +736,15 @@ class ClimateAPI(object):
     
     You can override the default tempfile cache by passing a function
     ``fetch``, which requests a URL and returns the response as a string. 
+
+    You can choose the JSON decoder by passing ``json_decoder``, either as a
+    module name (eg. ``orjson``) or a function. See
+    ``utils.get_json_decoder()``.
+
+    If ``profile`` is True, or is None and the ``WBPY_PROFILE`` environment
+    variable is set, each dataset records the time spent on requests, the
+    cache, JSON parsing and building it as ``dataset.profile``. See
+    ``utils.CallProfile``.
     """
 
     _gcm = dict(
@@ -318,15 +847,21 @@ class ClimateAPI(object):
 
     BASE_URL = "http://climatedataapi.worldbank.org/climateweb/rest/"
 
-    def __init__(self, fetch=None):
-        self.fetch = fetch if fetch else utils.fetch
+    # The default number of requests that can be made at the same time.
+    MAX_WORKERS = 4
+
+    def __init__(self, fetch=None, json_decoder=None, profile=None):
+        self.fetch = fetch if fetch else utils.fetch_bytes
+        self._loads = utils.get_json_decoder(json_decoder)
+        self.profile = profile
 
     @staticmethod
     def _clean_api_code(code):
         code = code.lower()
         return ClimateAPI._shorthand_codes.get(code, code)
 
-    def get_instrumental(self, data_type, interval, locations):
+    def get_instrumental(self, data_type, interval, locations, keep_raw=True,
+            max_workers=None):
         """Get historical data for temperature or precipitation.
 
         :param data_type:
@@ -339,42 +874,20 @@ class ClimateAPI(object):
             A list of API location codes - either ISO alpha-2 or alpha-3
             country codes, or basin ID numbers.
 
-        """
-        data_type = self._clean_api_code(data_type)
-        interval = self._clean_api_code(interval)
-
-        assert data_type in self.ARG_DEFINITIONS["instrumental_types"]
-        assert interval in self.ARG_DEFINITIONS["instrumental_intervals"]
-
-        # Construct URLs
-        urls = []
-        for loc in locations:
-            try:
-                int(loc)
-                loc_type = "basin"
-            except ValueError:
-                loc = utils.convert_country_code(loc, "alpha3")
-                loc_type = "country"
-
-            data_url = "v1/{0}/cru/{1}/{2}/{3}".format(loc_type, data_type,
-                interval, str(loc))
-            full_url = "".join([self.BASE_URL, data_url])
-            urls.append((loc, full_url))
+        :param keep_raw:
+            If False, the dataset drops the raw JSON responses after parsing
+            them, to save memory. See ``ClimateDataset.rehydrate()``.
 
-        # If no exception from URL construction, make requests
-        api_calls = []
-        for loc, url in urls:
-            resp = json.loads(self.fetch(url))
-            api_calls.append(dict(
-                url=url,
-                resp=resp,
-                ))
+        :param max_workers:
+            The number of requests that can be made at the same time.
+            Defaults to ``MAX_WORKERS``.
 
-        call_date = datetime.datetime.now().date()
-        return InstrumentalDataset(api_calls, data_interval=interval,
-            data_type=data_type, call_date=call_date)
+        """
+        plan = self._instrumental_plan(data_type, interval, locations)
+        return self._get_datasets([plan], keep_raw, max_workers)[0]
 
-    def get_modelled(self, data_type, interval, locations):
+    def get_modelled(self, data_type, interval, locations, keep_raw=True,
+            max_workers=None):
         """Get modelled data for precipitation or temperature.
 
         :param data_type:
@@ -389,6 +902,162 @@ class ClimateAPI(object):
             A list of API location codes - either ISO alpha-2 or alpha-3
             country codes, or basin ID numbers.
 
+        :param keep_raw:
+            If False, the dataset drops the raw JSON responses after parsing
+            them, to save memory. See ``ClimateDataset.rehydrate()``.
+
+        :param max_workers:
+            The number of requests that can be made at the same time.
+            Defaults to ``MAX_WORKERS``.
+
+        """
+        plan = self._modelled_plan(data_type, interval, locations)
+        return self._get_datasets([plan], keep_raw, max_workers)[0]
+
+    def get_many(self, queries, keep_raw=True, max_workers=None):
+        """Get several instrumental and modelled datasets at once.
+
+        The URLs of all the queries are requested together, up to
+        ``max_workers`` at a time, and a URL that's needed by more than one
+        query is only requested once. If profiling is enabled, the datasets
+        share one profile of all the requests.
+
+        :param queries:
+            List of ``(data_type, interval, locations)`` tuples, with the
+            arguments of ``get_instrumental()`` or ``get_modelled()``.
+            Queries with an instrumental interval (``year``, ``month`` or
+            ``decade``) are instrumental, and the others are modelled.
+
+        :param keep_raw:
+            As for ``get_instrumental()`` and ``get_modelled()``.
+
+        :param max_workers:
+            The number of requests that can be made at the same time.
+            Defaults to ``MAX_WORKERS``.
+
+        :returns:
+            List of datasets, in the same order as the queries.
+
+        """
+        plans = []
+        for data_type, interval, locations in queries:
+            if self._clean_api_code(interval) in self._instrumental_intervals:
+                plan = self._instrumental_plan(data_type, interval, locations)
+            else:
+                plan = self._modelled_plan(data_type, interval, locations)
+            plans.append(plan)
+        return self._get_datasets(plans, keep_raw, max_workers)
+
+    def get_modelled_many(self, data_types, intervals, locations,
+            keep_raw=True, max_workers=None, max_rate=None, progress=None):
+        """Get modelled data for every combination of data types and
+        intervals, for the same locations.
+
+        Every URL is planned, and the arguments checked, before any request
+        is made. The URLs are then requested together, up to
+        ``max_workers`` at a time, as for ``get_many()``.
+
+        A request that fails doesn't stop the others. Each dataset has the
+        locations whose requests all succeeded, and the errors are in the
+        result's ``errors``. Successful responses are cached as usual, so
+        calling this again with the failed locations only requests those.
+
+        :param data_types:
+            List of data statistic IDs, as for ``get_modelled()``.
+
+        :param intervals:
+            List of interval IDs, as for ``get_modelled()``.
+
+        :param locations:
+            A list of API location codes - either ISO alpha-2 or alpha-3
+            country codes, or basin ID numbers.
+
+        :param keep_raw:
+            As for ``get_modelled()``.
+
+        :param max_workers:
+            The number of requests that can be made at the same time.
+            Defaults to ``MAX_WORKERS``.
+
+        :param max_rate:
+            If given, at most this many requests are made a second.
+            Responses from the cache don't count towards the rate.
+
+        :param progress:
+            A function that's called as ``progress(done, total)`` each time
+            a request finishes, with the number of URLs requested so far and
+            in total. It's called from the threads making the requests.
+
+        :returns:
+            A ``ModelledDatasets`` dictionary of ``ModelledDataset`` objects,
+            with a ``(data_type, interval)`` key for each combination that
+            has data for at least one location.
+
+        """
+        keys, plans = [], []
+        for key in itertools.product(data_types, intervals):
+            keys.append(key)
+            plans.append(self._modelled_plan(key[0], key[1], locations))
+
+        profile = utils.new_profile(self.profile)
+        errors = {}
+        responses = self._get_responses(plans, max_workers, profile,
+            max_rate, progress, errors)
+
+        # A location is left out of a dataset if any of its requests failed.
+        datasets = ModelledDatasets()
+        complete_keys, complete_plans = [], []
+        for key, (cls, data_type, interval, calls) in zip(keys, plans):
+            failed = {}
+            for url, params in calls:
+                if url in errors:
+                    failed.setdefault(params["location"], errors[url])
+            for location, error in failed.items():
+                datasets.errors[key + (location,)] = error
+            calls = [(url, params) for url, params in calls
+                if params["location"] not in failed]
+            if calls:
+                complete_keys.append(key)
+                complete_plans.append((cls, data_type, interval, calls))
+        datasets.update(zip(complete_keys, self._build_datasets(
+            complete_plans, responses, profile, keep_raw)))
+        return datasets
+
+    @staticmethod
+    def _location(loc):
+        """Return the location type and code to use in URLs, for a country
+        code or basin ID.
+        """
+        try:
+            int(loc)  # basin ids are ints
+            return "basin", str(loc)
+        except ValueError:
+            return "country", utils.convert_country_code(loc, "alpha3")
+
+    def _instrumental_plan(self, data_type, interval, locations):
+        """Return a ``(dataset class, data type, interval, calls)`` tuple
+        for a ``get_instrumental()`` request, where calls is a list of
+        ``(URL, params)`` pairs.
+        """
+        data_type = self._clean_api_code(data_type)
+        interval = self._clean_api_code(interval)
+
+        assert data_type in self.ARG_DEFINITIONS["instrumental_types"]
+        assert interval in self.ARG_DEFINITIONS["instrumental_intervals"]
+
+        calls = []
+        for loc in locations:
+            loc_type, loc = self._location(loc)
+            data_url = "v1/{0}/cru/{1}/{2}/{3}".format(loc_type, data_type,
+                interval, loc)
+            params = _instrumental_params(loc_type, loc, data_type, interval)
+            calls.append(("".join([self.BASE_URL, data_url]), params))
+        return InstrumentalDataset, data_type, interval, calls
+
+    def _modelled_plan(self, data_type, interval, locations):
+        """Return a ``(dataset class, data type, interval, calls)`` tuple
+        for a ``get_modelled()`` request, where calls is a list of
+        ``(URL, params)`` pairs.
         """
         data_type = self._clean_api_code(data_type)
         interval = self._clean_api_code(interval)
@@ -410,28 +1079,96 @@ class ClimateAPI(object):
             all_urls = ["v1/{0}/{1}/ensemble/{2}/{3}/{4}/{5}"]
             all_dates = self._valid_stat_dates
 
-        api_calls = []
+        calls = []
         for loc in locations:
-            try:
-                int(loc)  # basin ids are ints
-                loc_type = "basin"
-            except ValueError:
-                loc = utils.convert_country_code(loc, "alpha3")
-                loc_type = "country"
-
+            loc_type, loc = self._location(loc)
             for dates, url in itertools.product(all_dates, all_urls):
                 start_date = dates[0]
                 end_date = dates[1]
                 rest_url = url.format(loc_type, interval, data_type,
                     start_date, end_date, loc)
-                full_url = "".join([self.BASE_URL, rest_url])
+                params = _modelled_params(loc_type, loc, data_type, interval,
+                    start_date, end_date, "ensemble" in url)
+                calls.append(("".join([self.BASE_URL, rest_url]), params))
+        return ModelledDataset, data_type, interval, calls
+
+    def _get_datasets(self, plans, keep_raw=True, max_workers=None):
+        """Request the URLs of each plan (see ``_modelled_plan()``), with
+        each distinct URL requested once, and return a dataset for each
+        plan.
+        """
+        # If no exception from URL construction, make requests
+        profile = utils.new_profile(self.profile)
+        responses = self._get_responses(plans, max_workers, profile)
+        return self._build_datasets(plans, responses, profile, keep_raw)
 
-                resp = json.loads(self.fetch(full_url))
-                api_calls.append(dict(
-                    url=full_url,
-                    resp=resp,
-                    ))
+    def _get_responses(self, plans, max_workers=None, profile=None,
+            max_rate=None, progress=None, errors=None):
+        """Request each distinct URL of the plans, and return a dictionary of
+        the decoded responses by URL.
 
+        :param max_rate:
+            If given, the most requests to make a second, not counting cache
+            hits when ``fetch`` is ``utils.fetch()`` or
+            ``utils.fetch_bytes()``.
+
+        :param progress:
+            If given, called as ``progress(done, total)`` after each request.
+
+        :param errors:
+            If given, exceptions are added to this dictionary by URL rather
+            than raised, and the failed URLs are missing from the result.
+
+        """
+        urls, seen = [], set()
+        for cls, data_type, interval, calls in plans:
+            for url, params in calls:
+                if url not in seen:
+                    seen.add(url)
+                    urls.append(url)
+
+        limiter = utils.RateLimiter(max_rate) if max_rate else None
+        uses_cache = self.fetch in (utils.fetch, utils.fetch_bytes)
+        lock = threading.Lock()
+        done = [0]
+
+        def get_json(url):
+            try:
+                if limiter and not (uses_cache and utils.is_cached(url)):
+                    limiter.wait()
+                return self._get_json(url, profile)
+            except Exception as e:
+                if errors is None:
+                    raise
+                with lock:
+                    errors[url] = e
+            finally:
+                if progress:
+                    with lock:
+                        done[0] += 1
+                        progress(done[0], len(urls))
+
+        responses = utils.parallel_map(get_json, urls,
+            max_workers or self.MAX_WORKERS)
+        return dict((url, resp) for url, resp in zip(urls, responses)
+            if errors is None or url not in errors)
+
+    def _build_datasets(self, plans, responses, profile=None, keep_raw=True):
+        """Return a dataset for each plan, from the responses by URL."""
         call_date = datetime.datetime.now().date()
-        return ModelledDataset(api_calls, data_interval=interval,
-            data_type=data_type, call_date=call_date)
+        datasets = []
+        for cls, data_type, interval, calls in plans:
+            api_calls = [dict(url=url, resp=responses[url], params=params)
+                for url, params in calls]
+            datasets.append(utils.build_dataset(profile, cls, api_calls,
+                data_interval=interval, data_type=data_type,
+                call_date=call_date, keep_raw=keep_raw, fetch=self.fetch))
+        return datasets
+
+    def _get_json(self, url, profile=None):
+        """Request a URL, and return the decoded JSON response. If a
+        CallProfile is given, the request is recorded in it.
+        """
+        if profile:
+            return profile.get_json(url, self.fetch, self._loads)
+        return self._loads(self.fetch(url))
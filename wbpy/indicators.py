@@ -1,39 +1,180 @@
 # -*- coding: utf-8 -*-
+import os
 import re
+import json
+import time
+import array
+import itertools
+import hashlib
 import datetime
-import pprint
-import urllib
-try:
-    import simplejson as json
-except ImportError:
-    import json
+from urllib import urlencode
 
 from . import utils
+from .search import IndicatorIndex, get_index
+
+
+# The common indicator codes that have been loaded from disk, by path:
+# (file mtime, codes). See IndicatorAPI._get_common_indicator_codes().
+_common_codes = {}
+
+
+def _parse_value(value):
+    """Convert an API value to float, or None if the value is missing."""
+    if value is None or value == "":
+        return None
+    return float(value)
+
+
+def _merge_responses(responses):
+    """Merge several decoded API responses (eg. pages) into one, in the same
+    ``[header, rows]`` form as a single-page response.
+    """
+    if len(responses) == 1:
+        return responses[0]
+    rows = []
+    for resp in responses:
+        # Empty responses have None rather than a list.
+        rows.extend(resp[1] or [])
+    header = dict(responses[0][0])
+    header.update(page=1, pages=1, per_page=len(rows), total=len(rows))
+    return [header, rows]
+
+
+def _split_date_range(date, years):
+    """Split an API date range, eg. ``1960:2020`` or ``2001M01:2010M12``,
+    into consecutive ranges that each cover up to ``years`` years.
+    """
+    match = re.match(r"^(\d{4})([MQ]\d+)?:(\d{4})([MQ]\d+)?$", str(date))
+    if not match:
+        raise ValueError("Can only split a date range, eg. 1960:2020, not %r"
+            % date)
+    start_year, start_suffix, end_year, end_suffix = match.groups()
+    start_year, end_year = int(start_year), int(end_year)
+
+    # Inner boundaries use the first and last period of the year.
+    frequency = (start_suffix or end_suffix or " ")[0]
+    first, last = {"M": ("M01", "M12"), "Q": ("Q1", "Q4")}.get(frequency,
+        ("", ""))
+
+    ranges = []
+    for chunk_start in range(start_year, end_year + 1, years):
+        chunk_end = min(chunk_start + years - 1, end_year)
+        start = "{0}{1}".format(chunk_start, first)
+        end = "{0}{1}".format(chunk_end, last)
+        if chunk_start == start_year:
+            start = "{0}{1}".format(start_year, start_suffix or "")
+        if chunk_end == end_year:
+            end = "{0}{1}".format(end_year, end_suffix or "")
+        ranges.append("{0}:{1}".format(start, end))
+    return ranges
+
+
+def _shift_date(date, periods):
+    """Move an API date, eg. ``2012``, ``2012M01`` or ``2012Q1``, by a number
+    of periods of its own frequency.
+    """
+    match = re.match(r"^(\d{4})(?:([MQ])(\d+))?$", date)
+    if not match:
+        raise ValueError("Unrecognised API date: %r" % date)
+    year, frequency, period = match.groups()
+    if not frequency:
+        return str(int(year) + periods)
+    per_year = 12 if frequency == "M" else 4
+    year, period = divmod(int(year) * per_year + int(period) - 1 + periods,
+        per_year)
+    if frequency == "M":
+        return "{0}M{1:02d}".format(year, period + 1)
+    return "{0}Q{1}".format(year, period + 1)
+
+
+def _latest_date(rows):
+    """Return the latest date of the ``(country, date, value)`` rows that
+    has a value, or the latest date of all the rows if none have values.
+    """
+    dates = [date for _, date, value in rows if value is not None]
+    return max(dates) if dates else max(date for _, date, _ in rows)
+
+
+def _last_date(date, year):
+    """Return the last period of ``year`` in the same frequency as the API
+    date ``date``.
+    """
+    frequency = date[4:5]
+    return "{0}{1}".format(year, {"M": "M12", "Q": "Q4"}.get(frequency, ""))
 
 
 class IndicatorDataset(object):
 
-    def __init__(self, json_resp, url=None, date_of_call=None):
+    CSV_HEADER = ("country", "date", "value")
+
+    def __init__(self, json_resp, url=None, date_of_call=None, keep_raw=True,
+            fetch=None, lazy=False, urls=None):
+        """
+        :param json_resp:
+            The decoded API response.
+
+        :param url:
+            The URL of the API call.
+
+        :param urls:
+            If ``json_resp`` was merged from several responses (eg. pages),
+            the URLs of all of them, in order. Defaults to ``[url]``. It's
+            set to None for datasets that can't be rehydrated.
+
+        :param date_of_call:
+            Date of the API call.
+
+        :param keep_raw:
+            If False, the values are parsed into a compact form and the raw
+            response is dropped, which uses much less memory. The raw
+            response can be requested again with ``rehydrate()``.
+
+        :param fetch:
+            Function used to request URLs, eg. by ``rehydrate()``. Defaults to
+            the cached ``utils.fetch``.
+
+        :param lazy:
+            If True, the rows aren't scanned until ``countries`` is accessed
+            or data is requested. Useful when only a few countries are needed
+            from a large response, eg. ``as_dict(country_codes=["GB"])``.
+
+        """
         self.api_url = url
+        self.api_urls = urls if urls else [url]
         self.api_call_date = date_of_call
         self.api_response = json_resp
 
-        # The country codes and names
-        self.countries = {}
-        for country_data in self.api_response[1]:
-            country_id = country_data["country"]["id"]
-            country_val = country_data["country"]["value"]
-            if country_id not in self.countries:
-                self.countries[country_id] = country_val
+        # The get_dataset() arguments that made the dataset, if known. Used
+        # by refresh().
+        self.api_params = None
+
+        # A utils.CallProfile, if the API call was profiled.
+        self.profile = None
+        self._fetch = fetch if fetch else utils.fetch
+        self._parsed = None
+
+        # The country codes and names, and the row offsets of each country.
+        self._countries = None
+        self._country_offsets = None
+        if not lazy:
+            self._index_countries()
 
         self.indicator_code = self.api_response[1][0]["indicator"]["id"]
         self.indicator_name = self.api_response[1][0]["indicator"]["value"]
 
         # For some use cases, it's nice to have direct access to all the
         # `get_indicator()` metadata (eg. the sources, full description).
-        # It won't always be wanted, so it's requested lazily.
+        # It won't always be wanted, so it's requested lazily.
         self._indicator_response = None
 
+        if not keep_raw:
+            # The compact form doesn't keep country names, so the countries
+            # are indexed first, even for lazy datasets.
+            if self._countries is None:
+                self._index_countries()
+            self._parsed = self._parse_response()
+            self.api_response = None
+
     def __repr__(self):
         s = "<%s.%s(%r, %r) with id: %r>"
         return s % (
@@ -45,6 +186,7 @@ class IndicatorDataset(object):
             )
 
     def __str__(self):
+        import pprint  # Only needed here, and slow to import.
         return pprint.pformat(self.as_dict())
 
     def dates(self, use_datetime=False):
@@ -55,22 +197,24 @@ class IndicatorDataset(object):
             strings.
 
         """
-        dates = []
-        for country_data in self.as_dict().values():
-            for date in country_data.keys():
-                if date not in dates:
-                    dates.append(date)
-
+        dates = list(set(date for _, date, _ in self.iter_rows()))
         if use_datetime:
-            dates = [utils.worldbank_date_to_datetime(d) for d in dates]
+            dates = utils.worldbank_dates_to_datetimes(dates)
 
         return sorted(dates)
 
+    @property
+    def countries(self):
+        """Dictionary of the dataset's country codes and names."""
+        if self._countries is None:
+            self._index_countries()
+        return self._countries
+
     @property
     def _indicator(self):
         """Lazy loading of the dataset's indicator metadata from the API."""
         if not self._indicator_response:
-            api = IndicatorAPI()
+            api = IndicatorAPI(fetch=self._fetch)
             indicators = api.get_indicators([self.indicator_code])
             self._indicator_response = indicators[self.indicator_code]
         return self._indicator_response
@@ -91,7 +235,7 @@ class IndicatorDataset(object):
     def indicator_topics(self):
         return self._indicator["topics"]
 
-    def as_dict(self, use_datetime=False):
+    def as_dict(self, use_datetime=False, country_codes=None):
         """Return dictionary of the dataset's data.
 
         Keys are: data[country_code][date]
@@ -99,12 +243,13 @@ class IndicatorDataset(object):
         :param use_datetime:
             Use datetime.date() object as the date key, rather than string.
 
+        :param country_codes:
+            Optional list of alpha-2 or alpha-3 codes. If given, only the rows
+            for these countries are converted.
+
         """
         clean_dict = {}
-        response_data = self.api_response[1]
-        for row in response_data:
-            country_id = row["country"]["id"]
-            date = row["date"]
+        for country_id, date, value in self.iter_rows(country_codes):
             if use_datetime:
                 date = utils.worldbank_date_to_datetime(date)
 
@@ -112,13 +257,224 @@ class IndicatorDataset(object):
                 clean_dict[country_id] = {}
             if date not in clean_dict[country_id]:
                 # Sometimes values are missing
-                if row["value"]:
-                    clean_dict[country_id][date] = float(row["value"])
-                else:
-                    clean_dict[country_id][date] = None
+                clean_dict[country_id][date] = value
 
         return clean_dict
 
+    def iter_rows(self, country_codes=None):
+        """Yield a (country_code, date, value) tuple for each row of the API
+        response, without building any intermediate structure. Missing
+        values are None.
+
+        :param country_codes:
+            Optional list of alpha-2 or alpha-3 codes. If given, only the rows
+            for these countries are yielded, grouped by country.
+
+        """
+        if country_codes is not None:
+            for offset in self._row_offsets(country_codes):
+                yield self._row(offset)
+        elif self._parsed:
+            for country_id, date, value in itertools.izip(*self._parsed):
+                # Missing values are stored as NaN in the compact form.
+                yield country_id, date, (None if value != value else value)
+        else:
+            for row in self.api_response[1]:
+                yield (row["country"]["id"], row["date"],
+                    _parse_value(row["value"]))
+
+    def rehydrate(self):
+        """Request the raw API response again (normally from the cache), for
+        a dataset that was created with ``keep_raw=False``.
+
+        :returns:
+            The decoded API response, which is also set as ``api_response``.
+
+        """
+        if self.api_response is None:
+            if self.api_urls is None:
+                raise ValueError("The dataset's raw response can't be "
+                    "requested again")
+            loads = utils.get_json_decoder()
+            responses = [loads(self._fetch(url)) for url in self.api_urls]
+            self.api_response = _merge_responses(responses)
+        return self.api_response
+
+    def refresh(self, overlap=1):
+        """Request only the newest periods of the dataset. See
+        ``IndicatorAPI.refresh()``.
+
+        :returns:
+            A new IndicatorDataset.
+
+        """
+        return IndicatorAPI(fetch=self._fetch).refresh(self, overlap)
+
+    def write_csv(self, fileobj, header=True):
+        """Stream the dataset to an open file as CSV.
+
+        The columns are ``country``, ``date`` and ``value``. Rows are written
+        as they are read from the response, in API order.
+
+        :param fileobj:
+            A file-like object opened for writing.
+
+        :param header:
+            If True, write a header row first.
+
+        """
+        utils.write_csv(fileobj, self.iter_rows(),
+            self.CSV_HEADER if header else None)
+
+    def to_frame(self, use_datetime=False):
+        """Return the dataset as a pandas DataFrame.
+
+        The index is a (country, date) MultiIndex, and the single column is
+        named after the indicator code. Missing values are NaN. Requires
+        pandas.
+
+        :param use_datetime:
+            Use datetime64 values for the date level, rather than strings.
+
+        """
+        pd = utils.import_optional("pandas")
+        countries, dates, values = self._columns()
+        index = pd.MultiIndex.from_arrays([countries, dates],
+            names=["country", "date"])
+        frame = pd.DataFrame({self.indicator_code: values}, index=index,
+            dtype=float)
+
+        # As with as_dict(), keep the first value if a date is repeated.
+        frame = frame[~frame.index.duplicated(keep="first")].sort_index()
+        if use_datetime:
+            frame.index = utils.datetime_index_level(frame.index, "date")
+        return frame
+
+    def to_parquet(self, path):
+        """Write the dataset to a parquet file. Requires pyarrow.
+
+        The columns are ``country``, ``country_name``, ``date``, ``value``,
+        ``indicator_code`` and ``indicator_name``, with the string columns
+        dictionary-encoded. The API URL and call date are stored in the file
+        metadata.
+
+        :param path:
+            Destination file path.
+
+        """
+        self._write_file(path, "parquet")
+
+    def to_feather(self, path):
+        """Write the dataset to a feather file. Requires pyarrow.
+
+        The columns are the same as for ``to_parquet()``.
+
+        :param path:
+            Destination file path.
+
+        """
+        self._write_file(path, "feather")
+
+    def _write_file(self, path, file_format):
+        countries, dates, values = self._columns()
+        row_count = len(values)
+        columns = [
+            ("country", "string", countries),
+            ("country_name", "string", [self.countries[c] for c in
+                countries]),
+            ("date", "string", dates),
+            ("value", "float64", values),
+            ("indicator_code", "string", [self.indicator_code] * row_count),
+            ("indicator_name", "string", [self.indicator_name] * row_count),
+            ]
+        metadata = {
+            "api_url": str(self.api_url),
+            "api_call_date": str(self.api_call_date),
+            }
+        utils.write_columns(path, columns, file_format, metadata)
+
+    def _columns(self):
+        """Return (country_codes, dates, values) lists, one item per row."""
+        if self._parsed:
+            countries, dates, values = self._parsed
+            return (list(countries), list(dates),
+                [None if value != value else value for value in values])
+        response_data = self.api_response[1]
+        countries = [row["country"]["id"] for row in response_data]
+        dates = [row["date"] for row in response_data]
+        values = [_parse_value(row["value"]) for row in response_data]
+        return countries, dates, values
+
+    def _raw_rows(self):
+        """Return the rows of the API response. For a dataset without the
+        raw response, equivalent rows are built from the compact form.
+        """
+        if self.api_response is not None:
+            return self.api_response[1]
+        indicator = {"id": self.indicator_code, "value": self.indicator_name}
+        return [{
+            "indicator": indicator,
+            "country": {"id": country_id,
+                "value": self.countries[country_id]},
+            "date": date,
+            "value": value,
+            } for country_id, date, value in self.iter_rows()]
+
+    def _index_countries(self):
+        """Build the country names and row offsets in one pass over the
+        rows. Values aren't converted.
+        """
+        countries = {}
+        offsets = {}
+        for offset, row in enumerate(self.api_response[1]):
+            country = row["country"]
+            country_id = country["id"]
+            if country_id not in offsets:
+                offsets[country_id] = []
+                countries[country_id] = country["value"]
+            offsets[country_id].append(offset)
+        self._countries = countries
+        self._country_offsets = offsets
+
+    def _row_offsets(self, country_codes):
+        """Return the row offsets for the given countries."""
+        if self._country_offsets is None:
+            self._index_countries()
+        offsets = []
+        for code in utils.convert_country_codes(country_codes, "alpha2"):
+            offsets.extend(self._country_offsets.get(code, []))
+        return offsets
+
+    def _row(self, offset):
+        """Return the (country_code, date, value) tuple for one row."""
+        if self._parsed:
+            countries, dates, values = self._parsed
+            value = values[offset]
+            return (countries[offset], dates[offset],
+                None if value != value else value)
+        row = self.api_response[1][offset]
+        return row["country"]["id"], row["date"], _parse_value(row["value"])
+
+    def _parse_response(self):
+        """Return the compact form of the response: lists of country codes
+        and dates, and an array of float values with NaN for missing values.
+
+        Each distinct code and date string is stored once and shared between
+        rows, rather than keeping one string object per row.
+        """
+        strings = {}
+        countries, dates = [], []
+        values = array.array("d")
+        nan = float("nan")
+        for row in self.api_response[1]:
+            country_id = row["country"]["id"]
+            date = row["date"]
+            countries.append(strings.setdefault(country_id, country_id))
+            dates.append(strings.setdefault(date, date))
+            value = _parse_value(row["value"])
+            values.append(nan if value is None else value)
+        return countries, dates, values
+
 
 class IndicatorAPI(object):
 
@@ -126,18 +482,53 @@ class IndicatorAPI(object):
     
     You can override the default tempfile cache by passing a function
     ``fetch``, which requests a URL and returns the response as a string. 
+
+    You can choose the JSON decoder by passing ``json_decoder``, either as a
+    module name (eg. ``orjson``) or a function. See
+    ``utils.get_json_decoder()``.
+
+    If you pass a ``mirror`` (see ``wbpy.mirror.IndicatorMirror``),
+    ``get_dataset()`` requests that the mirror covers are answered from it,
+    without any network requests.
+
+    If ``profile`` is True, or is None and the ``WBPY_PROFILE`` environment
+    variable is set, each dataset records the time spent on requests, the
+    cache, JSON parsing and building it as ``dataset.profile``. See
+    ``utils.CallProfile``.
     """
 
     BASE_URL = "http://api.worldbank.org/"
 
+    # The default number of requests that can be made at the same time.
+    MAX_WORKERS = 4
+
+    # The page of the main website that lists the common indicators, and
+    # the number of seconds to keep the codes found on it. The list changes
+    # much less often than the data.
+    COMMON_INDICATORS_URL = "http://data.worldbank.org/indicator/all"
+    COMMON_INDICATORS_TTL = 7 * 86400
+
+    # Longer lists of codes are split into several requests, to keep URLs
+    # short and to let the requests run in parallel.
+    MAX_CODES_PER_REQUEST = 50
+
     # The API uses some non-ISO 2-digit and 3-digit codes. Make them available.
     NON_STANDARD_REGIONS = utils.NON_STANDARD_REGIONS
 
-    def __init__(self, fetch=None):
-        self.fetch = fetch if fetch else utils.fetch
-
-    def get_dataset(self, indicator, country_codes=None,
-            **kwargs):
+    def __init__(self, fetch=None, json_decoder=None, mirror=None,
+            profile=None):
+        self.fetch = fetch if fetch else utils.fetch_bytes
+        self._loads = utils.get_json_decoder(json_decoder)
+        self.mirror = mirror
+        self.profile = profile
+        # Indexes for search_indicators(), and the common indicator codes,
+        # when they can't be saved in the cache directory.
+        self._indexes = {}
+        self._common_codes = None
+
+    def get_dataset(self, indicator, country_codes=None, keep_raw=True,
+            lazy=False, chunk_years=None, chunk_countries=None,
+            max_workers=None, **kwargs):
         """Request a dataset from the API.
 
         :param indicator:
@@ -145,7 +536,29 @@ class IndicatorAPI(object):
 
         :param country_codes:
             List of ISO 1366 alpha-2 or alpha-3 country codes. If None, returns
-            data for all countries.
+            data for all countries. Lists longer than
+            ``MAX_CODES_PER_REQUEST`` are split into several requests.
+
+        :param keep_raw:
+            If False, the dataset drops the raw JSON response after parsing
+            it, to save memory. See ``IndicatorDataset.rehydrate()``.
+
+        :param lazy:
+            If True, the dataset's rows are only scanned and converted when
+            data is requested. See ``IndicatorDataset``.
+
+        :param chunk_years:
+            If given, split the ``date`` range into requests that each cover
+            this many years. Large requests are slow for the API to serve, and
+            the chunks can be requested in parallel.
+
+        :param chunk_countries:
+            If given, split ``country_codes`` into requests with up to this
+            many countries each. See ``utils.chunk_codes()``.
+
+        :param max_workers:
+            The number of requests that can be made at the same time, for
+            chunks and extra pages. Defaults to ``MAX_WORKERS``.
 
         :param kwargs:
             The following map directly to the API query args:
@@ -156,23 +569,169 @@ class IndicatorAPI(object):
             ``frequency``
 
         :returns:
-            IndicatorDataset instance containing the dataset and metadata.
+            IndicatorDataset instance containing the dataset and metadata. All
+            pages and chunks of the response are merged into one dataset.
 
         """
-        if country_codes:
-            country_codes = [utils.convert_country_code(c, "alpha3") for c in
-                country_codes]
-            country_string = ";".join(country_codes)
+        if self.mirror and self.mirror.covers(indicator, country_codes,
+                **kwargs):
+            return self.mirror.get_dataset(indicator, country_codes,
+                keep_raw=keep_raw, lazy=lazy, **kwargs)
+
+        urls = self._dataset_urls(indicator, country_codes, chunk_years,
+            chunk_countries, **kwargs)
+        call_date = datetime.datetime.now().date()
+
+        # Individual chunks can be empty, as long as some data is returned.
+        profile = utils.new_profile(self.profile)
+        page_urls, responses = self._get_pages(urls, max_workers,
+            allow_empty=(len(urls) > 1), profile=profile)
+        json_resp = _merge_responses(responses)
+        if not json_resp[1]:
+            raise ValueError(utils.EXC_MSG % (urls[0], responses[0]))
+
+        dataset = utils.build_dataset(profile, IndicatorDataset, json_resp,
+            urls[0], call_date, keep_raw=keep_raw, fetch=self.fetch,
+            lazy=lazy, urls=page_urls)
+        dataset.api_params = dict(kwargs, indicator=indicator,
+            country_codes=country_codes)
+        return dataset
+
+    def refresh(self, dataset, overlap=1, keep_raw=None, lazy=False):
+        """Update a dataset from ``get_dataset()`` by requesting only its
+        newest periods, rather than the whole history.
+
+        The latest date in the dataset that has a value is found, and only
+        that date onwards is requested, up to the current year, in the same
+        frequency. Later dates with no values are requested again, as they
+        may have been published since. Any ``mrv`` or ``gapfill`` argument of
+        the original call is dropped. Requested rows replace existing rows
+        for the same country and date.
+
+        The request runs to the current year even if the original ``date``
+        range ended earlier, and the refreshed dataset's ``api_params`` have
+        the extended range. The merged response doesn't come from any single
+        set of URLs, so refreshed datasets can't be rehydrated.
+
+        :param dataset:
+            An IndicatorDataset returned by ``get_dataset()``.
+
+        :param overlap:
+            The number of the latest periods held to request again, to pick
+            up recent revisions. If 0, only newer periods are requested.
+
+        :param keep_raw:
+            As for ``get_dataset()``. Defaults to the setting of ``dataset``.
+
+        :param lazy:
+            As for ``get_dataset()``.
+
+        :returns:
+            A new IndicatorDataset with the merged rows.
+
+        """
+        if not dataset.api_params:
+            raise ValueError("Can only refresh a dataset from get_dataset()")
+        kwargs = dict(dataset.api_params)
+        indicator = kwargs.pop("indicator")
+        country_codes = kwargs.pop("country_codes")
+        for key in ["mrv", "gapfill", "date"]:
+            kwargs.pop(key, None)
+        if keep_raw is None:
+            keep_raw = dataset.api_response is not None
+
+        # Request from the latest date with a value, up to the current year.
+        # The API has null rows for periods that aren't published yet, which
+        # need to be requested again.
+        latest = _latest_date(list(dataset.iter_rows()))
+        start = _shift_date(latest, 1 - overlap)
+        call_date = datetime.datetime.now().date()
+        end = _last_date(latest, call_date.year)
+        profile = utils.new_profile(self.profile)
+        if start <= end:
+            kwargs["date"] = "{0}:{1}".format(start, end)
+            urls = self._dataset_urls(indicator, country_codes, **kwargs)
+            page_urls, responses = self._get_pages(urls, allow_empty=True,
+                profile=profile)
+            new_rows = _merge_responses(responses)[1] or []
+            header = dict(responses[0][0])
         else:
-            country_string = "all"
+            # Nothing is requested, but a new dataset is still returned.
+            new_rows, header = [], {}
+
+        # New rows come first, so they take precedence in as_dict(), and in
+        # rehydrate(), which merges the URLs in the same order.
+        updated = set((row["country"]["id"], row["date"]) for row in new_rows)
+        rows = new_rows + [row for row in dataset._raw_rows() if
+            (row["country"]["id"], row["date"]) not in updated]
+        header.update(page=1, pages=1, per_page=len(rows), total=len(rows))
+
+        refreshed = utils.build_dataset(profile, IndicatorDataset,
+            [header, rows], dataset.api_url, call_date, keep_raw=keep_raw,
+            fetch=self.fetch, lazy=lazy)
+        refreshed.api_urls = None
+        refreshed.api_params = dict(dataset.api_params)
+        date_range = dataset.api_params.get("date")
+        if date_range:
+            refreshed.api_params["date"] = "{0}:{1}".format(
+                str(date_range).partition(":")[0], end)
+        return refreshed
+
+    def iter_dataset_pages(self, indicator, country_codes=None, page_size=1000,
+            **kwargs):
+        """Request a dataset one page at a time.
 
-        url = "countries/{0}/indicators/{1}?".format(country_string,
-                indicator)
-        url = self._generate_indicators_url(url, dataset_params=True, **kwargs)
+        Takes the same arguments as ``get_dataset()``, and yields one
+        IndicatorDataset per page of the API response. Each page is only
+        requested when the previous one has been consumed, so large datasets
+        can be processed without holding them in memory. Long lists of
+        country codes are split into several requests, as for
+        ``get_dataset()``, and their pages follow each other.
+
+        :param page_size:
+            The number of rows in each page.
+
+        """
+        urls = self._dataset_urls(indicator, country_codes,
+            page_size=page_size, **kwargs)
         call_date = datetime.datetime.now().date()
-        json_resp = json.loads(self.fetch(url))
-        self._raise_if_bad_response(json_resp, url)
-        return IndicatorDataset(json_resp, url, call_date)
+        # Individual chunks can be empty, as long as some data is returned.
+        allow_empty = len(urls) > 1
+        found_data = False
+        for url in urls:
+            page, pages = 1, 1
+            while page <= pages:
+                page_url = url if page == 1 else url + "&page={0}".format(
+                    page)
+                json_resp = self._get_json(page_url, allow_empty)
+                pages = int(json_resp[0]["pages"])
+                if json_resp[1]:
+                    found_data = True
+                    yield IndicatorDataset(json_resp, page_url, call_date,
+                        fetch=self.fetch)
+                page += 1
+        if not found_data:
+            raise ValueError(utils.EXC_MSG % (urls[0], json_resp))
+
+    def write_dataset_csv(self, fileobj, indicator, country_codes=None,
+            page_size=1000, **kwargs):
+        """Stream a dataset to an open file as CSV, one page at a time.
+
+        Takes the same arguments as ``get_dataset()``. Only one page of the
+        response is held in memory at once. The columns are the same as for
+        ``IndicatorDataset.write_csv()``.
+
+        :param fileobj:
+            A file-like object opened for writing.
+
+        :param page_size:
+            The number of rows to request in each page.
+
+        """
+        pages = self.iter_dataset_pages(indicator, country_codes,
+            page_size=page_size, **kwargs)
+        for page_number, dataset in enumerate(pages):
+            dataset.write_csv(fileobj, header=(page_number == 0))
 
     def get_indicators(self, indicator_codes=None, search=None,
             search_full=False, common_only=False, **kwargs):
@@ -214,26 +773,68 @@ class IndicatorAPI(object):
             **kwargs)
 
         if common_only:
-            # Compile a list of codes that are on the main website (and have
-            # better data coverage), and filter out any results that cannot be
-            # found on the site.
-            page = self.fetch("http://data.worldbank.org/indicator/all")
-            ind_codes = re.compile("(?<=http://data.worldbank.org/indicator/)"
-                                   "[A-Za-z0-9\.]+(?=\">)")
+            # Filter out any results that cannot be found on the main website
+            # (and have worse data coverage). A result matches if its code,
+            # or the start of its code, is on the site.
+            common_codes = self._get_common_indicator_codes()
             common_matches = {}
-            code_matches = set([code.lower() for code in
-                                ind_codes.findall(page)])
-            # If key matches common code, include in results.
             for k, v in results.items():
                 low_k = k.lower()
-                for code_match in code_matches:
-                    if code_match in low_k:
+                for end in range(len(low_k), 0, -1):
+                    if low_k[:end] in common_codes:
                         common_matches[k] = v
                         break
             return common_matches
         else:
             return results
 
+    def search_indicators(self, query, limit=None, path=None, **kwargs):
+        """Search the indicator catalog with an index of the indicators'
+        codes, names, topics, sources and source notes.
+
+        The index is built from the ``get_indicators()`` results the first
+        time, and saved in the cache directory. It's only rebuilt when it's
+        older than the cache, so most searches don't request or scan the
+        catalog. An API with its own ``fetch`` function doesn't use the cache
+        directory, so its index is kept in memory instead. See
+        ``IndicatorIndex.search()`` for the query syntax.
+
+        :param query:
+            The search string, eg. ``"urban popul*"``.
+
+        :param limit:
+            If given, return at most this many codes.
+
+        :param path:
+            Where to save the index. Defaults to a file in the cache
+            directory, for the default ``fetch`` function.
+
+        :param kwargs:
+            Passed to ``get_indicators()``, eg. ``language`` or ``source``.
+
+        :returns:
+            List of matching indicator codes, best matches first. The names
+            are in ``get_indicator_index().names``.
+
+        """
+        index = self.get_indicator_index(path, **kwargs)
+        return index.search(query, limit)
+
+    def get_indicator_index(self, path=None, **kwargs):
+        """Return the ``IndicatorIndex`` used by
+        ``search_indicators()``, with the same arguments.
+        """
+        build = lambda: IndicatorIndex.build(self.get_indicators(**kwargs))
+        if path is None:
+            path = self._cache_path("indicator_index_{0}.json",
+                sorted(kwargs.items()))
+        if path is None:
+            key = repr(sorted(kwargs.items()))
+            if key not in self._indexes:
+                self._indexes[key] = build()
+            return self._indexes[key]
+        return get_index(path, build)
+
     def get_countries(self, country_codes=None, search=None,
             search_full=False, **kwargs):
         """Request country metadata.
@@ -242,6 +843,8 @@ class IndicatorAPI(object):
 
         :param country_codes:
             List of alpha-2 or alpha-3 codes. If None, queries all countries.
+            Lists longer than ``MAX_CODES_PER_REQUEST`` are split into
+            several requests.
 
         :param search:
             Regexp string to filter out non-matching results.
@@ -266,8 +869,8 @@ class IndicatorAPI(object):
             "search_key": "name",
             }
         if country_codes:
-            country_codes = [utils.convert_country_code(c, "alpha3") for c in
-                country_codes]
+            country_codes = utils.convert_country_codes(country_codes,
+                "alpha3")
 
         return self._get_indicator_data(func_params,
             country_codes, search=search, search_full=search_full,
@@ -500,11 +1103,59 @@ class IndicatorAPI(object):
                     search_matches[k] = v
         return search_matches
 
+    def _dataset_urls(self, indicator, country_codes=None, chunk_years=None,
+            chunk_countries=None, page_size=10000, **kwargs):
+        """Return the URLs for a ``get_dataset()`` request, split into chunks
+        of countries and date ranges if required.
+        """
+        if chunk_countries and not country_codes:
+            raise ValueError("chunk_countries requires country_codes")
+        country_chunks = [country_codes]
+        if country_codes:
+            chunk_size = chunk_countries or self.MAX_CODES_PER_REQUEST
+            if len(country_codes) > chunk_size or chunk_countries:
+                # Convert first, so that alpha-2 and alpha-3 codes for the
+                # same country end up in the same chunk.
+                codes = utils.convert_country_codes(country_codes, "alpha3")
+                country_chunks = utils.chunk_codes(codes, chunk_size)
+
+        date_chunks = [None]
+        date_key = None
+        if chunk_years:
+            date_keys = [k for k in kwargs if k.lower() == "date"]
+            if not date_keys:
+                raise ValueError("chunk_years requires a date range")
+            date_key = date_keys[0]
+            date_chunks = _split_date_range(kwargs[date_key], chunk_years)
+
+        urls = []
+        for countries, date in itertools.product(country_chunks, date_chunks):
+            if date_key:
+                kwargs[date_key] = date
+            urls.append(self._dataset_url(indicator, countries, page_size,
+                **kwargs))
+        return urls
+
+    def _dataset_url(self, indicator, country_codes=None, page_size=10000,
+            **kwargs):
+        """Return the URL for a ``get_dataset()`` request."""
+        if country_codes:
+            country_codes = utils.convert_country_codes(country_codes,
+                "alpha3")
+            country_string = ";".join(country_codes)
+        else:
+            country_string = "all"
+
+        url = "countries/{0}/indicators/{1}?".format(country_string,
+                indicator)
+        return self._generate_indicators_url(url, dataset_params=True,
+            page_size=page_size, **kwargs)
 
     def _generate_indicators_url(
         self,
         rest_url,
         dataset_params=False,
+        page_size=10000,
         **kwargs):
         """Add API root and query string options to an otherwise complete
         endpoint.
@@ -515,12 +1166,15 @@ class IndicatorAPI(object):
         :param dataset_params:
             Add query values that are only relevant to the get_dataset() call.
 
+        :param page_size:
+            The ``per_page`` value. This can't be set through kwargs.
+
         """
         kwargs = dict([(k.lower(), v) for k, v in kwargs.items()])
         assert not ("topic" in kwargs and "source" in kwargs)
 
         # Fix any API options that shouldn't be accessible via wbpy.
-        fixed_options = {"format": "json", "per_page": "10000"}
+        fixed_options = {"format": "json", "per_page": str(page_size)}
         banned_options = ["page"]
         kwargs.update(fixed_options)
         for k in banned_options:
@@ -555,28 +1209,42 @@ class IndicatorAPI(object):
         # always generate the same URL (for caching purposes), so need to
         # convert to a sorted list before passing to urlencode().
         sorted_kwargs = sorted([(k, v) for k, v in kwargs.items()])
-        query_string = urllib.urlencode(sorted_kwargs)
+        query_string = urlencode(sorted_kwargs)
 
         new_url = "".join([self.BASE_URL, rest_url, query_string])
         return new_url
 
-    def _get_api_response_as_json(self, url):
-        """Return JSON content from Indicators URL.
+    def _get_pages(self, urls, max_workers=None, allow_empty=False,
+            profile=None):
+        """Request every page of each URL.
 
-        Concatenates the returned list if request requires multiple-page
-        responses.
+        The first page of each URL is requested, and then all the remaining
+        pages, with up to ``max_workers`` requests at a time. If a
+        CallProfile is given, each request is recorded in it.
+
+        :returns:
+            Tuple of (page_urls, responses), both in URL and page order.
 
         """
-        web_page = self.fetch(url)
-        json_resp = json.loads(web_page)
-        self._raise_if_bad_response(json_resp, url)
-        header = json_resp[0]
-        content = json_resp[1]
-        current_page = header["page"]
-        if current_page < header["pages"]:
-            next_page = url + "&page={0}".format(current_page + 1)
-            content += self._get_api_response_as_json(next_page)
-        return content
+        max_workers = max_workers or self.MAX_WORKERS
+        get_json = lambda url: self._get_json(url, allow_empty, profile)
+        first_pages = utils.parallel_map(get_json, urls, max_workers)
+
+        other_urls = []
+        for url, resp in zip(urls, first_pages):
+            other_urls.append([url + "&page={0}".format(page) for page in
+                range(2, int(resp[0]["pages"]) + 1)])
+        other_pages = iter(utils.parallel_map(get_json,
+            itertools.chain(*other_urls), max_workers))
+
+        page_urls, responses = [], []
+        for url, first_page, url_group in zip(urls, first_pages, other_urls):
+            page_urls.append(url)
+            responses.append(first_page)
+            for page_url in url_group:
+                page_urls.append(page_url)
+                responses.append(next(other_pages))
+        return page_urls, responses
 
     def _get_indicator_data(self, func_params, api_ids, search=None,
             search_full=False, **kwargs):
@@ -600,14 +1268,20 @@ class IndicatorAPI(object):
             Dictionary with keys that are the given response_key for the API
             response.
         """
-        # Make the URL and call the JSON data.
+        # Make the URLs and call the JSON data. Long lists of IDs are split
+        # into several requests.
         if api_ids:
-            rest_string = ";".join([str(x) for x in api_ids])
-            url = "{0}/{1}?".format(func_params["rest_url"], rest_string)
+            id_chunks = [[str(x) for x in api_ids]]
+            if len(api_ids) > self.MAX_CODES_PER_REQUEST:
+                id_chunks = utils.chunk_codes(id_chunks[0],
+                    self.MAX_CODES_PER_REQUEST)
+            urls = ["{0}/{1}?".format(func_params["rest_url"], ";".join(ids))
+                for ids in id_chunks]
         else:
-            url = "{0}?".format(func_params["rest_url"])
-        url = self._generate_indicators_url(url, **kwargs)
-        world_bank_response = self._get_api_response_as_json(url)
+            urls = ["{0}?".format(func_params["rest_url"])]
+        urls = [self._generate_indicators_url(url, **kwargs) for url in urls]
+        page_urls, responses = self._get_pages(urls)
+        world_bank_response = _merge_responses(responses)[1]
 
         # Use the 'response_key' value as the top-level key for the dictionary.
         filtered_data = {}
@@ -628,6 +1302,79 @@ class IndicatorAPI(object):
                     func_params["search_key"])
         return filtered_data
 
-    def _raise_if_bad_response(self, json_resp, url):
-        if json_resp[0].get("pages") == 0 or json_resp[0].get("message"):
+    def _get_json(self, url, allow_empty=False, profile=None):
+        """Request a URL, and return the decoded JSON response.
+
+        :param allow_empty:
+            If True, don't raise an exception for a response with no data.
+
+        :param profile:
+            If given, a CallProfile to record the request in.
+
+        """
+        if profile:
+            json_resp = profile.get_json(url, self.fetch, self._loads)
+        else:
+            json_resp = self._loads(self.fetch(url))
+        self._raise_if_bad_response(json_resp, url, allow_empty)
+        return json_resp
+
+    def _get_common_indicator_codes(self):
+        """Return the set of lower-case indicator codes that are on the main
+        World Bank website.
+
+        The page is only requested and parsed when the saved codes are older
+        than ``COMMON_INDICATORS_TTL``. The codes are saved in the cache
+        directory, and are only loaded from disk once. An API with its own
+        ``fetch`` function keeps the codes in memory instead.
+        """
+        path = self._cache_path("common_indicators_{0}.json",
+            self.COMMON_INDICATORS_URL)
+        if path is None:
+            if self._common_codes is None:
+                self._common_codes = self._parse_common_indicator_codes()
+            return self._common_codes
+        if (os.path.exists(path) and time.time() - os.path.getmtime(path) <
+                self.COMMON_INDICATORS_TTL):
+            mtime = os.path.getmtime(path)
+            if _common_codes.get(path, (None,))[0] == mtime:
+                return _common_codes[path][1]
+            with open(path, "rb") as f:
+                codes = set(utils.get_json_decoder()(f.read()))
+        else:
+            codes = self._parse_common_indicator_codes()
+            utils._cache_response(json.dumps(sorted(codes)),
+                self.COMMON_INDICATORS_URL, path)
+        _common_codes[path] = (os.path.getmtime(path), codes)
+        return codes
+
+    def _parse_common_indicator_codes(self):
+        """Request the website's indicator page, and return the set of
+        lower-case indicator codes on it.
+        """
+        page = self.fetch(self.COMMON_INDICATORS_URL)
+        if isinstance(page, bytes):
+            page = page.decode("utf-8")
+        ind_codes = re.compile("(?<=http://data.worldbank.org/indicator/)"
+                               "[A-Za-z0-9\\.]+(?=\">)")
+        return set([code.lower() for code in ind_codes.findall(page)])
+
+    def _cache_path(self, name, *key):
+        """Return a path in the cache directory for data derived from this
+        API's responses, where ``name`` has a ``{0}`` for a hash of the key
+        and ``BASE_URL``.
+
+        Returns None if the API has its own ``fetch`` function, which
+        replaces the cache, so that data from another source isn't saved
+        for later sessions.
+        """
+        if self.fetch not in [utils.fetch, utils.fetch_bytes]:
+            return None
+        key = hashlib.md5(repr((self.BASE_URL,) + key).encode("utf-8"))
+        return os.path.join(utils.get_cache_dir(),
+            name.format(key.hexdigest()))
+
+    def _raise_if_bad_response(self, json_resp, url, allow_empty=False):
+        if json_resp[0].get("message") or (not allow_empty and
+                json_resp[0].get("pages") == 0):
             raise ValueError(utils.EXC_MSG % (url, json_resp))
@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+"""A local SQLite copy of chosen indicator datasets.
+
+Datasets are added to the mirror once, and then kept up to date with
+``sync()``, which only requests the newest periods of each indicator (see
+``IndicatorAPI.refresh()``). An IndicatorAPI created with ``mirror=...``
+answers ``get_dataset()`` from the mirror where it can, without any network
+requests.
+
+The mirror can also be managed from the command line::
+
+    python -m wbpy.mirror mirror.db add SP.POP.TOTL -c GB,AR
+    python -m wbpy.mirror mirror.db sync
+    python -m wbpy.mirror mirror.db list
+
+"""
+import re
+import sys
+import json
+import sqlite3
+import datetime
+import optparse
+
+from . import utils
+from .indicators import IndicatorAPI, IndicatorDataset, _last_date
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS indicators (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    params TEXT,
+    synced TEXT
+);
+CREATE TABLE IF NOT EXISTS countries (
+    id TEXT PRIMARY KEY,
+    name TEXT
+);
+CREATE TABLE IF NOT EXISTS observations (
+    indicator TEXT,
+    country TEXT,
+    date TEXT,
+    value REAL,
+    PRIMARY KEY (indicator, country, date)
+);
+"""
+
+
+class IndicatorMirror(object):
+
+    """A local SQLite copy of chosen indicator datasets.
+
+    :param path:
+        Path of the SQLite database file. It's created if it doesn't exist.
+
+    :param api:
+        The IndicatorAPI used by ``add()`` and ``sync()``. It shouldn't be an
+        API that answers from this mirror. Defaults to a new IndicatorAPI.
+
+    """
+
+    # The get_dataset() arguments that can be answered from the mirror.
+    QUERY_ARGS = ["date"]
+
+    def __init__(self, path, api=None):
+        self.path = path
+        self.api = api if api else IndicatorAPI()
+        self._db = sqlite3.connect(path)
+        self._db.executescript(SCHEMA)
+
+    def __contains__(self, indicator):
+        return self._params(indicator) is not None
+
+    def close(self):
+        self._db.close()
+
+    def indicators(self):
+        """Return a dictionary of the mirrored indicator codes, and the date
+        each was last synced.
+        """
+        rows = self._db.execute("SELECT id, synced FROM indicators")
+        return dict(rows.fetchall())
+
+    def add(self, indicator, country_codes=None, **kwargs):
+        """Request a dataset, and add it to the mirror. Any existing data for
+        the indicator is replaced.
+
+        Takes the same arguments as ``IndicatorAPI.get_dataset()``, which are
+        stored and used again by ``sync()``. Only datasets added with a
+        ``date`` range can answer ``get_dataset()`` calls for an
+        IndicatorAPI; see ``covers()``.
+
+        :returns:
+            The number of rows stored.
+
+        """
+        dataset = self.api.get_dataset(indicator, country_codes, **kwargs)
+        dates = [v for k, v in kwargs.items() if k.lower() == "date"]
+        covered = _date_range(dates[0]) if dates else None
+        with self._db:
+            self._db.execute("DELETE FROM observations WHERE indicator = ?",
+                (indicator,))
+            return self._store(dataset, covered=covered)
+
+    def load(self, rows, country_codes=None, batch_size=10000):
+        """Store rows from another source, eg. ``wbpy.bulk.iter_rows()``,
+        without any requests. Rows are written in batches, so ``rows`` can be
+        a generator over more data than fits in memory.
+
+        :param rows:
+            Iterable of ``(indicator_code, indicator_name, country_code,
+            country_name, date, value)`` tuples, with the API's country codes.
+
+        :param country_codes:
+            The countries that the rows cover, which ``sync()`` requests
+            updates for. If None, updates are requested for all countries.
+
+        :returns:
+            The number of rows stored.
+
+        """
+        indicators, countries = {}, {}
+        covered = {}
+        batch = []
+        count = 0
+        with self._db:
+            for (indicator_code, indicator_name, country_code, country_name,
+                    date, value) in rows:
+                indicators[indicator_code] = indicator_name
+                countries[country_code] = country_name
+                first, last = covered.get(indicator_code, (date, date))
+                covered[indicator_code] = (min(first, date), max(last, date))
+                batch.append((indicator_code, country_code, date, value))
+                if len(batch) >= batch_size:
+                    count += self._store_observations(batch)
+                    batch = []
+            count += self._store_observations(batch)
+            self._db.executemany("INSERT OR REPLACE INTO countries"
+                " VALUES (?, ?)", countries.items())
+            load_date = str(datetime.datetime.now().date())
+            self._db.executemany("INSERT OR REPLACE INTO indicators"
+                " VALUES (?, ?, ?, ?)", [(code, name, json.dumps(
+                dict(indicator=code, country_codes=country_codes,
+                covered=list(covered[code]))), load_date)
+                for code, name in indicators.items()])
+        return count
+
+    def sync(self, indicators=None, overlap=1):
+        """Bring mirrored indicators up to date, by requesting only the
+        periods from the latest date with a value up to the current year, so
+        that periods stored as nulls are filled in once they're published.
+        See ``IndicatorAPI.refresh()``.
+
+        :param indicators:
+            List of indicator codes to sync. Defaults to all of them.
+
+        :param overlap:
+            The number of the latest periods held to request again, to pick
+            up recent revisions.
+
+        :returns:
+            The number of rows that were added or changed.
+
+        """
+        if indicators is None:
+            indicators = sorted(self.indicators())
+        changed = 0
+        for indicator in indicators:
+            params = self._params(indicator)
+            dataset = self._dataset(indicator, params.get("country_codes"))
+            dataset.api_params = params
+            refreshed = self.api.refresh(dataset, overlap, keep_raw=False)
+            # The requested periods are held now, even those with no data.
+            covered = self._covered(indicator)
+            if covered:
+                latest = max(date for _, date, _ in dataset.iter_rows())
+                end = _last_date(latest, datetime.datetime.now().year)
+                covered = covered[0], max(covered[1], end, key=_end_key)
+            with self._db:
+                changed += self._store(refreshed, dataset, covered)
+        return changed
+
+    def covers(self, indicator, country_codes=None, **kwargs):
+        """Return True if a ``get_dataset()`` request with these arguments
+        can be answered from the mirror.
+
+        The request needs a ``date`` within the range that was added or
+        loaded (and since synced), for countries that are mirrored. Without
+        a date, the API returns only the most recent value of each country,
+        which the mirror doesn't track.
+        """
+        params = self._params(indicator)
+        if params is None or set(kwargs) - set(self.QUERY_ARGS):
+            return False
+        covered = self._covered(indicator)
+        if "date" not in kwargs or not covered:
+            return False
+        start, end = _date_range(kwargs["date"])
+        held_start, held_end = covered
+        if start < held_start or _end_key(end) > _end_key(held_end):
+            return False
+        if not params.get("country_codes"):
+            return True
+        if country_codes is None:
+            return False
+        held = set(utils.convert_country_codes(params["country_codes"],
+            "alpha2"))
+        return held.issuperset(utils.convert_country_codes(country_codes,
+            "alpha2"))
+
+    def get_dataset(self, indicator, country_codes=None, keep_raw=True,
+            lazy=False, date=None):
+        """Return a mirrored dataset, with the same arguments as
+        ``IndicatorAPI.get_dataset()``. The lookup uses the mirror's index on
+        indicator, country and date.
+
+        Datasets from the mirror can be refreshed, but not rehydrated.
+
+        :param date:
+            Optional API date or date range, eg. ``2005`` or ``1960:2020``.
+
+        """
+        params = self._params(indicator)
+        if params is None:
+            raise KeyError("Indicator isn't mirrored: %r" % indicator)
+        dataset = self._dataset(indicator, country_codes, date, keep_raw,
+            lazy)
+        dataset.api_params = dict(params)
+        if country_codes:
+            dataset.api_params["country_codes"] = country_codes
+        if date:
+            dataset.api_params["date"] = date
+        return dataset
+
+    def _params(self, indicator):
+        """Return the ``get_dataset()`` arguments of a mirrored indicator."""
+        params = self._stored_params(indicator)
+        if params is not None:
+            params.pop("covered", None)
+        return params
+
+    def _covered(self, indicator):
+        """Return the ``(start, end)`` API dates that are held for an
+        indicator, or None if they aren't known.
+        """
+        covered = (self._stored_params(indicator) or {}).get("covered")
+        return tuple(covered) if covered else None
+
+    def _stored_params(self, indicator):
+        row = self._db.execute("SELECT params FROM indicators WHERE id = ?",
+            (indicator,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _dataset(self, indicator, country_codes=None, date=None,
+            keep_raw=True, lazy=False):
+        """Build an IndicatorDataset from the mirrored rows."""
+        sql = ("SELECT o.country, c.name, o.date, o.value, i.name"
+            " FROM observations o"
+            " JOIN countries c ON c.id = o.country"
+            " JOIN indicators i ON i.id = o.indicator"
+            " WHERE o.indicator = ?")
+        args = [indicator]
+        if country_codes:
+            codes = utils.convert_country_codes(country_codes, "alpha2")
+            sql += " AND o.country IN (%s)" % ", ".join("?" * len(codes))
+            args.extend(codes)
+        if date:
+            start, _, end = str(date).partition(":")
+            end = end or start
+            sql += " AND o.date >= ?"
+            args.append(start)
+            # A bare year also includes its months and quarters.
+            if re.match(r"^\d{4}$", end):
+                sql += " AND o.date < ?"
+                args.append(str(int(end) + 1))
+            else:
+                sql += " AND o.date <= ?"
+                args.append(end)
+        sql += " ORDER BY o.country, o.date DESC"
+
+        rows = [{
+            "indicator": {"id": indicator, "value": indicator_name},
+            "country": {"id": country_id, "value": country_name},
+            "date": row_date,
+            "value": value,
+            } for country_id, country_name, row_date, value, indicator_name in
+            self._db.execute(sql, args)]
+        url = "sqlite:{0}?indicator={1}".format(self.path, indicator)
+        if not rows:
+            raise ValueError("No mirrored data for the query: %s %s"
+                % (url, args))
+        header = dict(page=1, pages=1, per_page=len(rows), total=len(rows))
+        dataset = IndicatorDataset([header, rows], url,
+            datetime.datetime.now().date(), keep_raw=keep_raw, lazy=lazy)
+        dataset.api_urls = None
+        return dataset
+
+    def _store(self, dataset, previous=None, covered=None):
+        """Write a dataset's rows and metadata. If ``previous`` is given,
+        only rows that differ from it are written. ``covered`` is the
+        ``(start, end)`` date range that the dataset holds, if known.
+
+        :returns:
+            The number of rows written.
+
+        """
+        held = previous.as_dict() if previous else {}
+        rows = [(dataset.indicator_code, country_id, date, value) for
+            country_id, date, value in dataset.iter_rows() if
+            held.get(country_id, {}).get(date, False) != value]
+        self._store_observations(rows)
+        self._db.executemany("INSERT OR REPLACE INTO countries VALUES (?, ?)",
+            dataset.countries.items())
+        self._db.execute("INSERT OR REPLACE INTO indicators"
+            " VALUES (?, ?, ?, ?)", (dataset.indicator_code,
+            dataset.indicator_name, json.dumps(dict(dataset.api_params,
+            covered=covered)), str(dataset.api_call_date)))
+        return len(rows)
+
+    def _store_observations(self, rows):
+        self._db.executemany("INSERT OR REPLACE INTO observations"
+            " VALUES (?, ?, ?, ?)", rows)
+        return len(rows)
+
+
+def _date_range(date):
+    """Return the ``(start, end)`` API dates of a ``date`` argument, eg.
+    ``2005`` or ``1960:2020``.
+    """
+    start, _, end = str(date).partition(":")
+    return start, end or start
+
+
+def _end_key(date):
+    """Return a sort key for the end of a date range. A bare year includes
+    all of its months and quarters, so it sorts after them.
+    """
+    return date + "Z" if re.match(r"^\d{4}$", date) else date
+
+
+def main(args=None):
+    parser = optparse.OptionParser(
+        usage="%prog PATH add INDICATOR [INDICATOR ...]\n"
+        "       %prog PATH sync [INDICATOR ...]\n"
+        "       %prog PATH list",
+        description="Manage a local mirror of World Bank indicators.")
+    parser.add_option("-c", "--countries",
+        help="comma-separated country codes to add (default: all)")
+    parser.add_option("-d", "--date", help="date range to add, eg. 1960:2020")
+    parser.add_option("-o", "--overlap", type="int", default=1,
+        help="latest periods to request again when syncing (default: 1)")
+    options, args = parser.parse_args(args)
+    if len(args) < 2 or args[1] not in ["add", "sync", "list"]:
+        parser.error("expected a PATH and a command")
+    path, command, indicators = args[0], args[1], args[2:]
+
+    mirror = IndicatorMirror(path)
+    try:
+        if command == "add":
+            if not indicators:
+                parser.error("add needs at least one indicator code")
+            kwargs = {}
+            if options.countries:
+                kwargs["country_codes"] = options.countries.split(",")
+            if options.date:
+                kwargs["date"] = options.date
+            for indicator in indicators:
+                rows = mirror.add(indicator, **kwargs)
+                sys.stdout.write("%s: %d rows\n" % (indicator, rows))
+        elif command == "sync":
+            rows = mirror.sync(indicators or None, options.overlap)
+            sys.stdout.write("%d rows changed\n" % rows)
+        else:
+            for indicator, synced in sorted(mirror.indicators().items()):
+                sys.stdout.write("%s\t%s\n" % (indicator, synced))
+    finally:
+        mirror.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""An inverted index for searching the indicator catalog.
+
+The index maps each word in the indicators' codes, names, topics, sources and
+source notes to the indicators that contain it. It's built once from the
+``IndicatorAPI.get_indicators()`` results and saved as a JSON file, so that
+searches don't need to scan the whole catalog. See
+``IndicatorAPI.search_indicators()``.
+"""
+import os
+import re
+import json
+import math
+import time
+import bisect
+import tempfile
+
+from . import utils
+
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Indexes that have been loaded from disk, by path: (file mtime, index).
+_loaded_indexes = {}
+
+
+def tokenize(text):
+    """Return the lower-case words in a string."""
+    return _WORD_RE.findall(text.lower())
+
+
+class IndicatorIndex(object):
+
+    """An inverted index over indicator metadata.
+
+    :param names:
+        Dictionary of the indicator names, using codes as keys.
+
+    :param postings:
+        Dictionary that maps each word to a dictionary of the indicators
+        that contain it, and the word's weight for each.
+
+    """
+
+    # The weight of a word in each field. A word counts once per field, so
+    # that long source notes don't outweigh the name.
+    FIELD_WEIGHTS = {
+        "id": 4.0,
+        "name": 3.0,
+        "topics": 2.0,
+        "source": 1.0,
+        "sourceOrganization": 1.0,
+        "sourceNote": 1.0,
+        }
+
+    def __init__(self, names, postings):
+        self.names = names
+        self.postings = postings
+        self._words = sorted(postings)
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def build(cls, indicators):
+        """Build an index from the results of ``get_indicators()``."""
+        names = {}
+        postings = {}
+        for code, metadata in indicators.items():
+            names[code] = metadata.get("name")
+            fields = dict(metadata, id=code)
+            for field, weight in cls.FIELD_WEIGHTS.items():
+                for word in set(tokenize(cls._field_text(fields.get(field)))):
+                    weights = postings.setdefault(word, {})
+                    weights[code] = weights.get(code, 0) + weight
+        return cls(names, postings)
+
+    @classmethod
+    def load(cls, path):
+        """Load an index that was written by ``save()``."""
+        with open(path, "rb") as f:
+            data = utils.get_json_decoder()(f.read())
+        return cls(data["names"], data["postings"])
+
+    def save(self, path):
+        """Write the index to a JSON file. The file is replaced atomically."""
+        data = json.dumps({"names": self.names, "postings": self.postings})
+        fd, tempname = tempfile.mkstemp(dir=os.path.dirname(path) or ".")
+        f = os.fdopen(fd, "wb")
+        f.write(data.encode("utf-8"))
+        f.close()
+        if os.path.exists(path):
+            # Windows can't rename over an existing file.
+            os.remove(path)
+        os.rename(tempname, path)
+
+    def search(self, query, limit=None):
+        """Return the codes of the indicators that contain every word of the
+        query, best matches first.
+
+        Words match whole words, case-insensitively. A word that ends with
+        ``*`` matches any word that starts with it, eg. ``popul*``. Matches
+        are ranked by the weights of the fields that they're in, with rarer
+        words counting for more.
+
+        :param query:
+            The search string, eg. ``"urban population"``.
+
+        :param limit:
+            If given, return at most this many codes.
+
+        """
+        scores = None
+        for term in query.split():
+            words = tokenize(term)
+            for position, word in enumerate(words):
+                prefix = term.endswith("*") and position == len(words) - 1
+                matches = self._matches(word, prefix)
+                if not matches:
+                    return []
+                idf = math.log(1.0 + float(len(self.names)) / len(matches))
+                if scores is None:
+                    scores = dict((code, weight * idf) for code, weight in
+                        matches.items())
+                else:
+                    scores = dict((code, score + matches[code] * idf) for
+                        code, score in scores.items() if code in matches)
+        if not scores:
+            return []
+        ranked = sorted(scores, key=lambda code: (-scores[code], code))
+        return ranked[:limit] if limit else ranked
+
+    def _matches(self, word, prefix=False):
+        """Return a dictionary of the indicators that contain the word, or
+        any word that starts with it, and their weights.
+        """
+        if not prefix:
+            return self.postings.get(word, {})
+        matches = {}
+        position = bisect.bisect_left(self._words, word)
+        while (position < len(self._words) and
+                self._words[position].startswith(word)):
+            for code, weight in self.postings[self._words[position]].items():
+                matches[code] = max(weight, matches.get(code, 0))
+            position += 1
+        return matches
+
+    @staticmethod
+    def _field_text(value):
+        """Return the searchable text of a metadata value."""
+        if not value:
+            return u""
+        if isinstance(value, list):
+            return u" ".join(IndicatorIndex._field_text(v) for v in value)
+        if isinstance(value, dict):
+            return value.get("value") or u""
+        return value
+
+
+def get_index(path, build, max_age=utils.CACHE_TTL):
+    """Return the index saved at ``path``. If the file is missing, or older
+    than ``max_age`` seconds, a new index is made with ``build()`` and saved.
+    Indexes are only loaded from disk once.
+    """
+    if os.path.exists(path) and time.time() - os.path.getmtime(path) < max_age:
+        mtime = os.path.getmtime(path)
+        loaded = _loaded_indexes.get(path)
+        if loaded and loaded[0] == mtime:
+            return loaded[1]
+        index = IndicatorIndex.load(path)
+    else:
+        index = build()
+        index.save(path)
+    _loaded_indexes[path] = (os.path.getmtime(path), index)
+    return index
@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks for wbpy's hot paths, using the bundled test fixtures.
+
+They aren't part of the test suite. Run them with:
+
+    python -m wbpy.tests.benchmarks [--json PATH] [name ...]
+
+where each name is one of the keys of ``BENCHMARKS``. With no names, all
+benchmarks are run. With ``--json``, the results are also written to PATH,
+or to stdout for ``-``, as JSON with the Python and wbpy versions, so that
+runs can be compared from release to release.
+"""
+import io
+import os
+import sys
+import json
+import time
+import timeit
+import shutil
+import urllib2
+import datetime
+import optparse
+import platform
+import tempfile
+import subprocess
+
+import wbpy
+from wbpy import utils, search
+from wbpy.tests import indicator_data, climate_data, synthetic_data, server
+from wbpy.tests.test_search import CATALOG
+
+
+def best_time(fn, repeat=5, min_time=0.1):
+    """Return the best time for one call of ``fn``, in seconds.
+
+    The number of calls per timing run is increased until a run takes at
+    least ``min_time`` seconds, to keep timer resolution errors small.
+    """
+    timer = timeit.Timer(fn)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 10
+    return min(timer.repeat(repeat, number)) / number
+
+
+def fixture_payloads():
+    """Return the raw JSON text of every fixture API response."""
+    payloads = []
+    for name in ["Yearly", "Monthly", "Quarterly"]:
+        payloads.append(json.dumps(getattr(indicator_data, name).response))
+    for name in ["InstrumentalMonth", "InstrumentalYear",
+            "InstrumentalDecade", "ModelledVarMAVG", "ModelledVarAANOM",
+            "ModelledStat"]:
+        for call in getattr(climate_data, name).data:
+            payloads.append(json.dumps(call["resp"]))
+    return payloads
+
+
+def bench_json_decoders():
+    """Decode all of the fixture payloads, from text and from bytes, with
+    each installed JSON decoder.
+    """
+    text_payloads = fixture_payloads()
+    byte_payloads = [p.encode("utf-8") for p in text_payloads]
+    results = []
+    for name in ["json", "simplejson", "ujson", "orjson"]:
+        try:
+            loads = utils.get_json_decoder(name)
+        except ImportError:
+            continue
+        for input_type, payloads in [("text", text_payloads),
+                ("bytes", byte_payloads)]:
+            def decode_all():
+                for payload in payloads:
+                    loads(payload)
+            label = "json_decode[%s, %s]" % (name, input_type)
+            results.append((label, best_time(decode_all)))
+    return results
+
+
+def bench_indicator_dataset():
+    """Build each indicator fixture dataset, and read its values and dates."""
+    results = []
+    for name in ["Yearly", "Monthly", "Quarterly"]:
+        fixture = getattr(indicator_data, name)
+        dataset = fixture().dataset
+        for label, fn in [
+                ("init", lambda: wbpy.IndicatorDataset(fixture.response,
+                    fixture.url, fixture.date)),
+                ("init_lean", lambda: wbpy.IndicatorDataset(fixture.response,
+                    fixture.url, fixture.date, keep_raw=False)),
+                ("as_dict", lambda: dataset.as_dict()),
+                ("as_dict_datetime", lambda: dataset.as_dict(
+                    use_datetime=True)),
+                ("dates", lambda: dataset.dates()),
+                ("dates_datetime", lambda: dataset.dates(use_datetime=True)),
+                ]:
+            label = "indicator_dataset.%s[%s]" % (label, name)
+            results.append((label, best_time(fn)))
+    return results
+
+
+def bench_modelled_dataset():
+    """Build each modelled climate fixture dataset, and read its values."""
+    results = []
+    for name in ["ModelledVarMAVG", "ModelledVarAANOM", "ModelledStat"]:
+        fixture = getattr(climate_data, name)
+        dataset = fixture().dataset
+        for label, fn in [
+                ("init", lambda: wbpy.ModelledDataset(fixture.data,
+                    fixture.data_stat, fixture.data_type, fixture.date)),
+                ("as_dict", lambda: dataset.as_dict()),
+                ("as_dict_datetime", lambda: dataset.as_dict(
+                    use_datetime=True)),
+                ]:
+            label = "modelled_dataset.%s[%s]" % (label, name)
+            results.append((label, best_time(fn)))
+    return results
+
+
+def bench_country_codes():
+    """Convert single country codes, and a list of every ISO code."""
+    codes = sorted(utils._get_country_tables()["alpha3"])
+    return [
+        ("convert_country_code[alpha3]",
+            best_time(lambda: utils.convert_country_code("GBR", "alpha2"))),
+        ("convert_country_code[non-standard]",
+            best_time(lambda: utils.convert_country_code("1W", "alpha3"))),
+        ("convert_country_codes[%d codes]" % len(codes),
+            best_time(lambda: utils.convert_country_codes(codes, "alpha2"))),
+        ]
+
+
+def bench_urls():
+    """Build a dataset URL with query arguments."""
+    api = wbpy.IndicatorAPI()
+    rest_url = "countries/GBR;ARG/indicators/SP.POP.TOTL?"
+    return [
+        ("generate_indicators_url", best_time(lambda:
+            api._generate_indicators_url(rest_url, dataset_params=True,
+            date="1960:2012", language="en"))),
+        ]
+
+
+def bench_search():
+    """Search the test catalog with the index, and with the regexp filter
+    that it replaces.
+    """
+    api = wbpy.IndicatorAPI()
+    index = search.IndicatorIndex.build(CATALOG)
+    return [
+        ("search.build[%d indicators]" % len(CATALOG),
+            best_time(lambda: search.IndicatorIndex.build(CATALOG))),
+        ("search.query[word]", best_time(lambda: index.search("population"))),
+        ("search.query[prefix]", best_time(lambda: index.search("popul*"))),
+        ("search_results[regexp]",
+            best_time(lambda: api.search_results("population", CATALOG))),
+        ]
+
+
+def bench_fetch():
+    """Fetch a response from the cache, and fetch and cache a new one. The
+    request itself is answered from memory, and a temporary cache directory
+    is used.
+    """
+    payload = json.dumps(indicator_data.Monthly.response).encode("utf-8")
+    url = "http://api.worldbank.org/wbpy-benchmark"
+    cache_dir = tempfile.mkdtemp()
+    get_cache_dir, urlopen = utils.get_cache_dir, urllib2.urlopen
+    utils.get_cache_dir = lambda: cache_dir
+    urllib2.urlopen = lambda url: io.BytesIO(payload)
+    try:
+        utils.fetch(url)
+        return [
+            ("fetch[cache hit]", best_time(lambda: utils.fetch(url))),
+            ("fetch_bytes[cache hit]",
+                best_time(lambda: utils.fetch_bytes(url))),
+            ("fetch[cache miss]",
+                best_time(lambda: utils.fetch(url, check_cache=False))),
+            ]
+    finally:
+        utils.get_cache_dir, urllib2.urlopen = get_cache_dir, urlopen
+        shutil.rmtree(cache_dir)
+
+
+def bench_get_dataset():
+    """Request a whole dataset and read its values, with a fetch function
+    that answers from memory.
+    """
+    payload = json.dumps(indicator_data.Monthly.response).encode("utf-8")
+    api = wbpy.IndicatorAPI(fetch=lambda url: payload)
+
+    def get_dataset():
+        api.get_dataset("DPANUSSPF", ["IN", "CN"], frequency="M",
+            date="2012M01:2012M12").as_dict()
+    return [("get_dataset[Monthly]", best_time(get_dataset))]
+
+
+def stored_fetch(seed=0):
+    """Return a fetch function that answers with synthetic responses, each
+    generated once and then kept, so that timings don't include generating
+    the data.
+    """
+    fetch = synthetic_data.make_fetch(seed)
+    responses = {}
+
+    def stored(url):
+        if url not in responses:
+            responses[url] = fetch(url)
+        return responses[url]
+    return stored
+
+
+def bench_scale():
+    """Request and read large synthetic datasets: an indicator for every
+    country over 60 years, and every modelled URL for 200 countries.
+    """
+    fetch = stored_fetch()
+    indicator_api = wbpy.IndicatorAPI(fetch=fetch)
+    climate_api = wbpy.ClimateAPI(fetch=fetch)
+    codes = synthetic_data.country_codes(200)
+
+    def get_dataset(**kwargs):
+        return indicator_api.get_dataset("SP.POP.TOTL", date="1960:2019",
+            **kwargs)
+
+    def get_modelled(**kwargs):
+        return climate_api.get_modelled("pr", "mavg", codes, **kwargs)
+
+    indicators = get_dataset()
+    modelled = get_modelled()
+    kwargs = dict(repeat=3, min_time=0)
+    return [
+        ("scale.get_dataset[%d rows]" % len(list(indicators.iter_rows())),
+            best_time(get_dataset, **kwargs)),
+        ("scale.get_dataset_lean", best_time(lambda: get_dataset(
+            keep_raw=False), **kwargs)),
+        ("scale.indicator_as_dict", best_time(indicators.as_dict, **kwargs)),
+        ("scale.indicator_dates", best_time(indicators.dates, **kwargs)),
+        ("scale.get_modelled[%d urls]" % len(modelled.api_calls),
+            best_time(get_modelled, **kwargs)),
+        ("scale.get_modelled_lean", best_time(lambda: get_modelled(
+            keep_raw=False), **kwargs)),
+        ("scale.modelled_as_dict", best_time(modelled.as_dict, **kwargs)),
+        ("scale.modelled_dates", best_time(modelled.dates, **kwargs)),
+        ]
+
+
+def bench_transport(latency=0.01):
+    """Request paged datasets over HTTP from a local stand-in server, which
+    waits ``latency`` seconds before each response. The cache isn't used.
+    """
+    fetch = lambda url: utils.fetch_bytes(url, check_cache=False,
+        cache_response=False)
+    indicator_api = wbpy.IndicatorAPI(fetch=fetch)
+    climate_api = wbpy.ClimateAPI(fetch=fetch)
+    codes = synthetic_data.country_codes(100)
+    kwargs = dict(repeat=3, min_time=0)
+    results = []
+    with server.StandInServer(latency=latency, max_per_page=500) as stand_in:
+        indicator_api.BASE_URL = stand_in.indicators_url
+        climate_api.BASE_URL = stand_in.climate_url
+        for workers in [1, 4, 16]:
+            label = "transport.get_dataset[12 pages, %d workers]" % workers
+            results.append((label, best_time(lambda: indicator_api.get_dataset(
+                "SP.POP.TOTL", codes, date="1960:2019", max_workers=workers),
+                **kwargs)))
+        results.append(("transport.get_modelled[5 locations]",
+            best_time(lambda: climate_api.get_modelled("pr", "mavg",
+            codes[:5]), **kwargs)))
+    return results
+
+
+def bench_import(repeat=5):
+    """Time importing wbpy and using its classes, each in a new interpreter,
+    less the interpreter's own start-up time.
+    """
+    package_dir = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    env = dict(os.environ, PYTHONPATH=package_dir)
+
+    def run(code):
+        times = []
+        for _ in range(repeat):
+            start = time.time()
+            subprocess.check_call([sys.executable, "-c", code], env=env)
+            times.append(time.time() - start)
+        return min(times)
+
+    startup = run("pass")
+    results = []
+    for label, code in [
+            ("import[wbpy]", "import wbpy"),
+            ("import[IndicatorAPI]", "import wbpy; wbpy.IndicatorAPI"),
+            ("import[ClimateAPI]", "import wbpy; wbpy.ClimateAPI"),
+            ]:
+        results.append((label, run(code) - startup))
+    return results
+
+
+BENCHMARKS = dict(
+    json=bench_json_decoders,
+    indicator_dataset=bench_indicator_dataset,
+    modelled_dataset=bench_modelled_dataset,
+    country_codes=bench_country_codes,
+    urls=bench_urls,
+    search=bench_search,
+    fetch=bench_fetch,
+    get_dataset=bench_get_dataset,
+    scale=bench_scale,
+    transport=bench_transport,
+    imports=bench_import,
+    )
+
+
+def main(args=None):
+    parser = optparse.OptionParser(usage="%prog [--json PATH] [name ...]",
+        description="Benchmark wbpy. Names: %s." % ", ".join(
+        sorted(BENCHMARKS)))
+    parser.add_option("--json", metavar="PATH",
+        help="also write the results as JSON to PATH, or - for stdout")
+    options, names = parser.parse_args(args)
+    unknown = sorted(set(names) - set(BENCHMARKS))
+    if unknown:
+        parser.error("unknown benchmarks: %s" % ", ".join(unknown))
+
+    # The table goes to stderr when the JSON goes to stdout.
+    out = sys.stderr if options.json == "-" else sys.stdout
+    results = {}
+    for name in names or sorted(BENCHMARKS):
+        for label, seconds in BENCHMARKS[name]():
+            results[label] = seconds
+            out.write("%-55s %10.1f us\n" % (label, seconds * 1e6))
+
+    if options.json:
+        report = json.dumps({
+            "wbpy": wbpy.__version__,
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "date": datetime.datetime.now().isoformat(),
+            "unit": "seconds",
+            "results": results,
+            }, indent=2, sort_keys=True)
+        if options.json == "-":
+            sys.stdout.write(report + "\n")
+        else:
+            with open(options.json, "w") as f:
+                f.write(report + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
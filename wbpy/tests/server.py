@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""A local stand-in for the World Bank APIs, for load and concurrency tests.
+
+The server answers the indicator dataset URLs and the climate URLs that
+``IndicatorAPI`` and ``ClimateAPI`` build, with responses from
+``synthetic_data``, including pagination. It can add latency, fail a share of
+requests and throttle clients, so the real HTTP transport (``utils.fetch``)
+can be timed on one machine. Point an API at it by overriding ``BASE_URL``::
+
+    with server.StandInServer(latency=0.05, max_per_page=1000) as stand_in:
+        api = wbpy.IndicatorAPI()
+        api.BASE_URL = stand_in.indicators_url
+        dataset = api.get_dataset("SP.POP.TOTL", date="1960:2019")
+
+Responses are cached by ``utils.fetch`` as usual, so load tests will usually
+pass a fetch function that skips the cache, eg.
+``lambda url: utils.fetch_bytes(url, False, False)``.
+
+The server can also be run from the command line::
+
+    python -m wbpy.tests.server --port 8000 --latency 0.05 --max-rate 20
+
+"""
+import sys
+import json
+import time
+import random
+import optparse
+import threading
+import collections
+import SocketServer
+import BaseHTTPServer
+
+from wbpy.tests import synthetic_data
+
+
+class StandInServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    """A threaded HTTP server with generated World Bank API responses.
+
+    :param port:
+        The port to listen on. The default, 0, picks a free port.
+
+    :param latency:
+        Seconds to wait before answering each request.
+
+    :param jitter:
+        Up to this many more seconds are added to the latency at random.
+
+    :param error_rate:
+        The share of requests, from 0 to 1, that fail with a 500 error.
+
+    :param max_rate:
+        If given, requests beyond this many in one second are refused with a
+        429 error and a ``Retry-After`` header.
+
+    :param max_per_page:
+        If given, indicator responses have at most this many rows per page.
+
+    :param seed:
+        Seed for the generated data and for the random errors and jitter.
+
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0, latency=0, jitter=0, error_rate=0,
+            max_rate=None, max_per_page=None, seed=0, host="127.0.0.1"):
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port),
+            StandInHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.max_rate = max_rate
+        self.max_per_page = max_per_page
+        self.seed = seed
+        self.stats = dict(requests=0, errors=0, throttled=0)
+        self._random = random.Random(seed)
+        self._recent = collections.deque()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        return "http://%s:%d/" % self.server_address[:2]
+
+    @property
+    def indicators_url(self):
+        """The ``BASE_URL`` for an IndicatorAPI."""
+        return self.url
+
+    @property
+    def climate_url(self):
+        """The ``BASE_URL`` for a ClimateAPI."""
+        return self.url + "climateweb/rest/"
+
+    def start(self):
+        """Serve requests from a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread:
+            self.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def respond(self, path):
+        """Return a ``(status, body, headers)`` tuple for a request path."""
+        with self._lock:
+            self.stats["requests"] += 1
+            throttled = self._throttle()
+            failed = self._random.random() < self.error_rate
+            delay = self.latency + self._random.random() * self.jitter
+        if delay:
+            time.sleep(delay)
+
+        if throttled:
+            return self._error(429, "throttled", [("Retry-After", "1")])
+        if failed:
+            return self._error(500, "errors")
+        try:
+            response = synthetic_data.response_for_url(path, self.seed,
+                max_per_page=self.max_per_page)
+        except ValueError as e:
+            return 404, str(e).encode("utf-8"), []
+        return 200, json.dumps(response).encode("utf-8"), []
+
+    def _throttle(self):
+        """Return True if a request now would go over ``max_rate``."""
+        if not self.max_rate:
+            return False
+        now = time.time()
+        while self._recent and now - self._recent[0] >= 1:
+            self._recent.popleft()
+        if len(self._recent) >= self.max_rate:
+            return True
+        self._recent.append(now)
+        return False
+
+    def _error(self, status, stat, headers=()):
+        with self._lock:
+            self.stats[stat] += 1
+        return status, b"", list(headers)
+
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    # Keep connections open between requests, as the real servers do.
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        status, body, headers = self.server.respond(self.path)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json;charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Logging every request would slow down load tests.
+        pass
+
+
+def main(args=None):
+    parser = optparse.OptionParser(
+        description="Serve generated World Bank API responses locally.")
+    parser.add_option("-p", "--port", type="int", default=8000)
+    parser.add_option("--latency", type="float", default=0,
+        help="seconds to wait before each response")
+    parser.add_option("--jitter", type="float", default=0,
+        help="up to this many more seconds to wait, at random")
+    parser.add_option("--error-rate", type="float", default=0,
+        help="share of requests that fail with a 500 error, from 0 to 1")
+    parser.add_option("--max-rate", type="int",
+        help="requests per second before clients are throttled")
+    parser.add_option("--max-per-page", type="int",
+        help="maximum rows per indicator page")
+    parser.add_option("--seed", type="int", default=0)
+    options, args = parser.parse_args(args)
+
+    stand_in = StandInServer(options.port, options.latency, options.jitter,
+        options.error_rate, options.max_rate, options.max_per_page,
+        options.seed)
+    sys.stdout.write("IndicatorAPI.BASE_URL = %s\nClimateAPI.BASE_URL = %s\n"
+        % (stand_in.indicators_url, stand_in.climate_url))
+    sys.stdout.flush()
+    try:
+        stand_in.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stand_in.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""Generated API responses at any scale, for benchmarks and scaling tests.
+
+The responses have the same shape as the real Indicators and Climate API
+responses, but can cover hundreds of countries, decades of dates and every
+modelled URL. Values are pseudo-random, but depend only on the request and
+the seed, so every run sees the same data and nothing is requested over the
+network.
+
+``make_fetch()`` returns a function that answers the dataset URLs built by
+``IndicatorAPI.get_dataset()`` and the URLs built by ``ClimateAPI``, so it can
+be passed as the ``fetch`` argument of either API::
+
+    api = wbpy.ClimateAPI(fetch=synthetic_data.make_fetch())
+    dataset = api.get_modelled("pr", "mavg", synthetic_data.country_codes(200))
+
+"""
+import re
+import json
+import zlib
+import urlparse
+
+from wbpy import utils
+from wbpy.climate import ClimateAPI
+
+
+# The last year of generated data, when a request doesn't give a date range.
+# It's fixed, rather than the current year, so that results don't change.
+END_YEAR = 2019
+
+# The first year of generated indicator data.
+START_YEAR = 1960
+
+GCMS = sorted(k for k in ClimateAPI._gcm if not k.startswith("ensemble"))
+PERCENTILES = [10, 50, 90]
+SCENARIOS = ["a2", "b1"]
+
+# Climate URLs: v1/<loc_type>/cru/<type>/<interval>/<loc> for instrumental
+# data, and v1/<loc_type>/<interval>[/ensemble]/<type>/<start>/<end>/<loc>
+# for modelled data.
+_INSTRUMENTAL_RE = re.compile(r"v1/(country|basin)/cru/(\w+)/(\w+)/(\w+)$")
+_MODELLED_RE = re.compile(
+    r"v1/(country|basin)/(\w+)/(ensemble/)?(\w+)/(\d+)/(\d+)/(\w+)$")
+_DATASET_RE = re.compile(r"countries/([^/]+)/indicators/([^/?]+)")
+
+
+def country_codes(count=None):
+    """Return the first ``count`` alpha-2 codes known to wbpy, in order. The
+    ISO countries are followed by the World Bank's aggregate regions. With no
+    count, every code is returned.
+    """
+    names = utils._get_country_tables()["name"]
+    iso_codes = sorted(c for c in names if c not in utils.NON_STANDARD_REGIONS)
+    codes = iso_codes + sorted(utils.NON_STANDARD_REGIONS)
+    if count is not None and count > len(codes):
+        raise ValueError("Only %d country codes are known" % len(codes))
+    return codes[:count]
+
+
+# For functions with a country_codes argument.
+_all_country_codes = country_codes
+
+
+def indicator_dates(start, end, frequency="Y"):
+    """Return the dates from ``start`` to ``end`` years inclusive, newest
+    first, as the API orders them.
+
+    :param frequency:
+        ``Y`` for years (``2012``), ``Q`` for quarters (``2012Q1``) or ``M``
+        for months (``2012M01``).
+
+    """
+    suffixes = {
+        "Y": [""],
+        "Q": ["Q%d" % q for q in range(4, 0, -1)],
+        "M": ["M%02d" % m for m in range(12, 0, -1)],
+        }[frequency.upper()]
+    return ["%d%s" % (year, suffix) for year in range(end, start - 1, -1)
+        for suffix in suffixes]
+
+
+def indicator_rows(indicator, country_codes, dates, seed=0, missing=0.05):
+    """Return the response rows for an indicator, ordered by country and
+    then by date, newest first.
+
+    :param country_codes:
+        List of alpha-2 codes.
+
+    :param dates:
+        List of API dates, eg. from ``indicator_dates()``.
+
+    :param missing:
+        The share of values that are missing (None).
+
+    """
+    indicator_ref = {"id": indicator, "value": "Synthetic %s" % indicator}
+    rows = []
+    for code in country_codes:
+        country_ref = {"id": code, "value": utils.country_name(code)}
+        # Each country has its own scale, which grows over the years.
+        scale = 1000.0 * (1 + 1000 * _fraction(seed, indicator, code))
+        for date in dates:
+            u = _fraction(seed, indicator, code, date)
+            if u < missing:
+                value = None
+            else:
+                growth = 1 + 0.02 * (int(date[:4]) - START_YEAR)
+                value = "%.10g" % (scale * growth * (0.95 + 0.1 * u))
+            rows.append({
+                "indicator": indicator_ref,
+                "country": country_ref,
+                "value": value,
+                "decimal": "0",
+                "date": date,
+                })
+    return rows
+
+
+def indicator_response(indicator="SP.POP.TOTL", country_codes=None,
+        dates=None, page=1, per_page=None, seed=0, missing=0.05):
+    """Return a ``[header, rows]`` dataset response, or one page of it.
+
+    :param country_codes:
+        List of alpha-2 codes. Defaults to every known code.
+
+    :param dates:
+        List of API dates. Defaults to every year from ``START_YEAR`` to
+        ``END_YEAR``.
+
+    :param per_page:
+        The page size. Defaults to a single page of every row.
+
+    """
+    if country_codes is None:
+        country_codes = _all_country_codes()
+    if dates is None:
+        dates = indicator_dates(START_YEAR, END_YEAR)
+    total = len(country_codes) * len(dates)
+    per_page = per_page or max(total, 1)
+    pages = max((total + per_page - 1) // per_page, 1)
+
+    # Only the countries on the requested page are generated.
+    first = (page - 1) * per_page
+    date_count = max(len(dates), 1)
+    first_country = first // date_count
+    last_country = (first + per_page - 1) // date_count
+    rows = indicator_rows(indicator,
+        country_codes[first_country:last_country + 1], dates, seed, missing)
+    offset = first - first_country * date_count
+    header = {"page": page, "pages": pages, "per_page": str(per_page),
+        "total": total}
+    return [header, rows[offset:offset + per_page]]
+
+
+def instrumental_response(data_type, interval, location, seed=0):
+    """Return the response for a ``ClimateAPI.get_instrumental()`` URL.
+
+    :param location:
+        An alpha-3 code or basin ID, as in the URL.
+
+    """
+    base = _climate_base(data_type)
+    key = (seed, data_type, interval, str(location).upper())
+    if interval == "month":
+        return [{"month": month, "data": base * (0.5 + _fraction(month, *key))}
+            for month in range(12)]
+    # Basin averages start later than country averages.
+    first = 1960 if str(location).isdigit() else 1901
+    if interval == "decade":
+        years = range(first // 10 * 10, 2010, 10)
+    else:
+        years = range(first, 2010)
+    return [{"year": year, "data": base * (0.5 + _fraction(year, *key))}
+        for year in years]
+
+
+def modelled_response(data_type, interval, start, end, location,
+        ensemble=False, seed=0):
+    """Return the response for one ``ClimateAPI.get_modelled()`` URL: a row
+    per GCM, or per ensemble percentile, and per scenario for future periods.
+
+    :param location:
+        An alpha-3 code or basin ID, as in the URL.
+
+    """
+    base = _climate_base(data_type)
+    if "anom" in interval:
+        base = base / 10.0
+    annual = "annual" in interval
+    scenarios = SCENARIOS if int(end) > 2000 else [None]
+    key = (seed, data_type, interval, start, end, str(location).upper())
+
+    rows = []
+    for model in (PERCENTILES if ensemble else GCMS):
+        for scenario in scenarios:
+            row_key = key + (model, scenario)
+            row = {"fromYear": int(start), "toYear": int(end)}
+            if ensemble:
+                row["percentile"] = model
+            else:
+                row["gcm"] = model
+            if scenario:
+                row["scenario"] = scenario
+            if annual:
+                value = base * (0.5 + _fraction(*row_key))
+                row["annualVal" if ensemble else "annualData"] = [value]
+            else:
+                row["monthVals"] = [base * (0.5 + _fraction(month, *row_key))
+                    for month in range(12)]
+            rows.append(row)
+    return rows
+
+
+def response_for_url(url, seed=0, missing=0.05, max_per_page=None):
+    """Return the generated response for an indicator dataset URL or a
+    climate URL. Raises ValueError for any other URL.
+
+    :param max_per_page:
+        If given, indicator responses have at most this many rows per page,
+        whatever the URL's ``per_page``, as the real API limits page sizes.
+
+    """
+    match = _DATASET_RE.search(url)
+    if match:
+        return _dataset_response(match, url, seed, missing, max_per_page)
+    match = _MODELLED_RE.search(url)
+    if match:
+        loc_type, interval, ensemble, data_type, start, end, loc = \
+            match.groups()
+        return modelled_response(data_type, interval, start, end, loc,
+            bool(ensemble), seed)
+    match = _INSTRUMENTAL_RE.search(url)
+    if match:
+        loc_type, data_type, interval, loc = match.groups()
+        return instrumental_response(data_type, interval, loc, seed)
+    raise ValueError("No synthetic data for URL: %s" % url)
+
+
+def make_fetch(seed=0, missing=0.05):
+    """Return a fetch function, for ``IndicatorAPI`` or ``ClimateAPI``, that
+    answers with generated JSON bytes. The URLs it's called with are
+    recorded in its ``urls`` list.
+    """
+    def fetch(url):
+        fetch.urls.append(url)
+        return json.dumps(response_for_url(url, seed, missing)).encode(
+            "utf-8")
+    fetch.urls = []
+    return fetch
+
+
+def _dataset_response(match, url, seed, missing, max_per_page=None):
+    codes, indicator = match.groups()
+    query = dict((k.lower(), v[-1]) for k, v in
+        urlparse.parse_qs(urlparse.urlparse(url).query).items())
+    if codes.lower() == "all":
+        codes = _all_country_codes()
+    else:
+        codes = utils.convert_country_codes(codes.split(";"), "alpha2")
+
+    frequency = query.get("frequency", "Y")
+    date = query.get("date")
+    if date:
+        start, _, end = date.upper().partition(":")
+        end = end or start
+        for period in ["M", "Q"]:
+            if period in start:
+                frequency = period
+        # A bare end year includes all of its months or quarters.
+        dates = [d for d in indicator_dates(int(start[:4]), int(end[:4]),
+            frequency) if start <= d and (d <= end or d[:4] == end)]
+    else:
+        dates = indicator_dates(START_YEAR, END_YEAR, frequency)
+    if "mrv" in query:
+        dates = dates[:int(query["mrv"])]
+
+    per_page = int(query.get("per_page", 50))
+    if max_per_page:
+        per_page = min(per_page, max_per_page)
+    return indicator_response(indicator, codes, dates,
+        int(query.get("page", 1)), per_page, seed, missing)
+
+
+def _climate_base(data_type):
+    """Return a typical magnitude for a climate data type."""
+    if data_type.startswith("ppt_days") or "days" in data_type:
+        return 30.0
+    if data_type in ["pr", "ppt_means"]:
+        return 80.0
+    return 15.0
+
+
+def _fraction(*key):
+    """Return a number in [0, 1) that depends only on the key items."""
+    text = u"|".join(u"%s" % item for item in key).encode("utf-8")
+    return (zlib.crc32(text) & 0xffffffff) / 4294967296.0
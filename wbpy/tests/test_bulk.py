@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import shutil
+import zipfile
+import tempfile
+
+try:
+    import unittest2 as unittest  # Python 2.6
+except ImportError:
+    import unittest
+
+import mock
+
+from wbpy import bulk, mirror
+
+
+# A single-indicator file, as in the archives of the indicator bulk downloads.
+INDICATOR_CSV = u'''\ufeff"Data Source","World Development Indicators",
+
+"Last Updated Date","2013-12-18",
+
+"Country Name","Country Code","Indicator Name","Indicator Code","2010","2011","2012",
+"United Kingdom","GBR","Population, total","SP.POP.TOTL","62766365","63258810","63700215",
+"Côte d'Ivoire","CIV","Population, total","SP.POP.TOTL","19044000","","20000000",
+'''
+
+# The metadata file from the same archive, which has no data.
+METADATA_CSV = u'''"Country Code","Region","IncomeGroup","SpecialNotes","TableName",
+"GBR","Europe & Central Asia","High income","","United Kingdom",
+'''
+
+# A whole-database file, as in the World Development Indicators download.
+DATABASE_CSV = u'''\ufeffCountry Name,Country Code,Indicator Name,Indicator Code,2011,2012
+Argentina,ARG,"Population, total",SP.POP.TOTL,40728738,41086927
+Argentina,ARG,GDP (current US$),NY.GDP.MKTP.CD,5.3e+11,
+United Kingdom,GBR,"Population, total",SP.POP.TOTL,63258810,63700215
+United Kingdom,GBR,GDP (current US$),NY.GDP.MKTP.CD,2.6e+12,2.7e+12
+'''
+
+
+class TestBulk(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.zip_path = os.path.join(self.tempdir, "indicator.zip")
+        archive = zipfile.ZipFile(self.zip_path, "w")
+        archive.writestr("API_SP.POP.TOTL_DS2_en_csv_v2.csv",
+            INDICATOR_CSV.encode("utf-8"))
+        archive.writestr("Metadata_Country_API_SP.POP.TOTL_DS2_en_csv_v2.csv",
+            METADATA_CSV.encode("utf-8"))
+        archive.close()
+
+        self.csv_path = os.path.join(self.tempdir, "WDIData.csv")
+        with open(self.csv_path, "wb") as f:
+            f.write(DATABASE_CSV.encode("utf-8"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_iter_rows_from_archive(self):
+        rows = list(bulk.iter_rows(self.zip_path))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[0], ("SP.POP.TOTL", "Population, total", "GB",
+            "United Kingdom", "2010", 62766365.0))
+        self.assertEqual(rows[4][3], u"Côte d'Ivoire")
+        self.assertEqual(rows[4][5], None)
+
+    def test_iter_rows_from_csv_file(self):
+        rows = list(bulk.iter_rows(self.csv_path, skip_missing=True))
+        self.assertEqual(len(rows), 7)
+
+    def test_iter_rows_filters(self):
+        rows = list(bulk.iter_rows(self.csv_path,
+            indicators=["NY.GDP.MKTP.CD"], country_codes=["GB"]))
+        self.assertEqual([row[4:] for row in rows],
+            [("2011", 2.6e12), ("2012", 2.7e12)])
+
+    def test_iter_rows_from_url(self):
+        if sys.version_info >= (3,):
+            urlopen = "urllib.request.urlopen"
+        else:
+            urlopen = "urllib2.urlopen"
+        with mock.patch(urlopen) as urlopen_fn:
+            urlopen_fn.return_value = open(self.zip_path, "rb")
+            rows = list(bulk.iter_rows("http://example.com/indicator.zip"))
+            urlopen_fn.return_value.close()
+        self.assertEqual(len(rows), 6)
+
+    def test_get_datasets(self):
+        datasets = bulk.get_datasets(self.csv_path)
+        self.assertEqual(sorted(datasets), ["NY.GDP.MKTP.CD", "SP.POP.TOTL"])
+        dataset = datasets["SP.POP.TOTL"]
+        self.assertEqual(dataset.as_dict()["AR"],
+            {"2011": 40728738.0, "2012": 41086927.0})
+        self.assertEqual(dataset.countries,
+            {"AR": "Argentina", "GB": "United Kingdom"})
+        self.assertEqual(dataset.api_params["indicator"], "SP.POP.TOTL")
+
+    def test_get_datasets_keep_raw(self):
+        datasets = bulk.get_datasets(self.csv_path)
+        raw_datasets = bulk.get_datasets(self.csv_path, keep_raw=True)
+        for code, dataset in datasets.items():
+            self.assertIsNone(dataset.api_response)
+            raw = raw_datasets[code]
+            self.assertEqual(len(raw.api_response[1]),
+                len(list(dataset.iter_rows())))
+            self.assertEqual(raw.as_dict(), dataset.as_dict())
+        self.assertEqual(raw_datasets["NY.GDP.MKTP.CD"].as_dict()["AR"],
+            {"2011": 5.3e11, "2012": None})
+
+    def test_load_mirror(self):
+        local_mirror = mirror.IndicatorMirror(os.path.join(self.tempdir,
+            "mirror.db"))
+        try:
+            self.assertEqual(bulk.load_mirror(self.csv_path, local_mirror), 8)
+            dataset = local_mirror.get_dataset("NY.GDP.MKTP.CD", ["AR"])
+            self.assertEqual(dataset.as_dict(),
+                {"AR": {"2011": 5.3e11, "2012": None}})
+            self.assertEqual(dataset.indicator_name, "GDP (current US$)")
+        finally:
+            local_mirror.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,12 @@
 # -*- coding: utf-8 -*-
+import os
+import csv
+import copy
+import json
+import shutil
+import tempfile
 import datetime
+from StringIO import StringIO
 try:
     # py2.6
     import unittest2 as unittest
@@ -9,6 +16,23 @@ except ImportError:
 
 from ddt import ddt, data
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+    import pyarrow.feather
+except ImportError:
+    pyarrow = None
+
 import wbpy
 from climate_data import (
     InstrumentalMonth,
@@ -18,6 +42,7 @@ from climate_data import (
     ModelledVarAANOM,
     ModelledStat,
     )
+import synthetic_data
 
 @ddt
 class TestClimateDataBasicAttrs(unittest.TestCase):
@@ -231,6 +256,412 @@ class TestModelledModelDictFn(unittest.TestCase):
         res = data.dataset.as_dict(sres="b1")["ensemble_90"]["NZ"]["2065"][10]
         self.assertEqual(res, 12.463586228230714)
 
+    def test_past_and_future_periods(self):
+        api = wbpy.ClimateAPI(fetch=synthetic_data.make_fetch())
+        dataset = api.get_modelled("pr", "mavg", ["BR"])
+        for sres in ["a2", "b1"]:
+            periods = dataset.as_dict(sres=sres)["ukmo_hadcm3"]["BR"]
+            self.assertEqual(sorted(periods), ["1939", "1959", "1979",
+                "1999", "2039", "2059", "2079", "2099"])
+        self.assertNotEqual(dataset.as_dict(sres="a2")["ukmo_hadcm3"]["BR"],
+            dataset.as_dict(sres="b1")["ukmo_hadcm3"]["BR"])
+
+    def test_results_are_new_dicts(self):
+        dataset = ModelledStat().dataset
+        dataset.as_dict()["ensemble_90"]["NZ"].clear()
+        self.assertTrue(dataset.as_dict()["ensemble_90"]["NZ"])
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestModelledModelCubeFn(unittest.TestCase):
+
+    def test_monthly_cube(self):
+        dataset = ModelledStat().dataset
+        cube, axes = dataset.as_cube()
+        self.assertEqual([name for name, labels in axes],
+            ["gcm", "region", "period", "scenario", "month"])
+        self.assertEqual(cube.shape, tuple(len(labels) for name, labels in
+            axes))
+        self.assertTrue(cube.flags["C_CONTIGUOUS"])
+        labels = dict(axes)
+        position = (labels["gcm"].index("ensemble_90"),
+            labels["region"].index("NZ"), labels["period"].index("2065"),
+            labels["scenario"].index("b1"), 10)
+        self.assertEqual(cube[position], 12.463586228230714)
+
+    def test_matches_as_dict(self):
+        api = wbpy.ClimateAPI(fetch=synthetic_data.make_fetch())
+        dataset = api.get_modelled("tas", "annualanom", ["BR", "AR"])
+        cube, axes = dataset.as_cube(use_datetime=True)
+        self.assertEqual(len(axes), 4)
+        gcms, regions, periods, scenarios = [labels for name, labels in axes]
+        for s, sres in enumerate(scenarios):
+            expected = dataset.as_dict(sres=sres, use_datetime=True)
+            for g, gcm in enumerate(gcms):
+                for r, region in enumerate(regions):
+                    for p, period in enumerate(periods):
+                        value = expected[gcm][region].get(period)
+                        if value is None:
+                            self.assertTrue(numpy.isnan(cube[g, r, p, s]))
+                        else:
+                            self.assertEqual(cube[g, r, p, s], value)
+
+    def test_empty_dataset(self):
+        today = datetime.date.today()
+        url = "climateweb/rest/v1/country/mavg/pr/2020/2039/GBR"
+        for api_calls, interval, ndim in [
+                ([], "mavg", 5),
+                ([], "aavg", 4),
+                ([dict(url=url, resp=[])], "mavg", 5)]:
+            dataset = wbpy.ModelledDataset(api_calls, "pr", interval, today)
+            cube, axes = dataset.as_cube()
+            self.assertEqual([name for name, labels in axes],
+                ["gcm", "region", "period", "scenario", "month"][:ndim])
+            self.assertEqual(cube.ndim, ndim)
+            self.assertEqual(cube.size, 0)
+
+
+@unittest.skipIf(pandas is None, "pandas is not installed")
+class TestInstrumentalModelFrameFn(unittest.TestCase):
+
+    def test_month_values(self):
+        frame = InstrumentalMonth().dataset.to_frame()
+        self.assertEqual(list(frame.index.names), ["region", "month"])
+        self.assertEqual(frame["tas"]["GB", 3], 7.046495)
+
+    def test_year_values(self):
+        frame = InstrumentalYear().dataset.to_frame()
+        self.assertEqual(frame["tas"]["BR", "1902"], 25.09181)
+
+    def test_year_datetime_param(self):
+        frame = InstrumentalDecade().dataset.to_frame(use_datetime=True)
+        dates = frame.index.get_level_values("date")
+        self.assertIn(pandas.Timestamp(1990, 1, 1), dates)
+
+
+@unittest.skipIf(pandas is None, "pandas is not installed")
+class TestModelledModelFrameFn(unittest.TestCase):
+
+    def test_monthly_index(self):
+        frame = ModelledStat().dataset.to_frame()
+        self.assertEqual(list(frame.index.names),
+            ["gcm", "region", "period", "month"])
+        self.assertEqual(frame["tmin_means"]["ensemble_90", "NZ", "2065", 10],
+            12.763983215594646)
+
+    def test_sres_param(self):
+        frame = ModelledStat().dataset.to_frame(sres="b1")
+        self.assertEqual(frame["tmin_means"]["ensemble_90", "NZ", "2065", 10],
+            12.463586228230714)
+
+    def test_annual_index(self):
+        data = ModelledVarAANOM()
+        frame = data.dataset.to_frame()
+        self.assertEqual(list(frame.index.names), ["gcm", "region", "period"])
+        expected = data.dataset.as_dict()["ingv_echam4"]["JP"]["2079"]
+        self.assertEqual(frame[data.data_stat]["ingv_echam4", "JP", "2079"],
+            expected)
+
+    def test_datetime_param(self):
+        frame = ModelledVarMAVG().dataset.to_frame(use_datetime=True)
+        periods = frame.index.get_level_values("period")
+        self.assertIn(pandas.Timestamp(2039, 1, 1), periods)
+
+
+class TestClimateDatasetRowFns(unittest.TestCase):
+
+    def test_instrumental_month_rows(self):
+        rows = list(InstrumentalMonth().dataset.iter_rows())
+        self.assertIn(("GB", 3, 7.046495), rows)
+        self.assertEqual(len(rows), 24)
+
+    def test_instrumental_year_csv(self):
+        fileobj = StringIO()
+        InstrumentalYear().dataset.write_csv(fileobj)
+        rows = list(csv.reader(StringIO(fileobj.getvalue())))
+        self.assertEqual(rows[0], ["region", "date", "value"])
+        self.assertIn(["BR", "1902", "25.09181"], rows)
+
+    def test_modelled_monthly_rows(self):
+        rows = list(ModelledStat().dataset.iter_rows(sres="b1"))
+        self.assertIn(("ensemble_90", "NZ", "2065", 10, 12.463586228230714),
+            rows)
+
+    def test_modelled_annual_csv(self):
+        data = ModelledVarAANOM()
+        fileobj = StringIO()
+        data.dataset.write_csv(fileobj)
+        rows = list(csv.reader(StringIO(fileobj.getvalue())))
+        self.assertEqual(rows[0], ["gcm", "region", "period", "value"])
+        expected = data.dataset.as_dict()["ingv_echam4"]["JP"]["2079"]
+        self.assertIn(["ingv_echam4", "JP", "2079", repr(expected)], rows)
+
+
+@ddt
+class TestLeanClimateDataset(unittest.TestCase):
+
+    def lean_dataset(self, data, fetch=None):
+        dataset_class = data.dataset.__class__
+        return dataset_class(copy.deepcopy(data.data), data.data_stat,
+            data.data_type, data.date, keep_raw=False, fetch=fetch)
+
+    @data(InstrumentalMonth(), InstrumentalYear(), ModelledVarMAVG(),
+        ModelledStat())
+    def test_raw_responses_are_dropped(self, data):
+        for call in self.lean_dataset(data).api_calls:
+            self.assertNotIn("resp", call)
+
+    @data(InstrumentalYear(), ModelledVarMAVG())
+    def test_api_calls_arg_is_unchanged(self, data):
+        api_calls = copy.deepcopy(data.data)
+        data.dataset.__class__(api_calls, data.data_stat, data.data_type,
+            data.date, keep_raw=False)
+        for call, original in zip(api_calls, data.data):
+            self.assertEqual(call["resp"], original["resp"])
+            self.assertNotIn("rows", call)
+
+    @data(InstrumentalMonth(), InstrumentalYear(), InstrumentalDecade())
+    def test_instrumental_matches_raw_dataset(self, data):
+        dataset = self.lean_dataset(data)
+        self.assertEqual(dataset.as_dict(), data.dataset.as_dict())
+        self.assertEqual(list(dataset.iter_rows()),
+            list(data.dataset.iter_rows()))
+
+    @data(ModelledVarMAVG(), ModelledVarAANOM(), ModelledStat())
+    def test_modelled_matches_raw_dataset(self, data):
+        dataset = self.lean_dataset(data)
+        for sres in ["a2", "b1"]:
+            self.assertEqual(dataset.as_dict(sres=sres),
+                data.dataset.as_dict(sres=sres))
+        self.assertEqual(dataset.gcms, data.dataset.gcms)
+        self.assertEqual(sorted(dataset.sres), sorted(data.dataset.sres))
+        self.assertEqual(dataset.dates(), data.dataset.dates())
+
+    def test_rehydrate(self):
+        data = InstrumentalYear()
+        responses = dict((call["url"], call["resp"]) for call in data.data)
+        fetch = lambda url: json.dumps(responses[url])
+        dataset = self.lean_dataset(data, fetch=fetch)
+        calls = dataset.rehydrate()
+        self.assertEqual([call["resp"] for call in calls],
+            [call["resp"] for call in data.data])
+
+
+@unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+class TestClimateDatasetFileFns(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_instrumental_parquet(self):
+        path = os.path.join(self.tempdir, "data.parquet")
+        InstrumentalYear().dataset.to_parquet(path)
+        rows = pyarrow.parquet.read_table(path).to_pandas()
+        self.assertEqual(list(rows.columns), ["region", "region_name", "date",
+            "value", "data_type", "interval"])
+        row = rows[(rows.region == "BR") & (rows.date == "1902")]
+        self.assertEqual(row.value.iloc[0], 25.09181)
+        self.assertEqual(row.region_name.iloc[0], "Brazil")
+
+    def test_instrumental_month_feather(self):
+        path = os.path.join(self.tempdir, "data.feather")
+        InstrumentalMonth().dataset.to_feather(path)
+        rows = pyarrow.feather.read_feather(path)
+        row = rows[(rows.region == "GB") & (rows.month == 3)]
+        self.assertEqual(row.value.iloc[0], 7.046495)
+
+    def test_modelled_parquet(self):
+        path = os.path.join(self.tempdir, "data.parquet")
+        ModelledStat().dataset.to_parquet(path, sres="b1")
+        rows = pyarrow.parquet.read_table(path).to_pandas()
+        row = rows[(rows.gcm == "ensemble_90") & (rows.region == "NZ") &
+            (rows.period == "2065") & (rows.month == 10)]
+        self.assertEqual(row.value.iloc[0], 12.463586228230714)
+        self.assertEqual(set(rows.sres), set(["b1"]))
+
+
+class TestJSONDecoderParam(unittest.TestCase):
+
+    def test_decoder_is_used(self):
+        data = InstrumentalYear()
+        decoded = []
+        def loads(text):
+            decoded.append(text)
+            return json.loads(text)
+
+        fetch = lambda url: json.dumps(data.response)
+        api = wbpy.ClimateAPI(fetch=fetch, json_decoder=loads)
+        dataset = api.get_instrumental("tas", "year", ["BR"])
+        self.assertEqual(len(decoded), 1)
+        self.assertEqual(dataset.as_dict(), data.dataset.as_dict())
+
+
+class TestProfileParam(unittest.TestCase):
+
+    def test_dataset_has_profile(self):
+        api = wbpy.ClimateAPI(fetch=synthetic_data.make_fetch(),
+            profile=True)
+        dataset = api.get_modelled("pr", "mavg", ["BR", "AR"])
+        self.assertEqual(len(dataset.profile.requests), 32)
+        self.assertTrue(dataset.profile.parse_time > 0)
+
+        dataset = api.get_instrumental("pr", "year", ["BR"])
+        self.assertEqual(len(dataset.profile.requests), 1)
+
+    def test_no_profile(self):
+        api = wbpy.ClimateAPI(fetch=synthetic_data.make_fetch(),
+            profile=False)
+        self.assertEqual(api.get_modelled("pr", "mavg", ["BR"]).profile, None)
+
+
+class TestGetMany(unittest.TestCase):
+
+    def setUp(self):
+        self.fetch = synthetic_data.make_fetch()
+        self.api = wbpy.ClimateAPI(fetch=self.fetch)
+
+    def test_requests_each_url_once(self):
+        queries = [
+            ("tas", "mavg", ["GB", "FR"]),
+            ("tas", "aavg", ["GB"]),
+            ("tas", "mavg", ["GBR"]),
+            ("pr", "year", ["GB", "302"]),
+            ]
+        datasets = self.api.get_many(queries)
+        self.assertEqual(len(self.fetch.urls), 32 + 16 + 2)
+        self.assertEqual(len(set(self.fetch.urls)), len(self.fetch.urls))
+
+        api = wbpy.ClimateAPI(fetch=synthetic_data.make_fetch())
+        for (data_type, interval, locations), dataset in zip(queries,
+                datasets):
+            if interval == "year":
+                expected = api.get_instrumental(data_type, interval,
+                    locations)
+            else:
+                expected = api.get_modelled(data_type, interval, locations)
+            self.assertEqual(type(dataset), type(expected))
+            self.assertEqual(dataset.as_dict(), expected.as_dict())
+            self.assertEqual(dataset.api_calls[0]["url"],
+                expected.api_calls[0]["url"])
+
+    def test_checks_arguments(self):
+        self.assertRaises(AssertionError, self.api.get_many,
+            [("tas", "mavg", ["GB"]), ("tmin_means", "year", ["GB"])])
+        self.assertEqual(self.fetch.urls, [])
+
+    def test_lean_datasets(self):
+        datasets = self.api.get_many([("pr", "mavg", ["BR"]),
+            ("pr", "mavg", ["BR"])], keep_raw=False)
+        self.assertEqual(len(self.fetch.urls), 16)
+        self.assertEqual(datasets[0].as_dict(), datasets[1].as_dict())
+
+
+class TestGetModelledMany(unittest.TestCase):
+
+    def setUp(self):
+        synthetic_fetch = synthetic_data.make_fetch()
+
+        def fetch(url):
+            if url.endswith("/FRA") and "/annualanom/" in url:
+                raise ValueError("Bad response")
+            return synthetic_fetch(url)
+        self.fetch = synthetic_fetch
+        self.api = wbpy.ClimateAPI(fetch=fetch)
+
+    def test_datasets_by_type_and_interval(self):
+        datasets = self.api.get_modelled_many(["ppt_days", "tmax_means"],
+            ["mavg", "annualavg"], ["GB", "302"])
+        self.assertEqual(sorted(datasets), [("ppt_days", "annualavg"),
+            ("ppt_days", "mavg"), ("tmax_means", "annualavg"),
+            ("tmax_means", "mavg")])
+        self.assertEqual(datasets.errors, {})
+        self.assertEqual(len(set(self.fetch.urls)), len(self.fetch.urls))
+
+        api = wbpy.ClimateAPI(fetch=synthetic_data.make_fetch())
+        expected = api.get_modelled("tmax_means", "annualavg", ["GB", "302"])
+        self.assertEqual(datasets[("tmax_means", "annualavg")].as_dict(),
+            expected.as_dict())
+
+    def test_failed_locations_are_left_out(self):
+        datasets = self.api.get_modelled_many(["tas"],
+            ["mavg", "annualanom"], ["GB", "FR"])
+        self.assertEqual(sorted(datasets.errors), [("tas", "annualanom",
+            "FRA")])
+        self.assertTrue(isinstance(datasets.errors[("tas", "annualanom",
+            "FRA")], ValueError))
+        self.assertEqual(datasets.failed_locations(), ["FRA"])
+        self.assertEqual(sorted(datasets[("tas", "annualanom")].as_dict()[
+            "ensemble_50"]), ["GB"])
+        self.assertEqual(sorted(datasets[("tas", "mavg")].as_dict()[
+            "ensemble_50"]), ["FR", "GB"])
+
+        datasets = self.api.get_modelled_many(["tas"], ["annualanom"],
+            ["FR"])
+        self.assertEqual(list(datasets), [])
+        self.assertEqual(len(datasets.errors), 1)
+
+    def test_progress(self):
+        calls = []
+        self.api.get_modelled_many(["pr", "tas"], ["mavg"], ["GB"],
+            progress=lambda done, total: calls.append((done, total)))
+        self.assertEqual(calls, [(i, 32) for i in range(1, 33)])
+
+    def test_max_rate(self):
+        start = datetime.datetime.now()
+        self.api.get_modelled_many(["ppt_days"], ["mavg"], ["GB", "FR"],
+            max_rate=50)
+        elapsed = datetime.datetime.now() - start
+        self.assertEqual(len(self.fetch.urls), 6)
+        self.assertTrue(elapsed >= datetime.timedelta(seconds=0.09))
+
+    def test_checks_arguments(self):
+        self.assertRaises(AssertionError, self.api.get_modelled_many,
+            ["tas", "pr"], ["mavg", "year"], ["GB"])
+        self.assertEqual(self.fetch.urls, [])
+
+
+class TestCallParams(unittest.TestCase):
+
+    def setUp(self):
+        api = wbpy.ClimateAPI(fetch=synthetic_data.make_fetch())
+        self.dataset = api.get_modelled("pr", "mavg", ["GB", "302"])
+
+    def test_params_from_api(self):
+        params = self.dataset.api_calls[1]["params"]
+        self.assertEqual(params, dict(location_type="country", location="GBR",
+            data_type="pr", interval="mavg", start="1920", end="1939",
+            ensemble=True, annual=False))
+
+    def test_params_from_url(self):
+        dataset = ModelledVarAANOM().dataset
+        for call in dataset.api_calls:
+            self.assertEqual(call["params"]["location"], "JPN")
+            self.assertEqual(call["params"]["ensemble"],
+                "ensemble" in call["url"])
+            self.assertTrue(call["params"]["annual"])
+        dataset = InstrumentalYear().dataset
+        self.assertEqual(dataset.api_calls[0]["params"]["interval"], "year")
+
+    def test_get_calls(self):
+        calls = self.dataset.get_calls(ensemble=True, end="2039")
+        self.assertEqual([c["params"]["location"] for c in calls],
+            ["GBR", "302"])
+        self.assertEqual(len(self.dataset.get_calls(location="302")), 16)
+        self.assertEqual(self.dataset.get_calls(end="1998"), [])
+        self.assertEqual(self.dataset.get_calls(), self.dataset.api_calls)
+
+    def test_urls_are_not_parsed(self):
+        api_calls = copy.deepcopy(self.dataset.api_calls)
+        for position, call in enumerate(api_calls):
+            call["url"] = "call-%d" % position
+        dataset = wbpy.ModelledDataset(api_calls, "pr", "mavg",
+            datetime.date.today())
+        self.assertEqual(dataset.dates(), self.dataset.dates())
+        self.assertEqual(dataset.as_dict(), self.dataset.as_dict())
+
 
 class TestClimateAPI(unittest.TestCase):
     def setUp(self):
@@ -1,5 +1,14 @@
 # -*- coding: utf-8 -*-
+import os
+import re
+import copy
+import csv
+import json
+import shutil
+import urllib
+import tempfile
 import datetime
+from StringIO import StringIO
 try:
     # py2.6
     import unittest2 as unittest
@@ -7,9 +16,24 @@ except ImportError:
     # py2.7+
     import unittest
 
+import mock
 from ddt import ddt, data
 
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+    import pyarrow.feather
+except ImportError:
+    pyarrow = None
+
 import wbpy
+from wbpy import utils
+from wbpy.indicators import _split_date_range, _shift_date
 from indicator_data import Yearly, Monthly, Quarterly
         
 @ddt
@@ -167,6 +191,566 @@ class TestIndicatorDatasetDictFn(unittest.TestCase):
                 100.18916509029)
 
 
+@unittest.skipIf(pandas is None, "pandas is not installed")
+@ddt
+class TestIndicatorDatasetFrameFn(unittest.TestCase):
+
+    @data(Yearly(), Monthly(), Quarterly())
+    def test_matches_dict(self, data):
+        frame = data.dataset.to_frame()
+        column = frame[data.dataset.indicator_code]
+        for country, country_data in data.dataset.as_dict().items():
+            for date, val in country_data.items():
+                if val is None:
+                    self.assertTrue(pandas.isnull(column[country, date]))
+                else:
+                    self.assertEqual(column[country, date], val)
+
+    def test_index_names(self):
+        frame = Yearly().dataset.to_frame()
+        self.assertEqual(list(frame.index.names), ["country", "date"])
+
+    def test_datetime_param(self):
+        frame = Quarterly().dataset.to_frame(use_datetime=True)
+        dates = frame.index.get_level_values("date")
+        self.assertIn(pandas.Timestamp(2013, 4, 1), dates)
+
+
+@unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+class TestIndicatorDatasetFileFns(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_parquet_columns(self):
+        data = Yearly()
+        path = os.path.join(self.tempdir, "data.parquet")
+        data.dataset.to_parquet(path)
+        table = pyarrow.parquet.read_table(path)
+        self.assertEqual(table.schema.names, ["country", "country_name",
+            "date", "value", "indicator_code", "indicator_name"])
+        self.assertEqual(table.num_rows, len(data.response[1]))
+
+        rows = table.to_pandas()
+        gb_2012 = rows[(rows.country == "GB") & (rows.date == "2012")]
+        self.assertEqual(gb_2012.value.iloc[0], 63227526)
+        self.assertEqual(set(rows.indicator_code), set(["SP.POP.TOTL"]))
+
+    def test_parquet_strings_are_dictionary_encoded(self):
+        path = os.path.join(self.tempdir, "data.parquet")
+        Yearly().dataset.to_parquet(path)
+        metadata = pyarrow.parquet.ParquetFile(path).metadata
+        column = metadata.row_group(0).column(0)
+        self.assertTrue(any("DICTIONARY" in str(encoding) for encoding in
+            column.encodings))
+
+    def test_feather_values(self):
+        data = Monthly()
+        path = os.path.join(self.tempdir, "data.feather")
+        data.dataset.to_feather(path)
+        rows = pyarrow.feather.read_feather(path)
+        india = rows[(rows.country == "IN") & (rows.date == "2013M04")]
+        self.assertEqual(india.value.iloc[0], 54.38226363636)
+
+
+@ddt
+class TestIndicatorDatasetRowFns(unittest.TestCase):
+
+    @data(Yearly(), Monthly(), Quarterly())
+    def test_rows_match_dict(self, data):
+        results = data.dataset.as_dict()
+        rows = list(data.dataset.iter_rows())
+        self.assertEqual(len(rows), len(data.response[1]))
+        for country, date, value in rows:
+            self.assertEqual(results[country][date], value)
+
+    def test_write_csv(self):
+        data = Yearly()
+        fileobj = StringIO()
+        data.dataset.write_csv(fileobj)
+        rows = list(csv.reader(StringIO(fileobj.getvalue())))
+        self.assertEqual(rows[0], ["country", "date", "value"])
+        self.assertIn(["GB", "2012", "63227526.0"], rows)
+        self.assertEqual(len(rows), len(data.response[1]) + 1)
+
+
+@ddt
+class TestLeanIndicatorDataset(unittest.TestCase):
+
+    def lean_dataset(self, data, fetch=None):
+        return wbpy.IndicatorDataset(data.response, data.url, data.date,
+            keep_raw=False, fetch=fetch)
+
+    @data(Yearly(), Monthly(), Quarterly())
+    def test_raw_response_is_dropped(self, data):
+        self.assertIsNone(self.lean_dataset(data).api_response)
+
+    @data(Yearly(), Monthly(), Quarterly())
+    def test_matches_raw_dataset(self, data):
+        dataset = self.lean_dataset(data)
+        self.assertEqual(dataset.as_dict(), data.dataset.as_dict())
+        self.assertEqual(dataset.dates(), data.dataset.dates())
+        self.assertEqual(list(dataset.iter_rows()),
+            list(data.dataset.iter_rows()))
+        self.assertEqual(dataset.countries, data.dataset.countries)
+        self.assertEqual(dataset.indicator_code, data.dataset.indicator_code)
+
+    def test_rehydrate(self):
+        data = Yearly()
+        fetch = lambda url: json.dumps(data.response)
+        dataset = self.lean_dataset(data, fetch=fetch)
+        self.assertEqual(dataset.rehydrate(), data.response)
+        self.assertEqual(dataset.api_response, data.response)
+
+
+@ddt
+class TestLazyIndicatorDataset(unittest.TestCase):
+
+    def lazy_dataset(self, data):
+        return wbpy.IndicatorDataset(data.response, data.url, data.date,
+            lazy=True)
+
+    def test_rows_are_not_scanned_on_init(self):
+        dataset = self.lazy_dataset(Yearly())
+        self.assertIsNone(dataset._country_offsets)
+        self.assertEqual(dataset.indicator_code, "SP.POP.TOTL")
+
+    @data(Yearly(), Monthly(), Quarterly())
+    def test_matches_eager_dataset(self, data):
+        dataset = self.lazy_dataset(data)
+        self.assertEqual(dataset.countries, data.dataset.countries)
+        self.assertEqual(dataset.as_dict(), data.dataset.as_dict())
+
+    def test_country_codes_param(self):
+        data = Yearly()
+        results = self.lazy_dataset(data).as_dict(country_codes=["GB"])
+        self.assertEqual(results, {"GB": data.dataset.as_dict()["GB"]})
+
+    def test_country_codes_param_takes_alpha3(self):
+        data = Yearly()
+        rows = list(self.lazy_dataset(data).iter_rows(["ARG", "HKG"]))
+        self.assertEqual(set(row[0] for row in rows), set(["AR", "HK"]))
+        self.assertIn(("AR", "2011", 40728738), rows)
+
+    def test_country_codes_param_with_lean_dataset(self):
+        data = Yearly()
+        dataset = wbpy.IndicatorDataset(data.response, keep_raw=False,
+            lazy=True)
+        self.assertEqual(dataset.as_dict(country_codes=["GB"]),
+            {"GB": data.dataset.as_dict()["GB"]})
+
+
+def fake_api_fetch(response, page_size=None):
+    """Return a fake ``fetch`` function for ``get_dataset()`` requests, which
+    serves the rows of an API response.
+
+    Rows are filtered by the URL's country codes and year range, and served
+    in pages of ``page_size``, or of the URL's ``per_page`` value. Requested
+    URLs are recorded in ``fetch.urls``.
+    """
+    def fetch(url):
+        fetch.urls.append(url)
+        rows = response[1]
+
+        countries = re.search("countries/([^/]+)/indicators", url).group(1)
+        if countries != "all":
+            codes = [utils.convert_country_code(c, "alpha2") for c in
+                countries.split(";")]
+            rows = [row for row in rows if row["country"]["id"] in codes]
+
+        date = re.search("[?&]date=([^&]+)", url)
+        if date:
+            years = urllib.unquote(date.group(1)).split(":")
+            rows = [row for row in rows if years[0] <= row["date"][:4] <=
+                years[-1]]
+
+        size = page_size or int(re.search("per_page=(\\d+)", url).group(1))
+        page = re.search("[?&]page=(\\d+)", url)
+        page = int(page.group(1)) if page else 1
+        page_count = (len(rows) + size - 1) // size
+        header = dict(page=page, pages=page_count, per_page=size,
+            total=len(rows))
+        if not rows:
+            return json.dumps([header, None])
+        start = (page - 1) * size
+        return json.dumps([header, rows[start:start + size]])
+
+    fetch.urls = []
+    return fetch
+
+
+class TestDatasetPages(unittest.TestCase):
+
+    def setUp(self):
+        self.fetch = fake_api_fetch(Yearly.response, 3)
+        self.api = wbpy.IndicatorAPI(fetch=self.fetch)
+
+    def test_iter_dataset_pages(self):
+        pages = list(self.api.iter_dataset_pages("SP.POP.TOTL", page_size=3))
+        self.assertEqual(len(pages), 3)
+        rows = []
+        for page in pages:
+            rows.extend(page.iter_rows())
+        self.assertEqual(len(rows), len(Yearly.response[1]))
+        self.assertIn("per_page=3", self.fetch.urls[0])
+
+    def test_pages_are_requested_lazily(self):
+        pages = self.api.iter_dataset_pages("SP.POP.TOTL", page_size=3)
+        next(pages)
+        self.assertEqual(len(self.fetch.urls), 1)
+
+    def test_long_country_lists_are_split(self):
+        self.api.MAX_CODES_PER_REQUEST = 2
+        pages = list(self.api.iter_dataset_pages("SP.POP.TOTL",
+            ["GB", "AR", "SA", "HK"], page_size=3))
+        countries = [re.search("countries/([^/]+)/indicators", url).group(1)
+            for url in self.fetch.urls]
+        self.assertTrue(len(set(countries)) >= 2)
+        self.assertTrue(all(len(c.split(";")) <= 2 for c in countries))
+        rows = []
+        for page in pages:
+            rows.extend(page.iter_rows())
+        self.assertEqual(len(rows), len(Yearly.response[1]))
+
+    def test_write_dataset_csv(self):
+        fileobj = StringIO()
+        self.api.write_dataset_csv(fileobj, "SP.POP.TOTL", page_size=3)
+        rows = list(csv.reader(StringIO(fileobj.getvalue())))
+        self.assertEqual(rows.count(["country", "date", "value"]), 1)
+        self.assertEqual(len(rows), len(Yearly.response[1]) + 1)
+
+
+class TestGetDatasetPagesAndChunks(unittest.TestCase):
+
+    def setUp(self):
+        self.expected = Yearly().dataset.as_dict()
+
+    def get_dataset(self, page_size=None, **kwargs):
+        self.fetch = fake_api_fetch(Yearly.response, page_size)
+        api = wbpy.IndicatorAPI(fetch=self.fetch)
+        return api.get_dataset("SP.POP.TOTL", **kwargs)
+
+    def test_follows_all_pages(self):
+        dataset = self.get_dataset(page_size=3)
+        self.assertEqual(len(self.fetch.urls), 3)
+        self.assertEqual(dataset.as_dict(), self.expected)
+        self.assertEqual(dataset.api_urls, self.fetch.urls)
+
+    def test_rehydrate_after_following_pages(self):
+        dataset = self.get_dataset(page_size=3, keep_raw=False)
+        self.assertEqual(len(dataset.rehydrate()[1]), len(Yearly.response[1]))
+
+    def test_chunk_years(self):
+        dataset = self.get_dataset(date="2011:2012", chunk_years=1)
+        self.assertEqual(len(self.fetch.urls), 2)
+        self.assertIn("date=2011%3A2011", self.fetch.urls[0])
+        self.assertIn("date=2012%3A2012", self.fetch.urls[1])
+        self.assertEqual(dataset.as_dict(), self.expected)
+
+    def url_countries(self, url):
+        return re.search("countries/([^/]+)/indicators", url).group(1)
+
+    def test_chunk_countries(self):
+        dataset = self.get_dataset(country_codes=["GB", "AR", "SA", "HK"],
+            chunk_countries=3, max_workers=2)
+        chunks = [self.url_countries(url).split(";") for url in
+            self.fetch.urls]
+        self.assertTrue(len(chunks) >= 2)
+        self.assertTrue(all(len(chunk) <= 3 for chunk in chunks))
+        self.assertEqual(dataset.as_dict(), self.expected)
+
+    def test_long_country_lists_are_split(self):
+        self.fetch = fake_api_fetch(Yearly.response)
+        api = wbpy.IndicatorAPI(fetch=self.fetch)
+        api.MAX_CODES_PER_REQUEST = 2
+        dataset = api.get_dataset("SP.POP.TOTL",
+            country_codes=["GB", "AR", "SA", "HK"])
+        self.assertTrue(len(self.fetch.urls) >= 2)
+        self.assertEqual(dataset.as_dict(), self.expected)
+
+    def test_country_chunks_are_stable(self):
+        # The same countries, in any order and with either code type, give
+        # the same URLs.
+        self.get_dataset(country_codes=["GB", "AR", "SA", "HK"],
+            chunk_countries=2)
+        urls = self.fetch.urls
+        self.get_dataset(country_codes=["HKG", "SA", "GB", "AR", "GB"],
+            chunk_countries=2)
+        self.assertEqual(sorted(self.fetch.urls), sorted(urls))
+
+    def test_chunks_and_pages(self):
+        dataset = self.get_dataset(page_size=1, country_codes=["GB", "AR"],
+            chunk_countries=1, date="2011:2012", chunk_years=1)
+        self.assertEqual(len(self.fetch.urls), 4)
+        self.assertEqual(dataset.as_dict(), dict((k, self.expected[k]) for
+            k in ["GB", "AR"]))
+
+    def test_empty_chunks_are_ignored(self):
+        dataset = self.get_dataset(date="2005:2012", chunk_years=2)
+        self.assertEqual(dataset.as_dict(), self.expected)
+
+    def test_no_data_raises(self):
+        self.assertRaises(ValueError, self.get_dataset, date="2001:2004",
+            chunk_years=2)
+
+    def test_chunk_years_requires_date_range(self):
+        self.assertRaises(ValueError, self.get_dataset, mrv=5, chunk_years=2)
+
+    def test_split_date_range(self):
+        self.assertEqual(_split_date_range("1960:1969", 5),
+            ["1960:1964", "1965:1969"])
+        self.assertEqual(_split_date_range("2001M03:2003M06", 1),
+            ["2001M03:2001M12", "2002M01:2002M12", "2003M01:2003M06"])
+        self.assertEqual(_split_date_range("2001Q2:2002Q1", 5),
+            ["2001Q2:2002Q1"])
+
+
+class TestRefresh(unittest.TestCase):
+
+    def setUp(self):
+        self.expected = Yearly().dataset.as_dict()
+        self.fetch = fake_api_fetch(Yearly.response)
+        self.api = wbpy.IndicatorAPI(fetch=self.fetch)
+        self.dataset = self.get_old_dataset()
+
+    def get_old_dataset(self, **kwargs):
+        # The API response before the 2012 data was published.
+        old_response = copy.deepcopy(Yearly.response)
+        old_response[1] = [row for row in old_response[1] if
+            row["date"] == "2011"]
+        api = wbpy.IndicatorAPI(fetch=fake_api_fetch(old_response))
+        return api.get_dataset("SP.POP.TOTL", **kwargs)
+
+    def test_requests_from_latest_date(self):
+        refreshed = self.api.refresh(self.dataset)
+        self.assertIn("date=2011%3A", self.fetch.urls[-1])
+        self.assertEqual(refreshed.as_dict(), self.expected)
+        self.assertEqual(refreshed.api_params, self.dataset.api_params)
+
+    def test_null_tail_is_requested_again(self):
+        # 2012 rows were published as nulls, and filled in later.
+        old_response = copy.deepcopy(Yearly.response)
+        for row in old_response[1]:
+            if row["date"] == "2012":
+                row["value"] = None
+        api = wbpy.IndicatorAPI(fetch=fake_api_fetch(old_response))
+        dataset = api.get_dataset("SP.POP.TOTL", date="2010:2013")
+        refreshed = self.api.refresh(dataset, overlap=0)
+        self.assertIn("date=2012%3A", self.fetch.urls[-1])
+        self.assertEqual(refreshed.as_dict(), self.expected)
+
+    def test_all_null_values(self):
+        old_response = copy.deepcopy(Yearly.response)
+        for row in old_response[1]:
+            row["value"] = None
+        api = wbpy.IndicatorAPI(fetch=fake_api_fetch(old_response))
+        dataset = api.get_dataset("SP.POP.TOTL")
+        self.api.refresh(dataset, overlap=0)
+        self.assertIn("date=2013%3A", self.fetch.urls[-1])
+
+    def test_up_to_date_dataset_is_copied(self):
+        response = copy.deepcopy(Yearly.response)
+        this_year = str(datetime.date.today().year)
+        response[1] = [dict(row, date=this_year) for row in response[1] if
+            row["date"] == "2012"]
+        api = wbpy.IndicatorAPI(fetch=fake_api_fetch(response))
+        dataset = api.get_dataset("SP.POP.TOTL", date=this_year)
+        url_count = len(self.fetch.urls)
+        refreshed = self.api.refresh(dataset, overlap=0)
+        self.assertEqual(len(self.fetch.urls), url_count)
+        self.assertFalse(refreshed is dataset)
+        self.assertEqual(refreshed.as_dict(), dataset.as_dict())
+
+    def test_no_overlap_requests_newer_dates_only(self):
+        refreshed = self.api.refresh(self.dataset, overlap=0)
+        self.assertIn("date=2012%3A", self.fetch.urls[-1])
+        self.assertEqual(refreshed.as_dict(), self.expected)
+
+    def test_new_rows_replace_old_rows(self):
+        response = copy.deepcopy(Yearly.response)
+        for row in response[1]:
+            row["value"] = "1"
+        api = wbpy.IndicatorAPI(fetch=fake_api_fetch(response))
+        refreshed = api.refresh(self.dataset)
+        self.assertEqual(refreshed.as_dict()["GB"], {"2011": 1.0, "2012": 1.0})
+        self.assertEqual(len(list(refreshed.iter_rows())),
+            len(Yearly.response[1]))
+
+    def test_lean_dataset(self):
+        dataset = self.get_old_dataset(keep_raw=False)
+        refreshed = self.api.refresh(dataset)
+        self.assertIsNone(refreshed.api_response)
+        self.assertEqual(refreshed.as_dict(), self.expected)
+        self.assertEqual(refreshed.countries, Yearly().dataset.countries)
+
+    def test_mrv_is_dropped(self):
+        dataset = self.api.get_dataset("SP.POP.TOTL", mrv=1)
+        dataset.refresh()
+        self.assertNotIn("mrv", self.fetch.urls[-1])
+
+    def test_extends_date_range(self):
+        dataset = self.get_old_dataset(date="2000:2011")
+        refreshed = self.api.refresh(dataset)
+        end = datetime.date.today().year
+        self.assertIn("date=2011%3A{0}".format(end), self.fetch.urls[-1])
+        self.assertEqual(sorted(refreshed.dates()), ["2011", "2012"])
+        self.assertEqual(refreshed.api_params["date"], "2000:{0}".format(end))
+        self.assertEqual(dataset.api_params["date"], "2000:2011")
+
+    def test_has_no_duplicate_rows(self):
+        refreshed = self.api.refresh(self.dataset)
+        keys = [(row["country"]["id"], row["date"]) for row in
+            refreshed.api_response[1]]
+        self.assertEqual(len(keys), len(set(keys)))
+        self.assertEqual(len(list(refreshed.iter_rows())), len(keys))
+
+    def test_cant_rehydrate(self):
+        dataset = self.get_old_dataset(keep_raw=False)
+        refreshed = self.api.refresh(dataset)
+        self.assertIsNone(refreshed.api_urls)
+        self.assertRaises(ValueError, refreshed.rehydrate)
+
+    def test_needs_get_dataset_params(self):
+        self.assertRaises(ValueError, self.api.refresh, Yearly().dataset)
+
+    def test_shift_date(self):
+        self.assertEqual(_shift_date("2012", -2), "2010")
+        self.assertEqual(_shift_date("2012M01", -1), "2011M12")
+        self.assertEqual(_shift_date("2012Q4", 1), "2013Q1")
+
+
+class TestProfile(unittest.TestCase):
+
+    def test_dataset_has_profile(self):
+        api = wbpy.IndicatorAPI(fetch=fake_api_fetch(Yearly.response),
+            profile=True)
+        dataset = api.get_dataset("SP.POP.TOTL", ["GB", "AR"])
+        self.assertEqual(len(dataset.profile.requests), 1)
+        request = dataset.profile.requests[0]
+        self.assertEqual(request["url"], dataset.api_url)
+        self.assertTrue(request["bytes"] > 0)
+        self.assertTrue(dataset.profile.build_time >= 0)
+
+        refreshed = api.refresh(dataset)
+        self.assertEqual(len(refreshed.profile.requests), 1)
+
+    def test_no_profile_by_default(self):
+        api = wbpy.IndicatorAPI(fetch=fake_api_fetch(Yearly.response))
+        with mock.patch.dict(os.environ, {utils.PROFILE_ENV_VAR: ""}):
+            self.assertEqual(api.get_dataset("SP.POP.TOTL").profile, None)
+        with mock.patch.dict(os.environ, {utils.PROFILE_ENV_VAR: "1"}):
+            self.assertTrue(api.get_dataset("SP.POP.TOTL").profile)
+
+
+class TestSplitCodeLists(unittest.TestCase):
+
+    def setUp(self):
+        self.urls = []
+        def fetch(url):
+            self.urls.append(url)
+            codes = urllib.unquote(re.search("country/([^?]+)",
+                url).group(1)).split(";")
+            rows = [dict(id=code, iso2Code=code, name=code,
+                region=dict(id="", value=""),
+                incomeLevel=dict(id="", value=""),
+                lendingType=dict(id="", value=""),
+                capitalCity="", longitude="", latitude="") for code in codes]
+            return json.dumps([dict(page=1, pages=1, per_page=len(rows),
+                total=len(rows)), rows])
+        self.api = wbpy.IndicatorAPI(fetch=fetch)
+        self.api.MAX_CODES_PER_REQUEST = 3
+
+    def test_get_countries_splits_long_lists(self):
+        codes = ["GBR", "ARG", "SAU", "HKG", "USA", "FRA", "DEU"]
+        countries = self.api.get_countries(codes)
+        self.assertTrue(len(self.urls) >= 3)
+        self.assertEqual(sorted(countries), sorted(codes))
+
+    def test_short_lists_are_not_split(self):
+        self.api.get_countries(["GBR", "ARG"])
+        self.assertEqual(len(self.urls), 1)
+
+
+class TestCommonIndicators(unittest.TestCase):
+
+    page = "\n".join(
+        '<a href="http://data.worldbank.org/indicator/{0}">'.format(code) for
+        code in ["SP.POP.TOTL", "NY.GDP.MKTP"])
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        mock.patch("wbpy.utils.get_cache_dir",
+            return_value=self.tempdir).start()
+        self.urls = []
+        def fetch(url):
+            self.urls.append(url)
+            if url == wbpy.IndicatorAPI.COMMON_INDICATORS_URL:
+                return self.page
+            rows = [dict(id=code, name=code) for code in ["SP.POP.TOTL",
+                "SP.POP.GROW", "NY.GDP.MKTP.CD", "NY.GDP.MKTP.KD"]]
+            return json.dumps([dict(page=1, pages=1, per_page=len(rows),
+                total=len(rows)), rows])
+        self.fetch = fetch
+        # The codes are only saved for the default fetch function.
+        mock.patch("wbpy.utils.fetch_bytes", side_effect=fetch).start()
+
+    def tearDown(self):
+        mock.patch.stopall()
+        shutil.rmtree(self.tempdir)
+
+    def test_exact_and_prefix_matches(self):
+        api = wbpy.IndicatorAPI()
+        results = api.get_indicators(common_only=True)
+        self.assertEqual(sorted(results), ["NY.GDP.MKTP.CD",
+            "NY.GDP.MKTP.KD", "SP.POP.TOTL"])
+
+    def test_page_is_parsed_once(self):
+        wbpy.IndicatorAPI().get_indicators(common_only=True)
+        wbpy.IndicatorAPI().get_indicators(common_only=True)
+        self.assertEqual(
+            self.urls.count(wbpy.IndicatorAPI.COMMON_INDICATORS_URL), 1)
+
+    def test_codes_expire(self):
+        api = wbpy.IndicatorAPI()
+        api.get_indicators(common_only=True)
+        api.COMMON_INDICATORS_TTL = 0
+        api.get_indicators(common_only=True)
+        self.assertEqual(
+            self.urls.count(wbpy.IndicatorAPI.COMMON_INDICATORS_URL), 2)
+
+    def test_custom_fetch_doesnt_use_cache_dir(self):
+        api = wbpy.IndicatorAPI(fetch=self.fetch)
+        api.get_indicators(common_only=True)
+        api.get_indicators(common_only=True)
+        self.assertEqual(
+            self.urls.count(wbpy.IndicatorAPI.COMMON_INDICATORS_URL), 1)
+        self.assertEqual(os.listdir(self.tempdir), [])
+
+        # Nor is it given the codes saved for the default fetch function.
+        wbpy.IndicatorAPI().get_indicators(common_only=True)
+        self.page = ""
+        self.assertEqual(wbpy.IndicatorAPI(fetch=self.fetch).get_indicators(
+            common_only=True), {})
+
+
+class TestJSONDecoderParam(unittest.TestCase):
+
+    def test_decoder_is_used(self):
+        decoded = []
+        def loads(text):
+            decoded.append(text)
+            return json.loads(text)
+
+        fetch = fake_api_fetch(Yearly.response)
+        api = wbpy.IndicatorAPI(fetch=fetch, json_decoder=loads)
+        dataset = api.get_dataset("SP.POP.TOTL")
+        self.assertEqual(len(decoded), 1)
+        self.assertEqual(dataset.as_dict(), Yearly().dataset.as_dict())
+
+
 class TestIndicatorAPI(unittest.TestCase):
     def setUp(self):
         self.api = wbpy.IndicatorAPI()
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import copy
+import shutil
+import tempfile
+from StringIO import StringIO
+
+try:
+    import unittest2 as unittest  # Python 2.6
+except ImportError:
+    import unittest
+
+import mock
+
+import wbpy
+from wbpy import mirror
+from indicator_data import Yearly
+from test_indicators import fake_api_fetch
+
+
+def old_response():
+    """Return the Yearly response from before the 2012 data was published."""
+    response = copy.deepcopy(Yearly.response)
+    response[1] = [row for row in response[1] if row["date"] == "2011"]
+    return response
+
+
+class TestIndicatorMirror(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, "mirror.db")
+        self.expected = Yearly().dataset.as_dict()
+        self.fetch = fake_api_fetch(Yearly.response)
+        self.mirror = mirror.IndicatorMirror(self.path,
+            wbpy.IndicatorAPI(fetch=self.fetch))
+        self.mirror.add("SP.POP.TOTL")
+
+    def tearDown(self):
+        self.mirror.close()
+        shutil.rmtree(self.tempdir)
+
+    def test_get_dataset(self):
+        dataset = self.mirror.get_dataset("SP.POP.TOTL")
+        self.assertEqual(dataset.as_dict(), self.expected)
+        self.assertEqual(dataset.countries, Yearly().dataset.countries)
+        self.assertEqual(dataset.indicator_name, "Population, total")
+
+    def test_get_dataset_by_country_and_date(self):
+        dataset = self.mirror.get_dataset("SP.POP.TOTL",
+            country_codes=["GBR", "AR"], date="2012")
+        self.assertEqual(dataset.as_dict(),
+            dict((c, {"2012": self.expected[c]["2012"]}) for c in
+            ["GB", "AR"]))
+
+    def test_unknown_indicator(self):
+        self.assertFalse("NY.GDP.MKTP.CD" in self.mirror)
+        self.assertRaises(KeyError, self.mirror.get_dataset,
+            "NY.GDP.MKTP.CD")
+
+    def test_persists(self):
+        self.mirror.close()
+        self.mirror = mirror.IndicatorMirror(self.path)
+        self.assertEqual(self.mirror.get_dataset("SP.POP.TOTL").as_dict(),
+            self.expected)
+
+    def test_sync_requests_only_new_periods(self):
+        self.mirror.api = wbpy.IndicatorAPI(
+            fetch=fake_api_fetch(old_response()))
+        self.mirror.add("SP.POP.TOTL")
+        self.mirror.api = wbpy.IndicatorAPI(fetch=self.fetch)
+        self.assertEqual(self.mirror.sync(), 4)
+        self.assertIn("date=2011%3A", self.fetch.urls[-1])
+        self.assertEqual(self.mirror.get_dataset("SP.POP.TOTL").as_dict(),
+            self.expected)
+
+    def test_sync_fills_trailing_nulls(self):
+        # The 2012 values were null when the indicator was added.
+        response = copy.deepcopy(Yearly.response)
+        for row in response[1]:
+            if row["date"] == "2012":
+                row["value"] = None
+        self.mirror.api = wbpy.IndicatorAPI(fetch=fake_api_fetch(response))
+        self.mirror.add("SP.POP.TOTL", date="2011:2012")
+        self.assertEqual(self.mirror.get_dataset("SP.POP.TOTL").as_dict()[
+            "GB"]["2012"], None)
+
+        self.mirror.api = wbpy.IndicatorAPI(fetch=self.fetch)
+        self.assertEqual(self.mirror.sync(overlap=0), 4)
+        self.assertIn("date=2012%3A", self.fetch.urls[-1])
+        self.assertEqual(self.mirror.get_dataset("SP.POP.TOTL").as_dict(),
+            self.expected)
+
+    def test_sync_without_changes(self):
+        self.assertEqual(self.mirror.sync(), 0)
+
+    def test_api_answers_from_mirror(self):
+        self.mirror.add("SP.POP.TOTL", date="2000:2012")
+        api = wbpy.IndicatorAPI(fetch=self.fetch, mirror=self.mirror)
+        url_count = len(self.fetch.urls)
+        dataset = api.get_dataset("SP.POP.TOTL", ["GB"], date="2011:2012")
+        self.assertEqual(len(self.fetch.urls), url_count)
+        self.assertEqual(dataset.as_dict(), {"GB": self.expected["GB"]})
+
+    def test_api_falls_back_to_network(self):
+        self.mirror.add("SP.POP.TOTL", date="2000:2012")
+        api = wbpy.IndicatorAPI(fetch=self.fetch, mirror=self.mirror)
+        url_count = len(self.fetch.urls)
+        api.get_dataset("SP.POP.TOTL", mrv=1)
+        self.assertEqual(len(self.fetch.urls), url_count + 1)
+        # Without a date, the API returns only the latest values.
+        api.get_dataset("SP.POP.TOTL")
+        self.assertEqual(len(self.fetch.urls), url_count + 2)
+
+    def test_partial_date_range_falls_back_to_network(self):
+        self.mirror.add("SP.POP.TOTL", date="2011:2011")
+        self.assertTrue(self.mirror.covers("SP.POP.TOTL", date="2011"))
+        self.assertFalse(self.mirror.covers("SP.POP.TOTL",
+            date="1960:2020"))
+        self.assertFalse(self.mirror.covers("SP.POP.TOTL", date="2012"))
+
+        api = wbpy.IndicatorAPI(fetch=self.fetch, mirror=self.mirror)
+        url_count = len(self.fetch.urls)
+        dataset = api.get_dataset("SP.POP.TOTL", date="1960:2020")
+        self.assertEqual(len(self.fetch.urls), url_count + 1)
+        self.assertEqual(dataset.as_dict(), self.expected)
+
+    def test_monthly_dates_within_a_year(self):
+        self.mirror.add("SP.POP.TOTL", date="2011:2012")
+        self.assertTrue(self.mirror.covers("SP.POP.TOTL",
+            date="2012M01:2012M12"))
+        self.mirror.add("SP.POP.TOTL", date="2011:2012M06")
+        self.assertFalse(self.mirror.covers("SP.POP.TOTL", date="2012"))
+
+    def test_sync_extends_date_range(self):
+        self.mirror.api = wbpy.IndicatorAPI(
+            fetch=fake_api_fetch(old_response()))
+        self.mirror.add("SP.POP.TOTL", date="2011:2011")
+        self.assertFalse(self.mirror.covers("SP.POP.TOTL", date="2012"))
+        self.mirror.api = wbpy.IndicatorAPI(fetch=self.fetch)
+        self.mirror.sync()
+        self.assertTrue(self.mirror.covers("SP.POP.TOTL", date="2011:2012"))
+        self.assertNotIn("covered", self.fetch.urls[-1])
+
+    def test_loaded_rows_cover_their_dates(self):
+        self.mirror.load([("NY.GDP.MKTP.CD", "GDP", "GB", "United Kingdom",
+            date, 1.0) for date in ["1990", "2000"]])
+        self.assertTrue(self.mirror.covers("NY.GDP.MKTP.CD", date="1995"))
+        self.assertFalse(self.mirror.covers("NY.GDP.MKTP.CD",
+            date="1990:2001"))
+
+    def test_covers_country_subsets(self):
+        self.mirror.add("SP.POP.TOTL", ["GB", "AR"], date="2011:2012")
+        self.assertTrue(self.mirror.covers("SP.POP.TOTL", ["GBR"],
+            date="2012"))
+        self.assertFalse(self.mirror.covers("SP.POP.TOTL", ["SA"],
+            date="2012"))
+        self.assertFalse(self.mirror.covers("SP.POP.TOTL", date="2012"))
+
+    def test_mirrored_datasets_cant_be_rehydrated(self):
+        dataset = self.mirror.get_dataset("SP.POP.TOTL", keep_raw=False)
+        self.assertRaises(ValueError, dataset.rehydrate)
+
+    def test_command_line_list(self):
+        stdout = StringIO()
+        with mock.patch.object(sys, "stdout", stdout):
+            mirror.main([self.path, "list"])
+        self.assertTrue(stdout.getvalue().startswith("SP.POP.TOTL\t"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import shutil
+import tempfile
+
+try:
+    import unittest2 as unittest  # Python 2.6
+except ImportError:
+    import unittest
+
+import mock
+
+import wbpy
+from wbpy import search
+
+
+def indicator(name, note="", topics=(), source="World Development Indicators"):
+    return {
+        "name": name,
+        "sourceNote": note,
+        "sourceOrganization": "",
+        "source": {"id": "2", "value": source},
+        "topics": [{"id": "1", "value": topic} for topic in topics],
+        }
+
+
+CATALOG = {
+    "SP.POP.TOTL": indicator("Population, total",
+        "Total population counts all residents.", ["Health"]),
+    "SP.URB.TOTL": indicator("Urban population",
+        "Urban population refers to people living in urban areas.",
+        ["Urban Development"]),
+    "SP.RUR.TOTL": indicator("Rural population",
+        "Rural population is total population less urban population.",
+        ["Agriculture"]),
+    "NY.GDP.MKTP.CD": indicator("GDP (current US$)",
+        "GDP is the sum of gross value added by all resident producers.",
+        ["Economy & Growth"]),
+    "EN.POP.DNST": indicator(u"Population density (people per sq. km)",
+        source="Environment"),
+    }
+
+
+class TestIndicatorIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = search.IndicatorIndex.build(CATALOG)
+
+    def test_all_words_must_match(self):
+        self.assertEqual(self.index.search("rural population"),
+            ["SP.RUR.TOTL"])
+        self.assertEqual(self.index.search("urban gdp"), [])
+
+    def test_name_matches_rank_above_note_matches(self):
+        self.assertEqual(self.index.search("urban"),
+            ["SP.URB.TOTL", "SP.RUR.TOTL"])
+
+    def test_prefix_query(self):
+        self.assertEqual(sorted(self.index.search("dens*")), ["EN.POP.DNST"])
+        self.assertEqual(len(self.index.search("popul*")), 4)
+        self.assertEqual(self.index.search("popul"), [])
+
+    def test_code_query(self):
+        self.assertEqual(self.index.search("SP.POP.TOTL")[0], "SP.POP.TOTL")
+        self.assertEqual(self.index.search("sp.pop.totl"), ["SP.POP.TOTL"])
+
+    def test_topic_and_source_queries(self):
+        self.assertEqual(self.index.search("agriculture"), ["SP.RUR.TOTL"])
+        self.assertEqual(self.index.search("environment"), ["EN.POP.DNST"])
+
+    def test_limit(self):
+        self.assertEqual(len(self.index.search("population", limit=2)), 2)
+
+
+class TestSavedIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, "index.json")
+        self.builds = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def build(self):
+        self.builds += 1
+        return search.IndicatorIndex.build(CATALOG)
+
+    def test_save_and_load(self):
+        self.build().save(self.path)
+        index = search.IndicatorIndex.load(self.path)
+        self.assertEqual(index.search("rural population"), ["SP.RUR.TOTL"])
+        self.assertEqual(index.names["SP.POP.TOTL"], "Population, total")
+
+    def test_get_index_builds_once(self):
+        index = search.get_index(self.path, self.build)
+        self.assertTrue(search.get_index(self.path, self.build) is index)
+        self.assertEqual(self.builds, 1)
+
+    def test_get_index_rebuilds_old_index(self):
+        search.get_index(self.path, self.build)
+        search.get_index(self.path, self.build, max_age=0)
+        self.assertEqual(self.builds, 2)
+
+    def catalog_fetch(self, urls):
+        def fetch(url):
+            urls.append(url)
+            rows = [dict(metadata, id=code) for code, metadata in
+                CATALOG.items()]
+            return json.dumps([dict(page=1, pages=1, per_page=len(rows),
+                total=len(rows)), rows])
+        return fetch
+
+    def test_search_indicators(self):
+        urls = []
+        api = wbpy.IndicatorAPI(fetch=self.catalog_fetch(urls))
+        self.assertEqual(api.search_indicators("rural", path=self.path),
+            ["SP.RUR.TOTL"])
+        self.assertEqual(api.search_indicators("gdp", path=self.path),
+            ["NY.GDP.MKTP.CD"])
+        self.assertEqual(len(urls), 1)
+
+    def test_custom_fetch_doesnt_use_cache_dir(self):
+        urls = []
+        with mock.patch("wbpy.utils.get_cache_dir",
+                return_value=self.tempdir):
+            api = wbpy.IndicatorAPI(fetch=self.catalog_fetch(urls))
+            self.assertEqual(api.search_indicators("rural"), ["SP.RUR.TOTL"])
+            self.assertEqual(api.search_indicators("gdp"),
+                ["NY.GDP.MKTP.CD"])
+        self.assertEqual(len(urls), 1)
+        self.assertEqual(os.listdir(self.tempdir), [])
+
+    def test_cache_path_depends_on_base_url(self):
+        api = wbpy.IndicatorAPI()
+        path = api._cache_path("index_{0}.json", "key")
+        api.BASE_URL = "http://127.0.0.1:8000/"
+        self.assertNotEqual(api._cache_path("index_{0}.json", "key"), path)
+        self.assertIsNone(wbpy.IndicatorAPI(fetch=len)._cache_path(
+            "index_{0}.json", "key"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import time
+import urllib2
+
+try:
+    import unittest2 as unittest  # Python 2.6
+except ImportError:
+    import unittest
+
+import wbpy
+from wbpy import utils
+from wbpy.tests import server, synthetic_data
+
+
+def fetch_uncached(url):
+    return utils.fetch_bytes(url, check_cache=False, cache_response=False)
+
+
+class TestStandInServer(unittest.TestCase):
+
+    def start(self, **kwargs):
+        stand_in = server.StandInServer(**kwargs).start()
+        self.addCleanup(stand_in.stop)
+        return stand_in
+
+    def test_get_dataset_with_pages(self):
+        stand_in = self.start(max_per_page=1000)
+        api = wbpy.IndicatorAPI(fetch=fetch_uncached)
+        api.BASE_URL = stand_in.indicators_url
+        codes = synthetic_data.country_codes(40)
+        dataset = api.get_dataset("SP.POP.TOTL", codes, date="1960:2019")
+        self.assertEqual(stand_in.stats["requests"], 3)
+
+        expected = wbpy.IndicatorDataset(synthetic_data.indicator_response(
+            country_codes=codes), "", None)
+        self.assertEqual(dataset.as_dict(), expected.as_dict())
+
+    def test_get_modelled(self):
+        stand_in = self.start()
+        api = wbpy.ClimateAPI(fetch=fetch_uncached)
+        api.BASE_URL = stand_in.climate_url
+        dataset = api.get_modelled("tas", "annualavg", ["GB", "FR"])
+        self.assertEqual(stand_in.stats["requests"], 32)
+        self.assertEqual(sorted(dataset.as_dict()["ensemble_90"]),
+            ["FR", "GB"])
+
+    def test_errors(self):
+        stand_in = self.start(error_rate=1)
+        try:
+            fetch_uncached(stand_in.url + "countries/GB/indicators/X")
+        except urllib2.HTTPError as e:
+            self.assertEqual(e.code, 500)
+        else:
+            self.fail("HTTPError not raised")
+        self.assertEqual(stand_in.stats["errors"], 1)
+
+    def test_throttling(self):
+        stand_in = self.start(max_rate=2)
+        url = stand_in.url + "countries/GB/indicators/X"
+        fetch_uncached(url)
+        fetch_uncached(url)
+        try:
+            fetch_uncached(url)
+        except urllib2.HTTPError as e:
+            self.assertEqual(e.code, 429)
+            self.assertEqual(e.info()["Retry-After"], "1")
+        else:
+            self.fail("HTTPError not raised")
+        self.assertEqual(stand_in.stats["throttled"], 1)
+
+    def test_latency(self):
+        stand_in = self.start(latency=0.1)
+        start = time.time()
+        fetch_uncached(stand_in.url + "countries/GB/indicators/X")
+        self.assertTrue(time.time() - start >= 0.1)
+
+    def test_unknown_url(self):
+        stand_in = self.start()
+        try:
+            fetch_uncached(stand_in.url + "topics")
+        except urllib2.HTTPError as e:
+            self.assertEqual(e.code, 404)
+        else:
+            self.fail("HTTPError not raised")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+try:
+    import unittest2 as unittest  # Python 2.6
+except ImportError:
+    import unittest
+
+import wbpy
+import synthetic_data
+
+
+class TestSyntheticData(unittest.TestCase):
+
+    def test_responses_are_deterministic(self):
+        url = "http://api.worldbank.org/countries/GBR/indicators/X?date=2000"
+        self.assertEqual(synthetic_data.make_fetch()(url),
+            synthetic_data.make_fetch()(url))
+        self.assertNotEqual(synthetic_data.make_fetch()(url),
+            synthetic_data.make_fetch(seed=1)(url))
+
+    def test_pages_match_whole_response(self):
+        codes = synthetic_data.country_codes(5)
+        whole = synthetic_data.indicator_response(country_codes=codes)
+        rows = []
+        for page in range(1, 45):
+            header, page_rows = synthetic_data.indicator_response(
+                country_codes=codes, page=page, per_page=7)
+            rows.extend(page_rows)
+        self.assertEqual(header["pages"], 43)
+        self.assertEqual(rows, whole[1])
+
+    def test_get_dataset_at_scale(self):
+        fetch = synthetic_data.make_fetch()
+        api = wbpy.IndicatorAPI(fetch=fetch)
+        dataset = api.get_dataset("SP.POP.TOTL", date="1960:2019")
+        codes = synthetic_data.country_codes()
+        self.assertEqual(sorted(dataset.as_dict()), sorted(codes))
+        self.assertEqual(len(dataset.dates()), 60)
+        self.assertEqual(len(fetch.urls), 2)
+
+        # A narrower request has the same values.
+        latest = api.get_dataset("SP.POP.TOTL", codes[:3], mrv=1,
+            frequency="Y")
+        for code, values in latest.as_dict().items():
+            self.assertEqual(values, {"2019": dataset.as_dict()[code]["2019"]})
+
+    def test_monthly_date_range(self):
+        api = wbpy.IndicatorAPI(fetch=synthetic_data.make_fetch())
+        dataset = api.get_dataset("DPANUSSPF", ["GB"], date="2012M11:2013")
+        self.assertEqual(sorted(dataset.dates()), ["2012M11", "2012M12"] +
+            ["2013M%02d" % month for month in range(1, 13)])
+
+    def test_get_modelled_at_scale(self):
+        fetch = synthetic_data.make_fetch()
+        api = wbpy.ClimateAPI(fetch=fetch)
+        codes = synthetic_data.country_codes(20)
+        dataset = api.get_modelled("pr", "mavg", codes)
+        self.assertEqual(len(fetch.urls), 16 * len(codes))
+        self.assertEqual(len(dataset.gcms), len(synthetic_data.GCMS) + 3)
+        self.assertEqual(sorted(dataset.sres), ["a2", "b1"])
+        values = dataset.as_dict()["ensemble_50"][codes[0]]
+        self.assertEqual(len(values), 8)
+        self.assertEqual(len(values["2099"]), 12)
+
+    def test_get_instrumental(self):
+        api = wbpy.ClimateAPI(fetch=synthetic_data.make_fetch())
+        dataset = api.get_instrumental("tas", "year", ["GB", "302"])
+        self.assertEqual(len(dataset.as_dict()["GB"]), 109)
+        self.assertEqual(len(dataset.as_dict()["302"]), 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,14 @@
 # -*- coding: utf-8 -*-
+import io
+import os
 import sys
 import json
+import shutil
+import hashlib
+import tempfile
+import time
+import datetime
+import subprocess
 try:
     # py2.6
     import unittest2 as unittest
@@ -10,6 +18,11 @@ except ImportError:
 
 import mock
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from wbpy import utils
 
 
@@ -50,3 +63,227 @@ class TestFetchFn(unittest.TestCase):
         # The response will be json-decoded, so make sure not have
         # str/unicode/byte problems.
         self.assertTrue(json.loads(res))
+
+    def test_fetching_bytes_from_cache(self):
+        url = "http://api.worldbank.org/wbpy-test-bytes"
+        cache_path = os.path.join(utils.get_cache_dir(),
+            hashlib.md5(url.encode("utf-8")).hexdigest())
+        with open(cache_path, "wb") as f:
+            f.write(u'["caf\u00e9"]'.encode("utf-8"))
+
+        res = utils.fetch_bytes(url)
+        self.assertTrue(isinstance(res, bytes))
+        self.assertEqual(utils.get_json_decoder()(res), [u"caf\u00e9"])
+        self.assertEqual(utils.fetch(url), u'["caf\u00e9"]')
+        self.assertTrue(utils.is_cached(url))
+        os.remove(cache_path)
+        self.assertFalse(utils.is_cached(url))
+
+
+class TestCallProfile(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        mock.patch("wbpy.utils.get_cache_dir",
+            return_value=self.cache_dir).start()
+        if sys.version_info > (3,):
+            urlopen = "urllib.request.urlopen"
+        else:
+            urlopen = "urllib2.urlopen"
+        mock.patch(urlopen, side_effect=lambda url: io.BytesIO(b"[1, 2]")
+            ).start()
+
+    def tearDown(self):
+        mock.patch.stopall()
+        shutil.rmtree(self.cache_dir)
+
+    def test_records_cache_status(self):
+        profile = utils.CallProfile()
+        url = "http://api.worldbank.org/wbpy-test-profile"
+        self.assertEqual(profile.get_json(url, utils.fetch_bytes, json.loads),
+            [1, 2])
+        profile.get_json(url, utils.fetch_bytes, json.loads)
+        self.assertEqual([r["cache"] for r in profile.requests],
+            ["miss", "hit"])
+        self.assertEqual(profile.bytes, 12)
+        self.assertEqual(profile.network_time, profile.requests[0][
+            "fetch_time"])
+        self.assertEqual(profile.cache_time, profile.requests[1][
+            "fetch_time"])
+
+    def test_other_fetch_functions(self):
+        profile = utils.CallProfile()
+        profile.get_json("url", lambda url: "[]", json.loads)
+        self.assertEqual(profile.requests[0]["cache"], None)
+
+    def test_build(self):
+        profile = utils.CallProfile()
+        dataset = profile.build(mock.Mock)
+        self.assertTrue(dataset.profile is profile)
+        self.assertTrue(profile.build_time >= 0)
+        self.assertTrue(utils.build_dataset(None, dict) == {})
+
+    def test_enabled_by_environment(self):
+        with mock.patch.dict(os.environ, {utils.PROFILE_ENV_VAR: "1"}):
+            self.assertTrue(utils.profiling_enabled())
+            self.assertFalse(utils.profiling_enabled(False))
+        with mock.patch.dict(os.environ, {utils.PROFILE_ENV_VAR: "0"}):
+            self.assertFalse(utils.profiling_enabled())
+            self.assertEqual(utils.new_profile(), None)
+
+
+class TestJSONDecoder(unittest.TestCase):
+
+    def test_default_decoder_takes_text_and_bytes(self):
+        loads = utils.get_json_decoder()
+        self.assertEqual(loads(u'{"a": [1.5]}'), {"a": [1.5]})
+        self.assertEqual(loads(b'{"a": [1.5]}'), {"a": [1.5]})
+
+    def test_decoder_by_module_name(self):
+        self.assertEqual(utils.get_json_decoder("json"), json.loads)
+
+    def test_decoder_function(self):
+        loads = lambda s: "decoded"
+        self.assertEqual(utils.get_json_decoder(loads), loads)
+
+    def test_missing_decoder_raises(self):
+        self.assertRaises(ImportError, utils.get_json_decoder,
+            "no_such_json_module")
+
+
+class TestCountryCodes(unittest.TestCase):
+
+    def test_iso_codes(self):
+        self.assertEqual(utils.convert_country_code("gb", "alpha3"), "GBR")
+        self.assertEqual(utils.convert_country_code("GBR", "alpha2"), "GB")
+        self.assertEqual(utils.convert_country_code("GB", "alpha2"), "GB")
+
+    def test_non_standard_codes(self):
+        self.assertEqual(utils.convert_country_code("1W", "alpha3"), "WLD")
+        self.assertEqual(utils.convert_country_code("wld", "alpha2"), "1W")
+        self.assertEqual(utils.convert_country_code("KSV", "alpha2"), "KV")
+
+    def test_unknown_codes_are_returned(self):
+        self.assertEqual(utils.convert_country_code("xyz", "alpha2"), "XYZ")
+
+    def test_convert_country_codes(self):
+        self.assertEqual(utils.convert_country_codes(["GB", "arg", "1W"],
+            "alpha3"), ["GBR", "ARG", "WLD"])
+
+    def test_country_name(self):
+        self.assertEqual(utils.country_name("AR"), "Argentina")
+        self.assertEqual(utils.country_name("ARG"), "Argentina")
+        self.assertEqual(utils.country_name("WLD"), "World")
+        self.assertRaises(KeyError, utils.country_name, "XYZ")
+
+
+class TestLazyImports(unittest.TestCase):
+
+    def run_python(self, code):
+        package_dir = os.path.dirname(os.path.dirname(os.path.abspath(
+            utils.__file__)))
+        env = dict(os.environ, PYTHONPATH=package_dir)
+        return subprocess.call([sys.executable, "-c", code], env=env)
+
+    def test_slow_modules_are_not_imported(self):
+        code = ("import sys, wbpy; wbpy.IndicatorAPI; wbpy.ClimateAPI; "
+            "sys.exit(any(name in sys.modules for name in "
+            "['pycountry', 'urllib2', 'urllib.request']))")
+        self.assertEqual(self.run_python(code), 0)
+
+    def test_submodules_are_imported_on_use(self):
+        code = ("import sys, wbpy; "
+            "assert 'wbpy.indicators' not in sys.modules; "
+            "assert 'wbpy.climate' not in sys.modules; "
+            "wbpy.IndicatorAPI; "
+            "assert 'wbpy.indicators' in sys.modules; "
+            "assert 'wbpy.climate' not in sys.modules; "
+            "assert wbpy.ModelledDataset.__name__ == 'ModelledDataset'; "
+            "assert 'ClimateAPI' in dir(wbpy)")
+        self.assertEqual(self.run_python(code), 0)
+
+    def test_unknown_attribute(self):
+        code = ("import wbpy\n"
+            "try:\n    wbpy.NotAClass\n"
+            "except AttributeError:\n    pass\n"
+            "else:\n    raise SystemExit(1)")
+        self.assertEqual(self.run_python(code), 0)
+
+    def test_star_import(self):
+        code = "from wbpy import *; IndicatorAPI; ModelledDataset"
+        self.assertEqual(self.run_python(code), 0)
+
+    def test_region_codes_are_loaded_on_use(self):
+        regions = utils.LazyJSONMapping(utils.NON_STANDARD_REGIONS.path)
+        self.assertEqual(regions._data, None)
+        self.assertEqual(regions["1W"]["id"], "WLD")
+
+
+class TestWorldBankDates(unittest.TestCase):
+
+    def test_formats(self):
+        self.assertEqual(utils.worldbank_date_to_datetime("2010"),
+            datetime.date(2010, 1, 1))
+        self.assertEqual(utils.worldbank_date_to_datetime("2010Q3"),
+            datetime.date(2010, 7, 1))
+        self.assertEqual(utils.worldbank_date_to_datetime("2010M05"),
+            datetime.date(2010, 5, 1))
+
+    def test_dates_are_parsed_once(self):
+        parsed = utils.worldbank_date_to_datetime("1999M12")
+        self.assertTrue(utils.worldbank_date_to_datetime("1999M12") is parsed)
+
+    def test_batch(self):
+        dates = utils.worldbank_dates_to_datetimes(["2010", "2011", "2010"])
+        self.assertEqual(dates, [datetime.date(2010, 1, 1),
+            datetime.date(2011, 1, 1), datetime.date(2010, 1, 1)])
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_batch_datetime64(self):
+        dates = utils.worldbank_dates_to_datetimes(["2010Q2", "2011"],
+            datetime64=True)
+        self.assertEqual(str(dates.dtype), "datetime64[D]")
+        self.assertEqual([str(d) for d in dates], ["2010-04-01",
+            "2011-01-01"])
+
+
+class TestChunkCodes(unittest.TestCase):
+
+    def setUp(self):
+        self.codes = ["C%03d" % i for i in range(200)]
+
+    def test_chunks_cover_sorted_unique_codes(self):
+        chunks = utils.chunk_codes(self.codes[::-1] + self.codes[:10], 20)
+        self.assertEqual(sum(chunks, []), self.codes)
+        self.assertTrue(all(len(chunk) <= 20 for chunk in chunks))
+
+    def test_removing_a_code_only_changes_its_chunk(self):
+        chunks = utils.chunk_codes(self.codes, 20)
+        fewer = utils.chunk_codes(self.codes[:50] + self.codes[51:], 20)
+        changed = [chunk for chunk in fewer if chunk not in chunks]
+        self.assertTrue(len(changed) <= 2)
+
+
+class TestParallelMap(unittest.TestCase):
+
+    def test_results_are_in_order(self):
+        items = list(range(20))
+        results = utils.parallel_map(lambda x: x * 2, items, max_workers=4)
+        self.assertEqual(results, [x * 2 for x in items])
+
+    def test_exceptions_are_raised(self):
+        def fn(x):
+            if x == 3:
+                raise ValueError(x)
+            return x
+        self.assertRaises(ValueError, utils.parallel_map, fn, range(5), 4)
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_calls_are_spaced_out(self):
+        limiter = utils.RateLimiter(20)
+        start = time.time()
+        utils.parallel_map(lambda x: limiter.wait(), range(6), 3)
+        # The first call doesn't wait.
+        self.assertTrue(time.time() - start >= 5 / 20.0 - 0.01)
@@ -1,85 +1,354 @@
 # -*- coding: utf-8 -*-
 import os
 import tempfile
-import urllib2
 import time
 import logging
 import datetime
 import hashlib
 import json
 import sys
+import csv
+import threading
 
-import pycountry  # For ISO 1366 code conversions
+try:
+    from collections.abc import Mapping
+except ImportError:
+    # py2 and py3 < 3.3
+    from collections import Mapping
 
 logger = logging.getLogger(__name__)
 
 EXC_MSG = "The URL %s returned a bad response: %s"
 
+
+class LazyJSONMapping(Mapping):
+
+    """A read-only dictionary that is loaded from a JSON file the first time
+    that it's used.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            with open(self.path) as f:
+                self._data = json.load(f)
+        return self._data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return repr(self.data)
+
+
 # The Indicators API (but not Climate API) uses a few non-ISO 2-digit and
 # 3-digit codes, for either regions or groups of regions. Make them accessible
 # so that they can be converted, and users can see them.
 #
 # The file contains the results of IndicatorAPI.get_countries(), with all the
-# ISO countries excluded.
+# ISO countries excluded. It's only read when it's first used.
 path = os.path.join(os.path.dirname(os.path.realpath(__file__)),
     "non_ISO_region_codes.json")
-NON_STANDARD_REGIONS = json.loads(open(path).read())
+NON_STANDARD_REGIONS = LazyJSONMapping(path)
+
+
+# The number of seconds that cached responses are kept for.
+CACHE_TTL = 86400
 
+# fetch() records whether each response came from the cache here, for
+# CallProfile. Each thread has its own value.
+_fetch_state = threading.local()
 
-def fetch(url, check_cache=True, cache_response=True):
-    """Return response from a URL, and cache results for one day."""
-    # Use system tempfile for cache path.
+# Set this environment variable (to anything but "" or "0") to profile every
+# API call. See CallProfile.
+PROFILE_ENV_VAR = "WBPY_PROFILE"
+
+
+def get_cache_dir():
+    """Return the cache directory, in the system temp directory, creating it
+    if needed.
+    """
     cache_dir = os.path.join(tempfile.gettempdir(), "wbpy")
     if not os.path.exists(cache_dir):
-        os.makedirs(cache_dir)
-        logger.debug("Created cache directory " + cache_dir)
+        try:
+            os.makedirs(cache_dir)
+            logger.debug("Created cache directory " + cache_dir)
+        except OSError:
+            # Another thread may have created it first.
+            if not os.path.isdir(cache_dir):
+                raise
+    return cache_dir
 
-    logger.debug("Fetching url: %s ...", url)
 
-    # Python3 hashlib requires bytestring
-    url_hash = hashlib.md5(url.encode("utf-8")).hexdigest()
-    cache_path = os.path.join(cache_dir, url_hash)
+def fetch(url, check_cache=True, cache_response=True, decode=True):
+    """Return response from a URL, and cache results for one day.
+
+    :param decode:
+        If False, return the response bytes without decoding them to text.
+        Most JSON decoders can parse the bytes directly, which is faster.
+
+    """
+    logger.debug("Fetching url: %s ...", url)
+    cache_path = _cache_path(url)
 
     # If the cache file is < one day old, return cache, else get new response.
     if check_cache:
         if os.path.exists(cache_path):
             logger.debug("URL found in cache...")
-            secs_in_day = 86400
-            if int(time.time()) - os.path.getmtime(cache_path) < secs_in_day:
+            if int(time.time()) - os.path.getmtime(cache_path) < CACHE_TTL:
                 logger.debug("Retrieving response from cache.")
-                response = open(cache_path, "rb").read().decode("utf-8")
-                return response
+                _fetch_state.cache = "hit"
+                response = open(cache_path, "rb").read()
+                return response.decode("utf-8") if decode else response
             else:
                 logger.debug("Cache file has expired, removing...")
                 os.remove(cache_path)
         else:
             logger.debug("URL not found in cache....")
 
+    # urllib2 is slow to import, and isn't needed for cached responses.
+    import urllib2
+    _fetch_state.cache = "miss"
     logger.debug("Getting web response...")
     response = urllib2.urlopen(url).read()
 
-    # py3 returns bytestring
-    if sys.version_info >= (3,):
-        response = response.decode("utf-8")
-
     logger.debug("Response received.")
     if cache_response:
         logger.debug("Caching response... ")
         _cache_response(response, url, cache_path)
+
+    # py3 returns bytestring
+    if decode and sys.version_info >= (3,):
+        response = response.decode("utf-8")
     return response
 
 
+def fetch_bytes(url, check_cache=True, cache_response=True):
+    """As ``fetch()``, but return the undecoded response bytes."""
+    return fetch(url, check_cache, cache_response, decode=False)
+
+
+def is_cached(url):
+    """Return True if ``fetch()`` would return the URL's response from the
+    cache.
+    """
+    cache_path = _cache_path(url)
+    return (os.path.exists(cache_path) and
+        int(time.time()) - os.path.getmtime(cache_path) < CACHE_TTL)
+
+
+def _cache_path(url):
+    # Python3 hashlib requires bytestring
+    url_hash = hashlib.md5(url.encode("utf-8")).hexdigest()
+    return os.path.join(get_cache_dir(), url_hash)
+
+
 def _cache_response(response, url, cache_path):
+    if not isinstance(response, bytes):
+        response = response.encode("utf-8")
     fd, tempname = tempfile.mkstemp()
-    f = os.fdopen(fd, "w")
+    f = os.fdopen(fd, "wb")
     f.write(response)
     f.close()
     os.rename(tempname, cache_path)
     logger.debug("New url saved to cache: %s" % url)
 
 
+def profiling_enabled(profile=None):
+    """Return ``profile`` if it's True or False. If it's None, return True
+    if the ``WBPY_PROFILE`` environment variable is set.
+    """
+    if profile is not None:
+        return profile
+    return os.environ.get(PROFILE_ENV_VAR, "") not in ["", "0"]
+
+
+class CallProfile(object):
+
+    """A record of where the time went in one API call, eg. one
+    ``get_dataset()``. Datasets from profiled calls have one as
+    ``dataset.profile``; see ``profiling_enabled()``.
+
+    ``requests`` has a dictionary for each URL, in the order that the
+    responses arrived, with the keys:
+    ``url``
+    ``cache`` - "hit" or "miss" for ``utils.fetch``, or None for other fetch
+    functions
+    ``bytes`` - the size of the response
+    ``fetch_time`` - seconds in the fetch function, which is mostly network
+    time for a cache miss
+    ``parse_time`` - seconds decoding the JSON
+
+    ``build_time`` is the seconds spent building the dataset. Times are from
+    ``time.time()``, and requests made at the same time overlap.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.build_time = 0.0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return ("<%s: %d requests (%d cached), %d bytes, network %.3fs, "
+            "cache %.3fs, parse %.3fs, build %.3fs>" % (
+            self.__class__.__name__, len(self.requests),
+            len(self._requests("hit")), self.bytes, self.network_time,
+            self.cache_time, self.parse_time, self.build_time))
+
+    def get_json(self, url, fetch, loads):
+        """Request a URL with ``fetch``, decode it with ``loads``, and
+        record the request.
+        """
+        _fetch_state.cache = None
+        start = time.time()
+        response = fetch(url)
+        fetched = time.time()
+        json_resp = loads(response)
+        record = dict(url=url, cache=_fetch_state.cache, bytes=len(response),
+            fetch_time=fetched - start, parse_time=time.time() - fetched)
+        with self._lock:
+            self.requests.append(record)
+        return json_resp
+
+    def build(self, cls, *args, **kwargs):
+        """Return ``cls(*args, **kwargs)``, adding the time taken to
+        ``build_time``, and set its ``profile``.
+        """
+        start = time.time()
+        result = cls(*args, **kwargs)
+        self.build_time += time.time() - start
+        result.profile = self
+        return result
+
+    @property
+    def bytes(self):
+        return sum(r["bytes"] for r in self.requests)
+
+    @property
+    def network_time(self):
+        """Total fetch time of the requests that weren't cache hits."""
+        return sum(r["fetch_time"] for r in self.requests if
+            r["cache"] != "hit")
+
+    @property
+    def cache_time(self):
+        """Total fetch time of the cache hits."""
+        return sum(r["fetch_time"] for r in self._requests("hit"))
+
+    @property
+    def parse_time(self):
+        return sum(r["parse_time"] for r in self.requests)
+
+    def as_dict(self):
+        """Return the totals and the request records as a dictionary."""
+        return dict(requests=list(self.requests), bytes=self.bytes,
+            network_time=self.network_time, cache_time=self.cache_time,
+            parse_time=self.parse_time, build_time=self.build_time)
+
+    def _requests(self, cache):
+        return [r for r in self.requests if r["cache"] == cache]
+
+
+def build_dataset(profile, cls, *args, **kwargs):
+    """Return ``cls(*args, **kwargs)``, timed by ``profile`` if it's a
+    CallProfile rather than None.
+    """
+    if profile is None:
+        return cls(*args, **kwargs)
+    return profile.build(cls, *args, **kwargs)
+
+
+def new_profile(profile=None):
+    """Return a new CallProfile if profiling is enabled (see
+    ``profiling_enabled()``), else None.
+    """
+    return CallProfile() if profiling_enabled(profile) else None
+
+
+# JSON decoders that get_json_decoder() looks for, fastest first. Others,
+# eg. simplejson or ujson, can be chosen by name. See the "json" benchmark in
+# tests/benchmarks.py.
+JSON_DECODERS = ["orjson", "json"]
+
+_default_json_decoder = None
+
+
+def get_json_decoder(decoder=None):
+    """Return a function that decodes JSON from either text or bytes.
+
+    This is used by both IndicatorAPI and ClimateAPI, and by the datasets.
+
+    :param decoder:
+        The name of a module with a ``loads()`` function, eg. ``orjson`` or
+        ``ujson``, or a function that decodes a JSON string. If None, the
+        first installed module from ``JSON_DECODERS`` is used.
+
+    """
+    global _default_json_decoder
+    if callable(decoder):
+        return decoder
+    if decoder is not None:
+        return import_optional(decoder).loads
+
+    if _default_json_decoder is None:
+        for name in JSON_DECODERS:
+            try:
+                __import__(name)
+            except ImportError:
+                continue
+            _default_json_decoder = sys.modules[name].loads
+            logger.debug("Using %s to decode JSON.", name)
+            break
+    return _default_json_decoder
+
+
+# Country code lookup tables, built on first use. See _get_country_tables().
+_country_tables = None
+
+
+def _get_country_tables():
+    """Return a dictionary of lookup tables for the ISO 1366 countries and the
+    World Bank's non-standard regions. The ``alpha2`` and ``alpha3`` tables
+    map every known alpha-2 and alpha-3 code to that type of code, and the
+    ``name`` table maps alpha-2 codes to names.
+    """
+    global _country_tables
+    if _country_tables is None:
+        # pycountry is slow to import, so it's only imported when needed.
+        import pycountry
+        codes = []
+        for country in pycountry.countries:
+            # pycountry renamed the attributes in version 16.
+            alpha2 = getattr(country, "alpha2", None) or country.alpha_2
+            alpha3 = getattr(country, "alpha3", None) or country.alpha_3
+            codes.append((alpha2, alpha3, country.name))
+        for alpha2, vals in NON_STANDARD_REGIONS.items():
+            codes.append((alpha2, vals["id"], vals["name"]))
+
+        tables = {"alpha2": {}, "alpha3": {}, "name": {}}
+        for alpha2, alpha3, name in codes:
+            # ISO codes take precedence over the non-standard codes.
+            for code in [alpha2, alpha3]:
+                tables["alpha2"].setdefault(code, alpha2)
+                tables["alpha3"].setdefault(code, alpha3)
+            tables["name"].setdefault(alpha2, name)
+        _country_tables = tables
+    return _country_tables
+
+
 def convert_country_code(code, return_alpha):
-    """Convert ISO code into either alpha-2 or alpha-3.
+    """Convert ISO code into either alpha-2 or alpha-3. The World Bank's
+    non-standard region codes are also converted.
 
     :param code:
         The code to convert. If it isn't a valid ISO code, it gets returned as
@@ -89,39 +358,217 @@ def convert_country_code(code, return_alpha):
         "alpha2" or "alpha3".
 
     """
+    code = code.upper()
+    return _get_country_tables()[return_alpha].get(code, code)
+
+
+def convert_country_codes(codes, return_alpha):
+    """Convert a list of codes, as with ``convert_country_code()``."""
+    table = _get_country_tables()[return_alpha]
+    return [table.get(code.upper(), code.upper()) for code in codes]
+
+
+def country_name(code):
+    """Return the name of a country or region, from an alpha-2 or alpha-3
+    code. Raises KeyError if the code is unknown.
+    """
+    tables = _get_country_tables()
+    return tables["name"][tables["alpha2"][code.upper()]]
+
+
+def chunk_codes(codes, max_size):
+    """Split a list of codes into sorted, de-duplicated chunks of up to
+    ``max_size`` codes.
+
+    Each chunk ends after a code whose hash hits a fixed target, rather than
+    at a fixed position, so a chunk only changes if one of its own codes is
+    added or removed. Overlapping sets of codes therefore share most of their
+    chunks, and their requests can be answered from the cache.
+    """
+    target = max(max_size // 2, 1)
+    chunks, chunk = [], []
+    for code in sorted(set(codes)):
+        chunk.append(code)
+        code_hash = int(hashlib.md5(code.encode("utf-8")).hexdigest(), 16)
+        if code_hash % target == 0 or len(chunk) >= max_size:
+            chunks.append(chunk)
+            chunk = []
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def parallel_map(fn, items, max_workers=1):
+    """Return ``[fn(item) for item in items]``, calling ``fn`` from up to
+    ``max_workers`` threads. Results are in the same order as the items, and
+    the first exception raised by ``fn`` is re-raised.
+
+    Threads suit wbpy because the work is mostly waiting on HTTP requests.
+    """
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+
+    # multiprocessing is slow to import, and often isn't needed.
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(min(max_workers, len(items)))
     try:
-        # Try to get code from ISO 1366 standard
-        code = code.upper()
-        if len(code) == 2:
-            country = pycountry.countries.get(alpha2=code)
-        elif len(code) == 3:
-            country = pycountry.countries.get(alpha3=code)
-        else:
-            raise ValueError("`code` is not a valid alpha-2 or alpha-3 code")
-        return getattr(country, return_alpha)
+        return pool.map(fn, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+class RateLimiter(object):
+
+    """Spaces out calls to ``wait()``, from any number of threads, so that
+    there are at most ``max_rate`` a second.
+    """
+
+    def __init__(self, max_rate):
+        self.interval = 1.0 / max_rate
+        self._next = 0.0
+        self._lock = threading.Lock()
 
-    except (KeyError, ValueError):
-        # Try the world bank non-standard codes
-        if return_alpha == "alpha2" and code in NON_STANDARD_REGIONS:
-            return NON_STANDARD_REGIONS[code]["id"]
+    def wait(self):
+        """Sleep until the next call is allowed."""
+        with self._lock:
+            now = time.time()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
 
-        elif return_alpha == "alpha3":
-            for alpha2, vals in NON_STANDARD_REGIONS.items():
-                if vals["id"] == code:
-                    return alpha2
 
-        # No match found
-        return code
+def write_csv(fileobj, rows, header=None):
+    """Write rows to an open file as CSV, one row at a time.
+
+    :param fileobj:
+        A file-like object opened for writing.
+
+    :param rows:
+        Iterable of row tuples. It is consumed lazily, so a generator is never
+        held in memory. None values are written as empty cells.
+
+    :param header:
+        Optional tuple of column names, written before the rows.
+
+    """
+    writer = csv.writer(fileobj)
+    if header:
+        writer.writerow(header)
+    writer.writerows(rows)
+
+
+def import_optional(module_name):
+    """Import and return an optional dependency, eg. ``pandas``.
+
+    Optional dependencies are only imported when a method that needs them is
+    called, so they don't slow down ``import wbpy`` or become requirements.
+
+    """
+    try:
+        __import__(module_name)
+    except ImportError:
+        raise ImportError("This feature requires %s, which is not installed."
+            % module_name.split(".")[0])
+    return sys.modules[module_name]
+
+
+# Parsed World Bank dates, by date string. A dataset only uses a few distinct
+# dates, so each is only parsed once. See worldbank_date_to_datetime().
+_parsed_dates = {}
 
 
 def worldbank_date_to_datetime(date):
     """Convert given world bank date string to datetime.date object."""
+    try:
+        return _parsed_dates[date]
+    except KeyError:
+        pass
+
     if "Q" in date:
         year, quarter = date.split("Q")
-        return datetime.date(int(year), (int(quarter) * 3) - 2, 1)
-
-    if "M" in date:
+        parsed = datetime.date(int(year), (int(quarter) * 3) - 2, 1)
+    elif "M" in date:
         year, month = date.split("M")
-        return datetime.date(int(year), int(month), 1)
+        parsed = datetime.date(int(year), int(month), 1)
+    else:
+        parsed = datetime.date(int(date), 1, 1)
+    _parsed_dates[date] = parsed
+    return parsed
+
 
-    return datetime.date(int(date), 1, 1)
+def worldbank_dates_to_datetimes(dates, datetime64=False):
+    """Convert a sequence of World Bank date strings, eg. a dataset's date
+    column, in one pass. Each distinct string is only parsed once.
+
+    :param datetime64:
+        If True, return a numpy ``datetime64[D]`` array rather than a list of
+        datetime.date objects. Requires numpy.
+
+    """
+    parsed = {}
+    for date in set(dates):
+        parsed[date] = worldbank_date_to_datetime(date)
+    converted = [parsed[date] for date in dates]
+    if datetime64:
+        np = import_optional("numpy")
+        return np.array(converted, dtype="datetime64[D]")
+    return converted
+
+
+def datetime_index_level(index, level):
+    """Convert the World Bank date strings in one level of a pandas
+    MultiIndex into datetime64 values. Only the unique values are parsed.
+    """
+    pd = import_optional("pandas")
+    position = list(index.names).index(level)
+    dates = worldbank_dates_to_datetimes([str(d) for d in
+        index.levels[position]], datetime64=True)
+    return index.set_levels(pd.to_datetime(dates), level=level)
+
+
+def write_columns(path, columns, file_format="parquet", metadata=None):
+    """Write columns of data to a parquet or feather file, using pyarrow.
+
+    :param path:
+        Destination file path.
+
+    :param columns:
+        List of ``(name, type, values)`` tuples, where type is ``string``,
+        ``float64`` or ``int64``. String columns are dictionary-encoded, as
+        they mostly repeat a few codes and names.
+
+    :param file_format:
+        Either ``parquet`` or ``feather``.
+
+    :param metadata:
+        Optional dict of strings, stored in the file's schema metadata.
+
+    """
+    pa = import_optional("pyarrow")
+    names, arrays = [], []
+    for name, type_alias, values in columns:
+        array = pa.array(values, type=pa.type_for_alias(type_alias))
+        if type_alias == "string":
+            array = array.dictionary_encode()
+        names.append(name)
+        arrays.append(array)
+    table = pa.Table.from_arrays(arrays, names=names)
+    if metadata:
+        table = table.replace_schema_metadata(metadata)
+
+    if file_format == "parquet":
+        parquet = import_optional("pyarrow.parquet")
+        parquet.write_table(table, path)
+    elif file_format == "feather":
+        feather = import_optional("pyarrow.feather")
+        version = tuple(int(x) for x in pa.__version__.split(".")[:2])
+        if version < (0, 17):
+            # Older versions of pyarrow only write DataFrames to feather.
+            feather.write_feather(table.to_pandas(), path)
+        else:
+            feather.write_feather(table, path)
+    else:
+        raise ValueError("Unknown file format: %s" % file_format)